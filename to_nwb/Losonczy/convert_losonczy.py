@@ -13,6 +13,7 @@ from hdmf.backends.hdf5 import H5DataIO
 
 from to_nwb.neuroscope import get_channel_groups
 from to_nwb.Losonczy.lfp_helpers import loadEEG
+from to_nwb.imaging import AxisView, split_channels
 
 
 NA = 'THIS REQUIRED ATTRIBUTE INTENTIONALLY LEFT BLANK.'
@@ -74,20 +75,22 @@ optical_channel = OpticalChannel(
 
 imaging_h5_filepath = os.path.join(fpath, 'TSeries-05042017-001_Cycle00001_Element00001.h5')
 
-with h5py.File(imaging_h5_filepath, 'r') as f:
-    if SHORTEN:
-        all_imaging_data = f['imaging'][:100, ...]
-    else:
-        all_imaging_data = f['imaging'][:]
-    channel_names = f['imaging'].attrs['channel_names']
-    elem_size_um = f['imaging'].attrs['element_size_um']
+# the imaging file stays open until the NWB file is written, so that each
+# channel is streamed from it instead of being loaded
+f = h5py.File(imaging_h5_filepath, 'r')
+imaging = f['imaging']
+channel_names = imaging.attrs['channel_names']
+elem_size_um = imaging.attrs['element_size_um']
 
-# t,z,y,x,c -> t,x,y,z,c
-all_imaging_data = np.swapaxes(all_imaging_data, 1, 3)
-
-# t,x,y,z,c -> c,t,(x,y,z)
-all_imaging_data = np.rollaxis(all_imaging_data, 4)
-nx, ny, nz = all_imaging_data.shape[-3:]
+# t,z,y,x,c -> c,t,(x,y,z)
+if SHORTEN:
+    all_imaging_data = [H5DataIO(AxisView(imaging, order=(0, 3, 2, 1), fixed={4: c})[:100],
+                                 compression='gzip')
+                        for c in range(len(channel_names))]
+else:
+    all_imaging_data = split_channels(imaging, channel_axis=4, order=(0, 3, 2, 1),
+                                      compression='gzip')
+nx, ny, nz = imaging.shape[3], imaging.shape[2], imaging.shape[1]
 
 manifold = np.meshgrid(np.arange(nx)*elem_size_um[2],
                        np.arange(ny)*elem_size_um[0],
@@ -109,7 +112,7 @@ imaging_plane = nwbfile.create_imaging_plane(
 for channel_name, imaging_data in zip(channel_names, all_imaging_data):
     image_series = TwoPhotonSeries(name='TwoPhotonSeries' + channel_name.decode(),
                                    dimension=[2],
-                                   data=H5DataIO(imaging_data, compression='gzip'),
+                                   data=imaging_data,
                                    imaging_plane=imaging_plane,
                                    starting_frame=[0], timestamps=[1, 2, 3],
                                    scan_line_rate=np.nan,
@@ -124,6 +127,7 @@ else:
 print('writing NWB file...', end='', flush=True)
 with NWBHDF5IO(out_fname, mode='w') as io:
     io.write(nwbfile)
+f.close()
 print('done.')
 
 print('testing read...', end='', flush=True)
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""Detect imaging frame pulses in a sync channel and align other data to them.
+
+The detectors take the sync channel one block at a time and carry just
+enough samples between blocks to give the same answer as a single pass over
+the whole recording, so memory does not grow with recording length. Local
+maxima are picked with running max filters instead of a per-sample loop,
+and edge and peak positions can be refined to sub-sample precision.
+"""
+import numpy as np
+from scipy.ndimage import maximum_filter1d
+
+
+def rising_edges(signal, threshold, subsample=True):
+    """Positions where `signal` crosses `threshold` upwards.
+
+    Parameters
+    ----------
+    signal: np.ndarray
+    threshold: float
+    subsample: bool, optional
+        If True (default), return the linearly interpolated crossing
+        position, e.g. 3.25 for a crossing a quarter of the way from sample
+        3 to sample 4. If False, return the index of the first sample at or
+        above threshold.
+
+    Returns
+    -------
+    np.ndarray
+
+    """
+    signal = np.asarray(signal, dtype=float)
+    before = np.flatnonzero((signal[:-1] < threshold) & (signal[1:] >= threshold))
+    if not subsample:
+        return before + 1
+    lo, hi = signal[before], signal[before + 1]
+    return before + (threshold - lo) / (hi - lo)
+
+
+class EdgeDetector(object):
+    """Streaming version of `rising_edges`.
+
+    Parameters
+    ----------
+    threshold: float
+    subsample: bool, optional
+        Default is True
+
+    """
+
+    def __init__(self, threshold, subsample=True):
+        self.threshold = threshold
+        self.subsample = subsample
+        self._last = None
+        self._offset = 0
+
+    def process(self, block):
+        """Positions of the crossings in `block`, counted from the start of the stream."""
+        block = np.asarray(block, dtype=float)
+        if not block.size:
+            return np.empty(0)
+        if self._last is None:
+            signal, start = block, self._offset
+        else:
+            signal, start = np.concatenate(([self._last], block)), self._offset - 1
+        self._last = block[-1]
+        self._offset += len(block)
+
+        return start + rising_edges(signal, self.threshold, self.subsample)
+
+
+class PulseDetector(object):
+    """Find frame pulses as local maxima of the absolute derivative of a sync channel.
+
+    A point is a pulse if it is the largest value within `min_interval`
+    samples on either side, ties going to the first. This avoids an
+    arbitrary threshold that misses small pulses or keeps two nearby time
+    points of the same pulse. Indices refer to the derivative, i.e. index i
+    is the step from sample i to sample i + 1, as in `find_frame_times`.
+
+    Parameters
+    ----------
+    min_interval: int, optional
+        Minimum radius around local maxima to enforce, default 40
+    threshold: float, optional
+        smallest derivative that counts as a pulse. Default is None (any).
+    subsample: bool, optional
+        refine each pulse with a parabola through its neighbours. Default is
+        False.
+
+    """
+
+    def __init__(self, min_interval=40, threshold=None, subsample=False):
+        self.m = int(min_interval)
+        self.threshold = threshold
+        self.subsample = subsample
+        self._last = None
+        # m samples of left context (-inf before the start) followed by the
+        # derivative samples that still need right context
+        self._ctx = np.full(self.m, -np.inf)
+        self._ctx_start = 0  # derivative index of self._ctx[self.m]
+
+    def _decide(self, ctx, stop):
+        # pulses among ctx[m:stop], which have full context in ctx
+        m = self.m
+        if stop <= m:
+            return np.empty(0, dtype=int)
+        centered = maximum_filter1d(ctx, 2 * m + 1, mode='constant', cval=-np.inf)
+        trailing = maximum_filter1d(ctx, m, mode='constant', cval=-np.inf) if m else None
+
+        p = np.arange(m, stop)
+        values = ctx[p]
+        is_peak = values == centered[p]
+        if m:
+            is_peak &= values > trailing[p - m + m // 2]
+        if self.threshold is not None:
+            is_peak &= values > self.threshold
+        peaks = p[is_peak]
+
+        # the first and last derivative samples are never pulses, as in argrelextrema
+        right = ctx[np.minimum(peaks + 1, len(ctx) - 1)]
+        peaks = peaks[(peaks + self._ctx_start - m > 0) & np.isfinite(right)]
+        if not self.subsample:
+            return peaks + self._ctx_start - m
+
+        left, mid, right = ctx[peaks - 1], ctx[peaks], ctx[peaks + 1]
+        left = np.where(np.isfinite(left), left, mid)
+        denom = left - 2 * mid + right
+        shift = np.divide(0.5 * (left - right), denom, out=np.zeros(len(peaks)), where=denom != 0)
+        return peaks + self._ctx_start - m + shift
+
+    def process(self, block):
+        """Pulses that can be decided after adding `block` of the sync channel.
+
+        Returns
+        -------
+        np.ndarray
+            int, or float if `subsample`
+
+        """
+        block = np.asarray(block, dtype=float)
+        if not block.size:
+            return np.empty(0, dtype=float if self.subsample else int)
+        signal = block if self._last is None else np.concatenate(([self._last], block))
+        self._last = block[-1]
+        ctx = np.concatenate((self._ctx, np.abs(np.diff(signal))))
+
+        stop = len(ctx) - self.m
+        peaks = self._decide(ctx, stop)
+        if stop > self.m:
+            self._ctx = ctx[stop - self.m:]
+            self._ctx_start += stop - self.m
+        else:
+            self._ctx = ctx
+        return peaks
+
+    def flush(self):
+        """Pulses among the last `min_interval` samples of the stream."""
+        ctx = np.concatenate((self._ctx, np.full(self.m + 1, -np.inf)))
+        peaks = self._decide(ctx, len(self._ctx))
+        self._ctx = np.full(self.m, -np.inf)
+        return peaks
+
+
+def detect_frame_pulses(blocks, min_interval=40, every_n=1, threshold=None, subsample=False):
+    """Frame pulses of a sync channel given as an iterable of blocks.
+
+    Parameters
+    ----------
+    blocks: iterable(np.ndarray)
+        consecutive pieces of the sync channel
+    min_interval: int, optional
+        see `PulseDetector`
+    every_n: int, optional
+        Return every nth frame time, useful for multiplane data, default 1
+    threshold: float, optional
+        see `PulseDetector`
+    subsample: bool, optional
+        see `PulseDetector`
+
+    Returns
+    -------
+    np.ndarray
+
+    """
+    detector = PulseDetector(min_interval, threshold=threshold, subsample=subsample)
+    pulses = [detector.process(block) for block in blocks]
+    pulses.append(detector.flush())
+    return np.concatenate(pulses)[::every_n]
+
+
+class FrameOnsetDetector(object):
+    """Find the first imaging frame pulse in a stream of multichannel blocks.
+
+    The first frame is the first sample of the sync channel that is at least
+    half of `minAmplitude` above the lowest value before it. Only the running
+    minimum and a sample count are carried between blocks, so each sample is
+    looked at once and memory does not depend on how long it takes imaging
+    to start. Samples before the first frame are dropped; if no frame pulse
+    is ever found, `onset` stays None and everything was dropped, so callers
+    that want the unclipped data have to read the stream again.
+
+    Attributes
+    ----------
+    onset: int | None
+        index of the first frame in the stream, in samples
+    """
+
+    def __init__(self, minAmplitude):
+        self.minAmplitude = minAmplitude
+        self.onset = None
+        self._lo = np.inf
+        self._offset = 0
+
+    @property
+    def found(self):
+        return self.onset is not None
+
+    def process(self, block, syncIdx=-1):
+        """Return the part of `block` at or after the first frame pulse."""
+        if self.found:
+            return block
+
+        sync = np.asarray(block[syncIdx], dtype=float)
+        lo = np.minimum.accumulate(np.concatenate(([self._lo], sync)))[1:]
+        rising = np.flatnonzero(sync - lo >= self.minAmplitude / 2.)
+        if not len(rising):
+            if len(lo):
+                self._lo = lo[-1]
+            self._offset += len(sync)
+            return block[:, :0]
+
+        self.onset = self._offset + rising[0]
+        return block[:, rising[0]:]
+
+
+def closest_idx(array, values):
+    """For each value, the index of the closest element of sorted `array`.
+
+    Parameters
+    ----------
+    array: array-like
+        sorted, e.g. frame times
+    values: array-like
+
+    Returns
+    -------
+    np.ndarray(dtype=int)
+
+    """
+    array = np.asarray(array)
+    values = np.asarray(values)
+
+    idxs = np.searchsorted(array, values, side='left')
+    prev = array[np.maximum(idxs - 1, 0)]
+    nxt = array[np.minimum(idxs, len(array) - 1)]
+    prev_is_closer = (idxs == len(array)) | (np.fabs(values - prev) < np.fabs(values - nxt))
+    return np.where(prev_is_closer & (idxs > 0), idxs - 1, idxs)
+
+
+def frame_index(frame_times, times):
+    """Index of the frame each time falls in, -1 before the first frame.
+
+    Parameters
+    ----------
+    frame_times: array-like
+        sorted start time of each frame
+    times: array-like
+        e.g. behavior or LFP sample times, in the same units
+
+    Returns
+    -------
+    np.ndarray(dtype=int)
+
+    """
+    return np.searchsorted(frame_times, times, side='right') - 1
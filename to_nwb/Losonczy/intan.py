@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""Read Intan .rhd files in blocks without loading the whole recording.
+
+The header is parsed with Intan's own `read_header`. The data section is a
+sequence of fixed-size data blocks, so it is memory-mapped with a structured
+dtype and converted a few thousand samples at a time.
+"""
+import os
+import warnings
+
+import numpy as np
+from scipy.signal import lfilter, lfiltic
+
+try:
+    from rhd import load_intan_rhd_format
+except ImportError:
+    warnings.warn("rhd package not found, to_nwb.Losonczy.intan will not work")
+
+
+def read_rhd_header(rhd_path):
+    """Read the header of an .rhd file.
+
+    Parameters
+    ----------
+    rhd_path: str
+
+    Returns
+    -------
+    dict
+        Intan header, with the byte offset of the first data block added
+        as 'data_offset'
+
+    """
+    with open(rhd_path, 'rb') as fid:
+        header = load_intan_rhd_format.read_header(fid)
+        header['data_offset'] = fid.tell()
+
+    return header
+
+
+def rhd_block_dtype(header):
+    """Structured dtype of one .rhd data block.
+
+    Parameters
+    ----------
+    header: dict
+
+    Returns
+    -------
+    np.dtype
+
+    """
+    n = header['num_samples_per_data_block']
+    version = (header['version']['major'], header['version']['minor'])
+    fields = [('timestamps', '<i4' if version >= (1, 2) else '<u4', (n,))]
+
+    counts = [('amplifier_data', header['num_amplifier_channels'], n),
+              ('aux_input_data', header['num_aux_input_channels'], n // 4),
+              ('supply_voltage_data', header['num_supply_voltage_channels'], 1),
+              ('temp_sensor_data', header['num_temp_sensor_channels'], 1),
+              ('board_adc_data', header['num_board_adc_channels'], n)]
+    for name, n_channels, n_samples in counts:
+        if n_channels:
+            fields.append((name, '<u2', (n_channels, n_samples)))
+
+    if header['num_board_dig_in_channels']:
+        fields.append(('board_dig_in_raw', '<u2', (n,)))
+    if header['num_board_dig_out_channels']:
+        fields.append(('board_dig_out_raw', '<u2', (n,)))
+
+    return np.dtype(fields)
+
+
+def _adc_to_volts(raw, eval_board_mode):
+    if eval_board_mode == 1:
+        return 152.59e-6 * (raw - 32768.)
+    elif eval_board_mode == 13:
+        return 312.5e-6 * (raw - 32768.)
+    return 50.354e-6 * raw
+
+
+def _channels_first(raw):
+    # (n_blocks, n_channels, n_samples) -> (n_channels, n_blocks * n_samples)
+    return np.moveaxis(raw, 1, 0).reshape(raw.shape[1], -1)
+
+
+def iter_rhd_blocks(rhd_path, samples_per_block=2 ** 16, header=None):
+    """Iterate over the amplifier and board ADC data of an .rhd file.
+
+    Parameters
+    ----------
+    rhd_path: str
+    samples_per_block: int, optional
+        approximate number of samples per yielded block, rounded down to a
+        whole number of Intan data blocks
+    header: dict, optional
+        output of `read_rhd_header`, read from the file if not given
+
+    Yields
+    ------
+    dict
+        amplifier_data: np.array(n_amplifier_channels, n_samples) in uV
+        board_adc_data: np.array(n_board_adc_channels, n_samples) in V
+        t: np.array(n_samples) timestamps in samples
+
+    """
+    if header is None:
+        header = read_rhd_header(rhd_path)
+    dtype = rhd_block_dtype(header)
+    n_blocks = (os.path.getsize(rhd_path) - header['data_offset']) // dtype.itemsize
+    if not n_blocks:
+        return
+
+    data = np.memmap(rhd_path, dtype=dtype, mode='r',
+                     offset=header['data_offset'], shape=(n_blocks,))
+    step = max(1, samples_per_block // header['num_samples_per_data_block'])
+    names = dtype.names
+
+    for start in range(0, n_blocks, step):
+        blocks = data[start:start + step]
+        out = {'t': blocks['timestamps'].ravel()}
+        if 'amplifier_data' in names:
+            out['amplifier_data'] = 0.195 * (_channels_first(blocks['amplifier_data']) - 32768.)
+        else:
+            out['amplifier_data'] = np.empty((0, out['t'].size))
+        if 'board_adc_data' in names:
+            out['board_adc_data'] = _adc_to_volts(_channels_first(blocks['board_adc_data']),
+                                                  header['eval_board_mode'])
+        else:
+            out['board_adc_data'] = np.empty((0, out['t'].size))
+        yield out
+
+
+class NotchFilter(object):
+    """Intan's software notch filter, run over consecutive blocks.
+
+    Gives the same output as the `notch_filter` that Intan's `read_data`
+    applies to the whole recording: a second order IIR notch whose first
+    two output samples are copies of the input. The filter state is carried
+    from one block to the next.
+
+    Parameters
+    ----------
+    sample_rate: float
+        Hz
+    notch_frequency: float
+        Hz, usually header['notch_filter_frequency']
+    bandwidth: float, optional
+        Hz. Default is 10, as in `read_data`.
+
+    """
+
+    def __init__(self, sample_rate, notch_frequency, bandwidth=10.):
+        tstep = 1. / sample_rate
+        d = np.exp(-2. * np.pi * (bandwidth / 2.) * tstep)
+        cos = np.cos(2. * np.pi * notch_frequency * tstep)
+        gain = (1. + d * d) / 2.
+        self.b = gain * np.array([1., -2. * cos, 1.])
+        self.a = np.array([1., -(1. + d * d) * cos, d * d])
+        self._zi = None
+
+    def process(self, block):
+        """Filter a block of shape (n_channels, n_samples)."""
+        if self._zi is not None:
+            return self._filter(block)
+        # the first two samples pass through and set the initial state
+        if block.shape[1] < 2:
+            raise ValueError('the first block must have at least 2 samples')
+        self._zi = np.array([lfiltic(self.b, self.a, y=chan[1::-1], x=chan[1::-1])
+                             for chan in block[:, :2]]).reshape(len(block), 2)
+        return np.concatenate((block[:, :2], self._filter(block[:, 2:])), axis=1)
+
+    def _filter(self, block):
+        # lfilter returns a scrambled state for empty input
+        if not block.shape[1]:
+            return np.array(block, dtype=float)
+        out, self._zi = lfilter(self.b, self.a, block, axis=1, zi=self._zi)
+        return out
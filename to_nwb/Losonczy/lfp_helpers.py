@@ -1,55 +1,54 @@
 # -*- coding: utf-8 -*-
 
 import numpy as np
-from scipy.stats import zscore
-from scipy.signal import argrelextrema
 
 import xml.etree.ElementTree as ET
 import os
-from shutil import copyfile
-import re
 import warnings
+from shutil import copyfile
 
-try:
-    from rhd import load_intan_rhd_format
-except ImportError:
-    warnings.warn("rhd package not found, lab.misc.lfp_helpers.py will not work")
-
-
-def loadEVT(filepath, evt):
-
-    f = open(filepath, 'rb')
-    data = f.read()
-
-    if evt == 'noise':
-        delims = ['start', 'end']
-    elif evt == 'ripple':
-        delims = ['tstart', 'tpeak', 'tend']
+from to_nwb.evt import read_evt_layout, write_evt_layout
 
-    n_evt_types = len(delims)
+from .decimation import boxcar_decimate, Decimator
+from .intan import NotchFilter, read_rhd_header, iter_rhd_blocks
+from .imaging_sync import FrameOnsetDetector, detect_frame_pulses
+# closest_idx used to be defined here, keep importing it from lfp_helpers working
+from .imaging_sync import closest_idx  # noqa: F401
 
-    regex = '\\' + '\\n|\\'.join(delims) + '\\n'
 
-    linearized = re.split(regex, data)[:-1]
-    linearized = [float(x) for x in linearized]
+def loadEVT(filepath, evt):
+    """Read a ripple or noise .evt file.
 
-    evt_lists = [linearized[i::n_evt_types] for i in xrange(n_evt_types)]
+    Parameters
+    ----------
+    filepath: str
+    evt: str
+        'ripple' or 'noise'
 
-    return {d: evt_list for d, evt_list in zip(delims, evt_lists)}
+    Returns
+    -------
+    dict
+        ripple: {'tstart', 'tpeak', 'tend'}, noise: {'start', 'end'}, each
+        an array of times in ms
+    """
+    events = read_evt_layout(filepath, evt)
+    if evt == 'ripple':
+        return {'t' + name: times for name, times in events.items()}
+    return events
 
 
 def writeEVT(filepath, evt_list, evt_names):
     # evt_list is a list of lists, each list containing each time, in ms, of an event
     # e.g., tstart, tpeak, tend
+    write_evt_layout(filepath, evt_list, evt_names, mode='a')
 
-    format_str = ' {:0.1f}\t{}\n' * len(evt_names)
-    for evt in evt_list:
-        interleaved_list = [x for t in zip(evt, evt_names) for x in t]
 
-        write_str = ''.join(format_str.format(*interleaved_list))
-
-        with open(filepath, 'a') as f:
-            f.write(write_str)
+def _readEEGLayout(eegBaseName):
+    # (nChannels, samplingRate) from the Neuroscope .xml next to the .eeg
+    eegRoot = ET.parse(eegBaseName + '.xml').getroot()
+    nChan = int(eegRoot.findall('.//nChannels')[0].text)
+    sampFreq = float(eegRoot.findall('.//samplingRate')[0].text)
+    return nChan, sampFreq
 
 
 def loadEEG(eegBaseName, channels=None):
@@ -74,14 +73,7 @@ def loadEEG(eegBaseName, channels=None):
 
     """
 
-    eegTree = ET.parse(eegBaseName + '.xml')
-    eegRoot = eegTree.getroot()
-
-    nChanElem = eegRoot.findall('.//nChannels')
-    nChan = int(nChanElem[0].text)
-
-    sampFreqElem = eegRoot.findall('.//samplingRate')
-    sampFreq = float(sampFreqElem[0].text)
+    nChan, sampFreq = _readEEGLayout(eegBaseName)
 
     EEG = np.fromfile(eegBaseName + '.eeg', dtype=np.int16)
     EEG = np.reshape(EEG, (-1, nChan))
@@ -100,22 +92,81 @@ def loadEEG(eegBaseName, channels=None):
     return eegObj
 
 
+def _writeEEGBlock(fileObj, arrayIn):
+    # (nChan, nSamples) float -> interleaved int16, rounded in a single pass
+    arrayOut = np.empty(arrayIn.shape[::-1], dtype='int16')
+    np.rint(arrayIn.T, out=arrayOut, casting='unsafe')
+    arrayOut.tofile(fileObj)
+
+
 def SaveBinary1(arrayIn, fileName):
 
     # voltageRange = 20
     # scalingConstant = (2**15) / 10
     scalingConstant = 1
-    arrayOut = arrayIn * scalingConstant
-    arrayOut = arrayOut.round()
-    arrayOut = arrayOut.transpose()
-    arrayOut = arrayOut.ravel()
-    arrayOut = arrayOut.astype('int16')
+    if scalingConstant != 1:
+        arrayIn = arrayIn * scalingConstant
 
     with open(fileName, 'wb') as f:
-        f.write(arrayOut)
+        _writeEEGBlock(f, arrayIn)
+
+
+def _decimateRHD(rhdFullPath, header, downRatio, blockSamples, method, n_jobs,
+                 sigConstant, adcConstant):
+    # decimated (nChan, nSamples) blocks of amplifier then board ADC channels
+    nChan = header['num_amplifier_channels'] + header['num_board_adc_channels']
+    decimator = Decimator(downRatio, nChan, method=method, n_jobs=n_jobs)
+    notch = None
+    if header['notch_filter_frequency']:
+        notch = NotchFilter(header['frequency_parameters']['amplifier_sample_rate'],
+                            header['notch_filter_frequency'])
+
+    for block in iter_rhd_blocks(rhdFullPath, blockSamples, header=header):
+        if notch is not None:
+            block['amplifier_data'] = notch.process(block['amplifier_data'])
+        block['amplifier_data'] *= sigConstant
+        block['board_adc_data'] *= adcConstant
+        yield decimator.process(
+            np.concatenate((block['amplifier_data'], block['board_adc_data'])))
+    yield decimator.flush()
+
+
+def ConvertFromRHD(rhdFullPath, destDir=None, method='mean', n_jobs=1,
+                   blockSamples=2 ** 18, minPulseAmplitude=500.):
+    """Convert an Intan .rhd file to a Neuroscope .eeg file at 1250 Hz.
+
+    The .rhd file is read, decimated and written in blocks, so memory use
+    does not grow with recording length. If the header asks for a notch
+    filter, it is applied to the amplifier channels as Intan's `read_data`
+    does, with the filter state carried between blocks.
+
+    The output starts at the first imaging frame pulse on the last board
+    ADC channel, after decimation: the first sample that is at least
+    `minPulseAmplitude / 2` above the lowest value of the sync channel
+    before it. This replaces the first sample whose step was more than 2
+    standard deviations of all steps of the recording (zscore of the
+    derivative), which needed the whole recording in memory. The two
+    usually agree, but can differ by a sample on an edge spread over two
+    output samples, and `minPulseAmplitude` has to match the range of the
+    sync channel. Nothing before the first frame is kept in memory; if the
+    sync channel has no frame pulse, a warning is issued and the .rhd file
+    is read a second time to write the whole recording unclipped.
 
-
-def ConvertFromRHD(rhdFullPath, destDir=None):
+    Parameters
+    ----------
+    rhdFullPath: str
+    destDir: str, optional
+        Default is the directory of the .rhd file
+    method: str, optional
+        decimation method, see `decimation.Decimator`. Default is 'mean'
+    n_jobs: int, optional
+        number of threads used for decimation. Default is 1
+    blockSamples: int, optional
+        number of input samples read per block
+    minPulseAmplitude: float, optional
+        smallest pulse height of the frame sync channel, in output units
+        (mV), that counts as a frame pulse. Default is 500.
+    """
 
     xmlBase = '/analysis/LFP_utils/LFPToIntanBase1.xml'
 
@@ -133,64 +184,55 @@ def ConvertFromRHD(rhdFullPath, destDir=None):
             os.mkdir(destDir)
         destPath = os.path.join(destDir, rhdBaseName + '.eeg')
 
-    result = load_intan_rhd_format.read_data(rhdFullPath)
+    header = read_rhd_header(rhdFullPath)
 
-    rhdSigFS = result['frequency_parameters']['amplifier_sample_rate']
-    rhdADCFS = result['frequency_parameters']['board_adc_sample_rate']
-    # rhdSigNSamples = len(result['amplifier_data'][0])
+    rhdSigFS = header['frequency_parameters']['amplifier_sample_rate']
+    rhdADCFS = header['frequency_parameters']['board_adc_sample_rate']
     outFS = 1250
-    # sigNewNSamples = int(np.round(rhdSigNSamples*(outFS/rhdSigFS)))
     sigDownRatio = int(np.round(rhdSigFS / outFS))
     adcDownRatio = int(np.round(rhdADCFS / outFS))
+    if sigDownRatio != adcDownRatio:
+        raise ValueError('amplifier and board ADC sample rates differ ({} vs {})'.format(
+            rhdSigFS, rhdADCFS))
     sigConstant = 1.
     adcConstant = 1000.
 
-    eegOut = []
-    for chan in result['amplifier_data']:
-        eegOut.append(sigConstant * fastDownSample(chan, sigDownRatio))
-
-    for adcChan in result['board_adc_data']:
-        eegOut.append(adcConstant * fastDownSample(adcChan, adcDownRatio))
-
-    eegOut = np.array(eegOut)
-
     # Use pulses to find frame times, clip off beginning of LFP to effectively
-    # sync LFP and imaging, and then save frame times
-    frame_times = np.where(zscore(np.diff(eegOut[-1, :])) > 2)[0] + 1
-    eegOut = eegOut[:, frame_times[0]:]
-
-
-    # with open(os.path.join(destDir, 'frame_times.pkl'), 'wb') as fp:
-    #     pkl.dump(frame_times, fp)
+    # sync LFP and imaging
+    onset = FrameOnsetDetector(minPulseAmplitude)
+
+    with open(destPath, 'wb') as f:
+        for eegOut in _decimateRHD(rhdFullPath, header, sigDownRatio, blockSamples,
+                                   method, n_jobs, sigConstant, adcConstant):
+            _writeEEGBlock(f, onset.process(eegOut))
+
+        if not onset.found:
+            warnings.warn('no frame pulses found in sync channel, LFP is not clipped')
+            f.seek(0)
+            f.truncate()
+            for eegOut in _decimateRHD(rhdFullPath, header, sigDownRatio, blockSamples,
+                                       method, n_jobs, sigConstant, adcConstant):
+                _writeEEGBlock(f, eegOut)
 
     # Write empty ripple evt file (effectively a 'touch')
     # evtName = destPath.replace('.eeg', '.rip.evt')
     # with open(evtName, 'a'):
     #     os.utime(evtName, None)
 
-    # This is a 'better' way to the downsampling but is unexceptably slow
-    # (for some reason - not the case in Matlab)
-    # import signal from scipy
-    # eegOut = []
-    # from scipy import signal
-    # for chan in result['amplifier_data']:
-    #      eegOut.append(signal.resample(chan, sigNewNSamples))
-
-    # for adcChan in result['board_adc_data']:
-    #     eegOut.append(signal.resample(adcChan, sigNewNSamples))
-
-    # eegOut = np.array(eegOut)
-
     # copyfile(xmlBase, destPath.replace('.eeg', '.xml'))
-    SaveBinary1(eegOut, destPath)
 
 
-def find_frame_times(eegFile, signal_idx=-1, min_interval=40, every_n=1):
+def find_frame_times(eegFile, signal_idx=-1, min_interval=40, every_n=1,
+                     block_samples=2 ** 22, subsample=False):
     """Find imaging frame times in LFP data using the pockels blanking signal.
     Due to inconsistencies in the fame signal, we look for local maxima. This
     avoids an arbitrary threshold that misses small spikes or includes two
     nearby time points that are part of the same frame pulse.
 
+    The sync channel is read from a memory map of the .eeg file in blocks of
+    `block_samples`, so only one block is in memory at a time. Of several
+    equal maxima within `min_interval`, the first is taken.
+
     Parameters
     ----------
     eegFile : str
@@ -205,42 +247,25 @@ def find_frame_times(eegFile, signal_idx=-1, min_interval=40, every_n=1):
     every_n : int
         Return every nth frame time, useful for multiplane data, default 1
 
+    block_samples : int
+        Number of samples read per block, default 2 ** 22
+
+    subsample : bool
+        Refine frame times to a fraction of a sample, default False
+
     Returns
     -------
     frame times : array, shape (n_frame_times, )
     """
-    pc_signal = loadEEG(eegFile.replace('.eeg', ''))['EEG'][signal_idx, :]
-
-    # break ties for local maxima by increasing first point by 1
-    same_idx = np.where(np.diff(pc_signal) == 0)[0]
-    pc_signal[same_idx] += 1
-    pc_signal = np.abs(np.diff(pc_signal))
-
-    frame_times = argrelextrema(pc_signal, np.greater, order=min_interval)[0]
-    return frame_times[::every_n]
-
-
-def closest_idx(array, values):
-    # for each value in values return index of element
-    # in array that is closest to that value
-
-    # make sure array is a numpy array
-    array = np.array(array)
-
-    # get insert positions
-    idxs = np.searchsorted(array, values, side="left")
-
-    # find indexes where previous index is closer
-    prev_idx_is_less = ((idxs == len(array))|(np.fabs(values - array[np.maximum(idxs-1, 0)]) < np.fabs(values - array[np.minimum(idxs, len(array)-1)])))
-    idxs[prev_idx_is_less] -= 1
+    nChan, _ = _readEEGLayout(eegFile.replace('.eeg', ''))
+    eeg = np.memmap(eegFile, dtype=np.int16, mode='r').reshape(-1, nChan)
+    pc_signal = eeg[:, signal_idx]
 
-    return idxs
+    blocks = (pc_signal[start:start + block_samples]
+              for start in range(0, len(pc_signal), block_samples))
+    return detect_frame_pulses(blocks, min_interval, every_n=every_n, subsample=subsample)
 
 
 def fastDownSample(chanIn, downRatio):
-    padN = downRatio - np.mod(len(chanIn), downRatio)
-    padN = np.mod(padN, downRatio)
-    chanIn = np.concatenate((chanIn, np.tile(np.nan, (padN))))
-    chanOut = chanIn.reshape(-1, downRatio)
-    chanOut = np.nanmean(chanOut, 1)
-    return chanOut
+    # mean of each window of downRatio samples; the last window may be partial
+    return boxcar_decimate(chanIn, downRatio)
@@ -7,12 +7,10 @@ import sys
 from dateutil.parser import parse
 from pytz import timezone
 
-from tqdm import tqdm
-
 from glob import glob
 
-from hdmf.data_utils import DataChunkIterator
 from hdmf.backends.hdf5.h5_utils import H5DataIO
+from hdmf.common import DynamicTable, VectorData
 
 import h5py
 import numpy as np
@@ -23,37 +21,98 @@ from pynwb.ophys import OpticalChannel, TwoPhotonSeries, Fluorescence, DfOverF,
 
 
 from to_nwb.neuroscope import get_channel_groups
+from to_nwb.utils import build_units_table, ragged_index, check_module
+from to_nwb.imaging import (imaging_data, sparse_voxel_mask, sparse_roi_masks,
+                            build_plane_segmentation)
 
 # Losonczy Imports
 from lab.misc import lfp_helpers as lfph
 from lab.misc.auto_helpers import get_element_size_um, get_prairieview_version
 from lab.classes.dbclasses import dbExperiment
 
-from .sima_helper import get_motion_correction
+from .sima_helper import get_motion_corrections
 
 
 def add_motion_correction(nwbfile, expt):
-    data = get_motion_correction(expt)
-    cis = CorrectedImageStack(
-        corrected=np.zeros((1, 1, 1)),
-        xy_translation=data)
-    imaging_mod = nwbfile.create_processing_module('imaging', 'imaging processing')
-    imaging_mod.add_container(cis)
+    # one CorrectedImageStack per channel; displacements are cached by sima_helper
+    imaging_mod = check_module(nwbfile, 'imaging', 'imaging processing')
+    for channel, xy_translation in enumerate(get_motion_corrections(expt, name='xy_translation')):
+        cis = CorrectedImageStack(
+            name='CorrectedImageStack_{}'.format(channel),
+            corrected=np.zeros((1, 1, 1)),
+            xy_translation=xy_translation)
+        imaging_mod.add_container(cis)
+
+
+def _concat_transient_field(transients, field):
+    arrays = [np.asarray(data[field], dtype=float).ravel() for data in transients]
+    return np.concatenate(arrays) if arrays else np.empty(0)
+
+
+def add_transients(nwbfile, expt, trials=None):
+    """Add the transients of every ROI and trial as one unit per (ROI, trial).
 
+    The transients of all ROIs and trials are concatenated and the Units
+    table is written column by column. The noise level (sigma) of each ROI
+    goes once per ROI into a 'transient_noise' table of the 'ophys'
+    module, one value per trial only if it differs between trials.
+
+    Parameters
+    ----------
+    nwbfile: pynwb.NWBFile
+    expt: dbExperiment
+    trials: list(int), optional
+        Default is all trials
+
+    Raises
+    ------
+    ValueError
+        if nwbfile already has a Units table
+
+    """
+    if nwbfile.units is not None:
+        raise ValueError('nwbfile already has a Units table, add_transients would replace it')
 
-def add_transients(nwbfile, expt):
     trans = expt.transientsData()
-    trial_num = 0
-    nwbfile.add_unit_column('intervals', description='start and end of transient in seconds', index=True)
-    nwbfile.add_unit_column('sigma', description='standard deviation of noise for this ROI')
-    for roi in trans:
-        data = roi[trial_num]
-        intervals = np.vstack((data['start_indices'], data['start_indices'])).T * expt.frame_period()
-        nwbfile.add_unit(
-            spike_times=data['max_amplitudes'],
-            intervals=intervals,
-            sigma=float(data['sigma'])
-        )
+    frame_period = expt.frame_period()
+    if trials is None:
+        trials = range(len(trans[0])) if len(trans) else []
+
+    rois, trial_nums, transients = [], [], []
+    for roi_num, roi in enumerate(trans):
+        for trial_num in trials:
+            rois.append(roi_num)
+            trial_nums.append(trial_num)
+            transients.append(roi[trial_num])
+
+    starts = _concat_transient_field(transients, 'start_indices')
+    ends = _concat_transient_field(transients, 'end_indices')
+    peaks = _concat_transient_field(transients, 'max_indices')
+    index = ragged_index([np.size(data['start_indices']) for data in transients])
+
+    columns = [
+        {'name': 'intervals', 'description': 'start and end of transient in seconds',
+         'data': np.column_stack((starts, ends)) * frame_period, 'index': index},
+        {'name': 'amplitudes', 'description': 'maximum amplitude of each transient',
+         'data': _concat_transient_field(transients, 'max_amplitudes'), 'index': index},
+        {'name': 'roi', 'description': 'index of the ROI', 'data': np.array(rois, dtype=int)},
+        {'name': 'trial', 'description': 'index of the trial', 'data': np.array(trial_nums, dtype=int)}]
+
+    nwbfile.units = build_units_table(peaks * frame_period, index, columns=columns,
+                                      description='calcium transients of each ROI and trial; '
+                                                  'spike_times are the times of the transient peaks')
+
+    sigma = np.array([float(data['sigma']) for data in transients],
+                     dtype=float).reshape(len(trans), len(trials))
+    if len(trials) and np.all(sigma == sigma[:, :1]):
+        sigma = sigma[:, 0]
+    noise = DynamicTable(
+        name='transient_noise', description='noise of each ROI used to detect its transients',
+        id=np.arange(len(trans)),
+        columns=[VectorData(name='sigma', data=sigma,
+                            description='standard deviation of the noise of the ROI, '
+                                        'per trial if it differs between trials')])
+    check_module(nwbfile, 'ophys', 'Data relevant to imaging').add(noise)
 
 
 def get_position(region):
@@ -160,19 +219,13 @@ def add_imaging(nwbfile, expt, z_spacing=25., device_name='2P Microscope', locat
         unit='um')
 
     f = h5py.File(h5_path, 'r')
-    imaging_data = f['imaging']
+    imaging = f['imaging']
     channel_names = f['imaging'].attrs['channel_names']
 
     for c, channel_name in enumerate(channel_names):
         if not stub:
-            data_in = H5DataIO(
-                DataChunkIterator(
-                    tqdm(
-                        (np.swapaxes(data[..., c], 0, 2) for data in imaging_data),
-                        total=imaging_data.shape[0]
-                    ), buffer_size=5000
-                ), compression='gzip'
-            )
+            # t,z,y,x,c -> t,x,y,z of channel c, copied in blocks of whole source chunks
+            data_in = imaging_data(imaging, order=(0, 3, 2, 1), fixed={4: c}, compression='gzip')
 
         else:
             data_in = np.ones((10, 10, 10))  # use for dev testing for speed
@@ -239,11 +292,8 @@ def add_behavior(nwbfile, expt):
 # ROI Utilities
 
 def get_pixel_mask(roi):
-
-    image_mask = get_image_mask(roi)
-    inds = zip(*np.where(image_mask))
-    out = [list(ind) + [1.] for ind in inds]
-    return out
+    """Voxel mask (x, y, z, weight) of a SIMA ROI, read from its sparse plane masks."""
+    return sparse_voxel_mask(roi.mask)
 
 
 def get_image_mask(roi):
@@ -254,12 +304,13 @@ def add_rois(nwbfile, module, expt):
 
     img_seg = ImageSegmentation()
     module.add_data_interface(img_seg)
-    ps = img_seg.create_plane_segmentation(name='Plane Segmentation', description='ROIs',
-                                           imaging_plane=nwbfile.get_imaging_plane('Imaging Data'))
 
-    rois = expt.rois()
-    for roi in rois:
-        ps.add_roi(image_mask=get_image_mask(roi))
+    # voxel masks of all ROIs straight from SIMA's sparse masks, no dense volumes
+    mask_data, mask_index = sparse_roi_masks([roi.mask for roi in expt.rois()])
+    ps = build_plane_segmentation(mask_data, mask_index,
+                                  imaging_plane=nwbfile.get_imaging_plane('Imaging Data'),
+                                  name='Plane Segmentation', description='ROIs')
+    img_seg.add_plane_segmentation(ps)
 
     return ps
 
@@ -1,22 +1,114 @@
 import os
 import pickle
+import warnings
 import sima
 
 import numpy as np
 
 from pynwb import TimeSeries
 
+from to_nwb.data_iterators import ArrayBlockIterator
 
-def get_motion_correction(expt, channel):
-    fpath = os.path.join(expt.sima_path(), 'sequences.pkl')
 
-    with open(fpath, 'rb') as f:
-        aa = pickle.load(f)
+# {(sequences.pkl path, mtime): displacements}
+_DISPLACEMENT_CACHE = {}
 
-    obj = aa[0]
 
+def _find_displacements(sequences):
+    obj = sequences[0]
     while True:
         if 'displacements' in obj:
-            data = np.swapaxes(obj['displacements'][..., channel], 1, 2)
-            return TimeSeries(name='motion_correction', data=data, unit='pixels', rate=1 / expt.frame_period())
+            return np.asarray(obj['displacements'])
         obj = obj['base']
+
+
+def load_displacements(sima_path, cache=True):
+    """Motion-correction displacements of all channels of a SIMA dataset.
+
+    sequences.pkl is unpickled only when it is newer than its cache: the
+    displacements are saved next to it as displacements.npy and
+    memory-mapped on later calls, and kept in memory for the rest of the
+    session.
+
+    Parameters
+    ----------
+    sima_path: str
+        .sima directory
+    cache: bool, optional
+        Default is True
+
+    Returns
+    -------
+    np.ndarray
+        displacements as stored by SIMA, channels on the last axis
+
+    """
+    fpath = os.path.join(sima_path, 'sequences.pkl')
+    if not cache:
+        with open(fpath, 'rb') as f:
+            return _find_displacements(pickle.load(f))
+
+    key = (fpath, os.path.getmtime(fpath))
+    if key in _DISPLACEMENT_CACHE:
+        return _DISPLACEMENT_CACHE[key]
+
+    npy_path = os.path.join(sima_path, 'displacements.npy')
+    if os.path.isfile(npy_path) and os.path.getmtime(npy_path) >= key[1]:
+        displacements = np.load(npy_path, mmap_mode='r')
+    else:
+        with open(fpath, 'rb') as f:
+            displacements = _find_displacements(pickle.load(f))
+        try:
+            np.save(npy_path, displacements)
+            displacements = np.load(npy_path, mmap_mode='r')
+        except OSError as e:
+            warnings.warn('could not cache displacements in {}: {}'.format(npy_path, e))
+
+    _DISPLACEMENT_CACHE[key] = displacements
+    return displacements
+
+
+def clear_displacement_cache():
+    """Forget displacements loaded in this session (the .npy files are kept)."""
+    _DISPLACEMENT_CACHE.clear()
+
+
+def get_motion_correction(expt, channel=0, name='motion_correction'):
+    """Motion correction of one channel as a TimeSeries.
+
+    The data are a lazy view of the cached displacements and are copied
+    block by block when the NWB file is written.
+
+    Parameters
+    ----------
+    expt: dbExperiment
+    channel: int, optional
+        Default is 0
+    name: str, optional
+
+    Returns
+    -------
+    pynwb.TimeSeries
+
+    """
+    displacements = load_displacements(expt.sima_path())
+    data = np.swapaxes(displacements[..., channel], 1, 2)
+    return TimeSeries(name=name, data=ArrayBlockIterator(data), unit='pixels',
+                      rate=1 / expt.frame_period())
+
+
+def get_motion_corrections(expt, name='motion_correction'):
+    """Motion correction of every channel.
+
+    Parameters
+    ----------
+    expt: dbExperiment
+    name: str, optional
+
+    Returns
+    -------
+    list(pynwb.TimeSeries)
+
+    """
+    n_channels = load_displacements(expt.sima_path()).shape[-1]
+    return [get_motion_correction(expt, channel, name) for channel in range(n_channels)]
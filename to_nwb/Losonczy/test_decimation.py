@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from scipy import signal
+
+from to_nwb.Losonczy.decimation import Decimator, boxcar_decimate, decimate
+
+
+@pytest.fixture
+def data():
+    return np.random.default_rng(0).normal(size=(5, 1003))
+
+
+def stream(data, factor, method, block_size, n_jobs=1):
+    dec = Decimator(factor, data.shape[0], method=method, n_jobs=n_jobs)
+    out = [dec.process(data[:, i:i + block_size]) for i in range(0, data.shape[-1], block_size)]
+    out.append(dec.flush())
+    return np.concatenate(out, axis=-1)
+
+
+def test_boxcar_averages_partial_window(data):
+    out = boxcar_decimate(data, 16)
+    assert out.shape == (5, 63)
+    np.testing.assert_allclose(out[:, :62], data[:, :992].reshape(5, 62, 16).mean(axis=-1))
+    np.testing.assert_allclose(out[:, -1], data[:, 992:].mean(axis=-1))
+
+
+@pytest.mark.parametrize('block_size', [1, 7, 16, 100, 5000])
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_mean_stream_matches_boxcar(data, block_size, n_jobs):
+    np.testing.assert_allclose(stream(data, 16, 'mean', block_size, n_jobs), boxcar_decimate(data, 16))
+
+
+@pytest.mark.parametrize('block_size', [3, 16, 250, 5000])
+def test_poly_matches_resample_poly(data, block_size):
+    expected = signal.resample_poly(data, 1, 16, axis=-1)
+    np.testing.assert_allclose(stream(data, 16, 'poly', block_size), expected, atol=1e-12)
+
+
+@pytest.mark.parametrize('block_size', [5, 160, 5000])
+def test_iir_matches_causal_decimate(data, block_size):
+    expected = signal.decimate(data, 8, ftype='iir', axis=-1, zero_phase=False)
+    np.testing.assert_allclose(stream(data, 8, 'iir', block_size, n_jobs=2), expected, atol=1e-12)
+
+
+def test_decimate_whole_array(data):
+    np.testing.assert_allclose(decimate(data, 8, method='iir'),
+                               signal.decimate(data, 8, ftype='iir', axis=-1))
+    np.testing.assert_allclose(decimate(data[0], 16), boxcar_decimate(data[0], 16))
+    np.testing.assert_allclose(decimate(data, 16, method='poly', block_size=100),
+                               signal.resample_poly(data, 1, 16, axis=-1), atol=1e-12)
+
+
+def test_factor_one_and_bad_method(data):
+    np.testing.assert_array_equal(stream(data, 1, 'poly', 100), data)
+    with pytest.raises(ValueError):
+        Decimator(4, 5, method='median')
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from scipy.signal import argrelextrema
+
+from to_nwb.Losonczy.imaging_sync import (EdgeDetector, FrameOnsetDetector, closest_idx,
+                                          detect_frame_pulses, rising_edges)
+
+
+def blocks_of(data, size):
+    return [data[..., i:i + size] for i in range(0, data.shape[-1], size)]
+
+
+@pytest.fixture
+def sync():
+    signal = np.zeros(5000)
+    for start in range(1234, 5000, 97):
+        signal[start:start + 30] = 1000.
+    return signal + np.random.default_rng(0).normal(0, 5, len(signal))
+
+
+@pytest.mark.parametrize('size', [1, 7, 500, 10 ** 6])
+def test_frame_onset_same_for_any_block_size(sync, size):
+    data = np.vstack((np.arange(len(sync)), sync))
+    detector = FrameOnsetDetector(500.)
+    out = np.concatenate([detector.process(block) for block in blocks_of(data, size)], axis=1)
+    assert detector.onset == 1234
+    np.testing.assert_array_equal(out, data[:, 1234:])
+
+
+def test_frame_onset_not_found_keeps_nothing(sync):
+    detector = FrameOnsetDetector(500.)
+    data = np.vstack((sync, np.zeros(len(sync))))
+    out = [detector.process(block) for block in blocks_of(data, 100)]
+    assert detector.onset is None and not detector.found
+    assert sum(block.shape[1] for block in out) == 0
+
+
+@pytest.mark.parametrize('size', [3, 500, 10 ** 6])
+def test_edges_same_for_any_block_size(sync, size):
+    expected = rising_edges(sync, 500.)
+    detector = EdgeDetector(500.)
+    found = np.concatenate([detector.process(block) for block in blocks_of(sync, size)])
+    np.testing.assert_allclose(found, expected)
+    np.testing.assert_array_equal(np.floor(expected) + 1, rising_edges(sync, 500., subsample=False))
+
+
+@pytest.mark.parametrize('size', [5, 333, 10 ** 6])
+def test_pulses_match_argrelextrema(sync, size):
+    derivative = np.abs(np.diff(sync))
+    expected = argrelextrema(derivative, np.greater_equal, order=40)[0]
+    found = detect_frame_pulses(blocks_of(sync, size), min_interval=40, threshold=100)
+    np.testing.assert_array_equal(found, expected[derivative[expected] > 100])
+
+
+def test_closest_idx():
+    frames = np.array([0., 1., 2., 4.])
+    np.testing.assert_array_equal(closest_idx(frames, [-1., .4, .6, 2.9, 3.1, 10.]), [0, 0, 1, 2, 3, 3])
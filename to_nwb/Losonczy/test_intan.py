@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from to_nwb.Losonczy.intan import NotchFilter, iter_rhd_blocks, rhd_block_dtype
+
+
+def intan_notch_filter(x, sample_rate, notch_frequency, bandwidth):
+    # per-sample loop of Intan's read_data
+    tstep = 1. / sample_rate
+    d = np.exp(-2. * np.pi * (bandwidth / 2.) * tstep)
+    b = (1. + d * d) * np.cos(2. * np.pi * notch_frequency * tstep)
+    a = (1. + d * d) / 2.
+    b1 = -2. * np.cos(2. * np.pi * notch_frequency * tstep)
+    out = np.zeros(len(x))
+    out[:2] = x[:2]
+    for i in range(2, len(x)):
+        out[i] = a * x[i - 2] + a * b1 * x[i - 1] + a * x[i] - d * d * out[i - 2] + b * out[i - 1]
+    return out
+
+
+@pytest.fixture
+def header():
+    return {'num_samples_per_data_block': 60, 'version': {'major': 1, 'minor': 3},
+            'num_amplifier_channels': 3, 'num_aux_input_channels': 0,
+            'num_supply_voltage_channels': 1, 'num_temp_sensor_channels': 0,
+            'num_board_adc_channels': 2, 'num_board_dig_in_channels': 1,
+            'num_board_dig_out_channels': 0, 'eval_board_mode': 0, 'data_offset': 16}
+
+
+@pytest.mark.parametrize('block_size', [2, 7, 1000, 10 ** 5])
+def test_notch_matches_intan(block_size):
+    data = np.random.default_rng(0).normal(size=(2, 3001))
+    notch = NotchFilter(20000., 60.)
+    out = np.concatenate([notch.process(data[:, i:i + block_size])
+                          for i in range(0, data.shape[1], block_size)], axis=1)
+    expected = [intan_notch_filter(chan, 20000., 60., 10.) for chan in data]
+    np.testing.assert_allclose(out, expected, atol=1e-10)
+
+
+def test_notch_first_block_too_short():
+    with pytest.raises(ValueError):
+        NotchFilter(20000., 60.).process(np.zeros((2, 1)))
+
+
+@pytest.mark.parametrize('samples_per_block', [1, 130, 10 ** 6])
+def test_iter_blocks_round_trip(tmp_path, header, samples_per_block):
+    rng = np.random.default_rng(1)
+    blocks = np.zeros(7, rhd_block_dtype(header))
+    blocks['timestamps'] = np.arange(7 * 60).reshape(7, 60)
+    blocks['amplifier_data'] = rng.integers(0, 2 ** 16, (7, 3, 60))
+    blocks['board_adc_data'] = rng.integers(0, 2 ** 16, (7, 2, 60))
+    path = tmp_path / 'x.rhd'
+    with open(path, 'wb') as f:
+        f.write(b'\0' * header['data_offset'])
+        blocks.tofile(f)
+
+    out = list(iter_rhd_blocks(str(path), samples_per_block, header=header))
+    assert len(out) == (7 if samples_per_block < 60 else -(-7 // (samples_per_block // 60)))
+    amp = np.concatenate([b['amplifier_data'] for b in out], axis=1)
+    adc = np.concatenate([b['board_adc_data'] for b in out], axis=1)
+    np.testing.assert_array_equal(np.concatenate([b['t'] for b in out]), np.arange(420))
+    np.testing.assert_allclose(amp, 0.195 * (np.hstack(blocks['amplifier_data']) - 32768.))
+    np.testing.assert_allclose(adc, 50.354e-6 * np.hstack(blocks['board_adc_data']))
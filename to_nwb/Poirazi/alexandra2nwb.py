@@ -1,19 +1,16 @@
 import os
 from datetime import datetime
 from glob import glob
-import re
 import matplotlib.pyplot as plt
 import numpy as np
 from dateutil.tz import tzlocal
 from pynwb import NWBFile, NWBHDF5IO
 from tqdm import tqdm
 from hdmf.backends.hdf5.h5_utils import H5DataIO
-from nwbext_simulation_output import CompartmentSeries, create_ragged_array
+from nwbext_simulation_output import CompartmentSeries
 
-
-def natural_key(text):
-    # Key used for natural ordering: orders files correctly even if numbers are not zero-padded
-    return [int(c) if c.isdigit() else c for c in re.split('(\d+)', text)]
+from to_nwb.utils import natural_key, RaggedArrayBuilder
+from to_nwb.Poirazi.text_ingest import text_column_blocks
 
 
 run_dir = '/Users/bendichter/Desktop/Poirazi/data/AlexandraDataSample/HIPP'
@@ -29,15 +26,14 @@ nwbfile = NWBFile(session_description=description,
                   session_start_time=session_start_time)
 nwbfile.add_unit_column('compartment_labels', 'cell compartment labels for each cell')
 
-mp_data = []
-all_compartments = []
+path_groups = []
+compartments = RaggedArrayBuilder()
 cell_paths = sorted(glob(os.path.join(run_dir, '*')), key=natural_key)
 for cell_path in cell_paths:
     cell_id = os.path.split(cell_path)[1]
     compartment_labels = []
-    all_compartments.append([])
     compartment_paths = sorted(glob(os.path.join(cell_path, '*.txt')), key=natural_key)
-    for i, txt_file in enumerate(tqdm(compartment_paths, desc='reading .txt files for ' + cell_id)):
+    for txt_file in compartment_paths:
         label_pieces = os.path.split(txt_file)[1].split('_')
         if label_pieces[0] == 'soma':
             compartment_label = 'soma'
@@ -45,14 +41,19 @@ for cell_path in cell_paths:
             compartment_label = label_pieces[1] + '_' + label_pieces[2]
         compartment_labels.append(compartment_label)
 
-        all_compartments[-1].append(i)
-        mp_data.append(np.loadtxt(txt_file))
+    compartments.append(range(len(compartment_paths)))
+    path_groups.append(compartment_paths)
     nwbfile.add_unit(compartment_labels=compartment_labels)
 
-mp_data = np.column_stack(mp_data)
+# the compartments of each cell are parsed while the NWB file is written, and
+# cached in the cell's directory so reruns skip the parsing
+mp_data = text_column_blocks(path_groups,
+                             cache_paths=[os.path.join(cell_path, 'membrane_potential.npy')
+                                          for cell_path in cell_paths],
+                             progress=lambda it, total: tqdm(it, total=total, desc='reading .txt files'))
 if COMPRESS:
     mp_data = H5DataIO(mp_data, compression='gzip')
-compartments, compartments_index = create_ragged_array(all_compartments)
+compartments, compartments_index = compartments.to_arrays(dtype=int)
 cs = CompartmentSeries('membrane_potential', mp_data, unit='mV', rate=np.nan, compartments=compartments,
                        compartments_index=compartments_index, unit_id=np.arange(len(cell_paths), dtype=int))
 nwbfile.add_acquisition(cs)
@@ -1,4 +1,3 @@
-import re
 from datetime import datetime
 from glob import glob
 
@@ -6,18 +5,12 @@ import numpy as np
 from pynwb import TimeSeries, NWBFile, NWBHDF5IO
 from tqdm import tqdm
 
-files = glob('/Users/bendichter/Desktop/Poirazi/data/Sample_Data/*.dat')
-
-
-def natural_keys(text):
-    return [int(text) if text.isdigit() else text for _ in re.split('(\d+)', text)]
+from to_nwb.utils import natural_key
+from to_nwb.Poirazi.text_ingest import read_text_columns
 
-
-files.sort(key=natural_keys)
-data = []
-for file in tqdm(files, desc='reading .dat files'):
-    data.append(np.loadtxt(file))
-data = np.column_stack(data)
+files = glob('/Users/bendichter/Desktop/Poirazi/data/Sample_Data/*.dat')
+files.sort(key=natural_key)
+data = read_text_columns(files, progress=lambda it, total: tqdm(it, total=total, desc='reading .dat files'))
 
 ts = TimeSeries('membrane_potential', data, unit='mV', rate=np.nan)
 nwbfile = NWBFile(session_description='description of session',
@@ -0,0 +1,94 @@
+"""Read Poirazi lab spike-time pickles into a columnar Units table.
+
+Each `spiketimes*` pickle holds one row per cell, `[cell_id, t1, t2, ...]`
+with times in ms, and the cell type is part of the file name. All rows of a
+file are flattened in one pass into spike, count and id arrays, and the
+Units table is built from those columns directly instead of one add_unit
+call per cell.
+"""
+import os
+import pickle
+from itertools import chain
+
+import numpy as np
+
+from to_nwb.data_iterators import ConcatenatedBlockIterator
+from to_nwb.utils import build_units_table, ragged_index
+
+
+def cell_type_from_path(spk_file):
+    """Cell type of a spike pickle, e.g. 'spiketimes_PN_0.pkl' -> 'PN'."""
+    return spk_file.split('_')[-2]
+
+
+def read_spike_pickle(spk_file):
+    """Flatten the rows of one spike pickle.
+
+    Parameters
+    ----------
+    spk_file: str
+
+    Returns
+    -------
+    spike_times: np.ndarray
+        spike times of all cells concatenated, in s
+    counts: np.ndarray
+        number of spikes of each cell
+    cell_ids: np.ndarray
+        id of each cell within its cell type
+
+    """
+    with open(spk_file, 'rb') as file:
+        data = pickle.load(file)
+
+    counts = np.fromiter((len(row) - 1 for row in data), dtype=np.int64, count=len(data))
+    cell_ids = np.fromiter((row[0] for row in data), dtype=np.int64, count=len(data))
+    spike_times = np.fromiter(chain.from_iterable(row[1:] for row in data), dtype=np.float64,
+                              count=int(counts.sum()))
+    spike_times /= 1000
+
+    return spike_times, counts, cell_ids
+
+
+def build_spike_units(spk_files, stream_dir=None):
+    """Build a Units table with `cell_type` and `cell_type_id` columns from spike pickles.
+
+    Parameters
+    ----------
+    spk_files: list(str)
+    stream_dir: str, optional
+        If given, the spikes of each pickle are saved there as .npy as soon
+        as the pickle is read, and the pickle is released before the next
+        one is loaded. The spike times are then streamed from those files
+        when the NWB file is written, so they are never all in memory.
+        The directory must exist until the NWB file has been written.
+
+    Returns
+    -------
+    pynwb.misc.Units
+
+    """
+    spikes, counts, cell_ids, cell_types = [], [], [], []
+    for spk_file in spk_files:
+        file_spikes, file_counts, file_ids = read_spike_pickle(spk_file)
+        if stream_dir is not None:
+            npy_file = os.path.join(stream_dir, os.path.splitext(os.path.split(spk_file)[1])[0] + '.npy')
+            np.save(npy_file, file_spikes)
+            del file_spikes
+            file_spikes = np.load(npy_file, mmap_mode='r')
+        spikes.append(file_spikes)
+        counts.append(file_counts)
+        cell_ids.append(file_ids)
+        cell_types.append(np.repeat(cell_type_from_path(spk_file), len(file_ids)))
+
+    if stream_dir is not None:
+        spike_times = ConcatenatedBlockIterator(spikes)
+    else:
+        spike_times = np.concatenate(spikes)
+
+    columns = [{'name': 'cell_type', 'description': 'cell type',
+                'data': np.concatenate(cell_types)},
+               {'name': 'cell_type_id', 'description': 'integer index within each cell type',
+                'data': np.concatenate(cell_ids)}]
+
+    return build_units_table(spike_times, ragged_index(np.concatenate(counts)), columns=columns)
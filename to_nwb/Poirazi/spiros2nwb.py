@@ -1,8 +1,6 @@
 import os
-import pickle
 from datetime import datetime
 from glob import glob
-import re
 import matplotlib.pyplot as plt
 import numpy as np
 from dateutil.tz import tzlocal
@@ -10,10 +8,9 @@ from pynwb import NWBFile, NWBHDF5IO, TimeSeries
 from tqdm import tqdm
 from hdmf.backends.hdf5.h5_utils import H5DataIO
 
-
-def natural_key(text):
-    # Key used for natural ordering: orders files correctly even if numbers are not zero-padded
-    return [int(c) if c.isdigit() else c for c in re.split('(\d+)', text)]
+from to_nwb.utils import natural_key
+from to_nwb.Poirazi.text_ingest import read_text_columns
+from to_nwb.Poirazi.spike_ingest import build_spike_units
 
 
 run_dir = '/Users/bendichter/Desktop/Poirazi/data/DATA_Ben'
@@ -28,17 +25,13 @@ COMPRESS = True
 nwbfile = NWBFile(session_description=description,
                   identifier=identifier,
                   session_start_time=session_start_time)
-nwbfile.add_unit_column('cell_type', 'cell type')
-nwbfile.add_unit_column('cell_type_id', 'integer index within each cell type')
 
 
 # convert continuous data (1 compartment per cell)
 
-mp_data = []
-for dat_file in tqdm(sorted(glob(os.path.join(run_dir, '*dat')), key=natural_key),
-                     desc='reading .dat files'):
-        mp_data.append(np.loadtxt(dat_file))
-mp_data = np.column_stack(mp_data)
+mp_data = read_text_columns(sorted(glob(os.path.join(run_dir, '*dat')), key=natural_key),
+                            cache_path=run_dir + '_membrane_potential.npy',
+                            progress=lambda it, total: tqdm(it, total=total, desc='reading .dat files'))
 if COMPRESS:
     mp_data = H5DataIO(mp_data, compression='gzip')
 ts = TimeSeries('membrane_potential', mp_data, unit='mV', rate=10000.)
@@ -47,14 +40,8 @@ nwbfile.add_acquisition(ts)
 
 # convert spike data
 
-for spk_file in sorted(glob(os.path.join(run_dir, 'spiketimes*'))):
-    with open(spk_file, 'rb') as file:
-        data = pickle.load(file)
-    cell_type = spk_file.split('_')[-2]
-    for row in data:
-        cell_id = row[0]
-        spikes = np.array(row[1:], dtype=np.float) / 1000
-        nwbfile.add_unit(spike_times=spikes, cell_type=cell_type, cell_type_id=cell_id)
+# pass stream_dir to keep the spikes on disk if they do not fit in memory
+nwbfile.units = build_spike_units(sorted(glob(os.path.join(run_dir, 'spiketimes*'))))
 
 print(nwbfile.units['cell_type'].data)
 print(nwbfile.units.get_unit_spike_times(21))
@@ -0,0 +1,229 @@
+"""Read many single-trace text files into one (time, compartment) array.
+
+Poirazi lab simulations write one .txt/.dat file per compartment. Each file
+is parsed in one call to numpy's C float parser, in a thread or process
+pool, and written straight into its column of a preallocated array, instead
+of collecting the columns in a list and stacking them at the end. The result
+can be cached as .npy next to a JSON sidecar that records the source files,
+so reruns skip the parsing entirely. For data that does not fit in memory,
+`text_column_blocks` streams groups of files into the NWB file instead.
+"""
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import numpy as np
+
+from to_nwb.data_iterators import ColumnBlockIterator
+
+
+def parse_text_file(path, dtype=np.float64):
+    """Parse a whitespace-delimited numeric text file.
+
+    Gives the same values as `np.loadtxt`, without parsing line by line.
+
+    Parameters
+    ----------
+    path: str
+    dtype: np.dtype, optional
+
+    Returns
+    -------
+    np.ndarray
+        (n_samples, n_columns)
+
+    """
+    with open(path, 'r') as f:
+        text = f.read()
+    first_line = next((line for line in text.splitlines() if line.strip()), '')
+    data = np.fromstring(text, dtype=dtype, sep=' ')
+
+    return data.reshape(-1, max(1, len(first_line.split())))
+
+
+def probe_text_file(path):
+    """Shape of a text file without parsing its values.
+
+    The number of samples is the number of non-empty lines, and the number
+    of columns is taken from the first of them.
+
+    Parameters
+    ----------
+    path: str
+
+    Returns
+    -------
+    tuple
+        (n_samples, n_columns)
+
+    """
+    n_samples = 0
+    n_columns = None
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                if n_columns is None:
+                    n_columns = len(line.split())
+                n_samples += 1
+
+    return n_samples, n_columns or 0
+
+
+def _source_stats(paths):
+    return [[os.path.abspath(path), os.stat(path).st_size, os.stat(path).st_mtime_ns]
+            for path in paths]
+
+
+def _sidecar_path(cache_path):
+    return os.path.splitext(cache_path)[0] + '.json'
+
+
+def load_cache(cache_path, paths):
+    """Load a cached array if it was made from the current versions of `paths`.
+
+    Parameters
+    ----------
+    cache_path: str
+        .npy file
+    paths: list(str)
+
+    Returns
+    -------
+    np.memmap | None
+        None if there is no cache or any source file changed
+
+    """
+    sidecar = _sidecar_path(cache_path)
+    if not (os.path.isfile(cache_path) and os.path.isfile(sidecar)):
+        return None
+    with open(sidecar, 'r') as f:
+        meta = json.load(f)
+    if meta.get('sources') != _source_stats(paths):
+        return None
+
+    return np.load(cache_path, mmap_mode='r')
+
+
+def save_cache(cache_path, data, paths):
+    """Save `data` as .npy along with a JSON sidecar listing its source files.
+
+    Parameters
+    ----------
+    cache_path: str
+    data: np.ndarray
+    paths: list(str)
+
+    """
+    np.save(cache_path, data)
+    with open(_sidecar_path(cache_path), 'w') as f:
+        json.dump({'shape': list(data.shape), 'dtype': np.dtype(data.dtype).str,
+                   'sources': _source_stats(paths)}, f)
+
+
+def _parse_indexed(args):
+    i, path, dtype = args
+    return i, parse_text_file(path, dtype=dtype)
+
+
+def read_text_columns(paths, dtype=np.float64, n_jobs=8, processes=False, cache_path=None,
+                      out=None, progress=None):
+    """Read text files side by side into one (time, column) array.
+
+    Equivalent to `np.column_stack([np.loadtxt(p) for p in paths])`. The
+    shape of the output is probed from the first file; every file must have
+    the same number of samples and columns.
+
+    Parameters
+    ----------
+    paths: list(str)
+    dtype: np.dtype, optional
+        Default is float64
+    n_jobs: int, optional
+        number of files parsed concurrently. Default is 8.
+    processes: bool, optional
+        parse in a process pool instead of a thread pool. Default is False.
+    cache_path: str, optional
+        .npy file used to store and reuse the result
+    out: array-like, optional
+        preallocated (n_samples, n_files * n_columns) array to write into,
+        e.g. an np.memmap. Default is a new array.
+    progress: callable, optional
+        wraps the iterator of parsed files, e.g. `tqdm`
+
+    Returns
+    -------
+    np.ndarray
+
+    """
+    paths = list(paths)
+    if cache_path is not None:
+        cached = load_cache(cache_path, paths)
+        if cached is not None:
+            if out is None:
+                return cached
+            out[:] = cached
+            return out
+
+    n_samples, n_columns = probe_text_file(paths[0])
+    if out is None:
+        out = np.empty((n_samples, len(paths) * n_columns), dtype=dtype)
+
+    def write(parsed):
+        if progress is not None:
+            parsed = progress(parsed, total=len(paths))
+        for i, data in parsed:
+            if data.shape != (n_samples, n_columns):
+                raise ValueError('{} has shape {}, expected {}'.format(
+                    paths[i], data.shape, (n_samples, n_columns)))
+            out[:, i * n_columns:(i + 1) * n_columns] = data
+
+    jobs = [(i, path, dtype) for i, path in enumerate(paths)]
+    if n_jobs > 1 and len(paths) > 1:
+        executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+        with executor(min(n_jobs, len(paths))) as pool:
+            write(pool.map(_parse_indexed, jobs))
+    else:
+        write(map(_parse_indexed, jobs))
+
+    if cache_path is not None:
+        save_cache(cache_path, out, paths)
+
+    return out
+
+
+def text_column_blocks(path_groups, dtype=np.float64, n_jobs=8, cache_paths=None,
+                       chunk_shape=None, progress=None):
+    """Stream groups of text files into one (time, column) dataset.
+
+    Each group (e.g. all compartments of one cell) is parsed with
+    `read_text_columns` only when the previous one has been written, so the
+    whole matrix is never held in memory.
+
+    Parameters
+    ----------
+    path_groups: list(list(str))
+    dtype: np.dtype, optional
+    n_jobs: int, optional
+        number of files of a group parsed concurrently
+    cache_paths: list(str), optional
+        .npy cache of each group
+    chunk_shape: tuple, optional
+        HDF5 chunk shape, see `ColumnBlockIterator`
+    progress: callable, optional
+        wraps the iterator of parsed files of each group, e.g. `tqdm`
+
+    Returns
+    -------
+    to_nwb.data_iterators.ColumnBlockIterator
+
+    """
+    path_groups = [list(paths) for paths in path_groups]
+    n_rows, n_columns = probe_text_file(path_groups[0][0])
+
+    def read(i):
+        return read_text_columns(path_groups[i], dtype=dtype, n_jobs=n_jobs,
+                                 cache_path=None if cache_paths is None else cache_paths[i],
+                                 progress=progress)
+
+    return ColumnBlockIterator(n_rows, [len(paths) * n_columns for paths in path_groups], read,
+                               dtype=dtype, chunk_shape=chunk_shape)
@@ -9,6 +9,8 @@ from pynwb import NWBFile, NWBHDF5IO
 from pynwb.behavior import SpatialSeries, Position
 
 from to_nwb.utils import check_module
+from to_nwb.Soltesz.neuroh5 import (read_ragged_attribute, get_population_info, build_spike_units,
+                                    list_namespaces, list_trajectories)
 
 import sys
 
@@ -16,6 +18,9 @@ import sys
 def read_ragged_array(struct, i=None, gid=None):
     """Read item x from ragged array STRUCT
 
+    The whole ragged array is read once and cached, so calling this for
+    every cell does not re-read the pointer and index datasets.
+
     Parameters
     ----------
     struct: h5py.Group
@@ -30,49 +35,46 @@ def read_ragged_array(struct, i=None, gid=None):
     """
     if i is not None and gid is not None:
         raise ValueError('only i or gid can be supplied')
+    attribute = read_ragged_attribute(struct)
     if i is None and gid is None:
-        return np.array([read_ragged_array(struct, i)
-                         for i in tqdm(struct['Cell Index'][:])])
-    if gid:
-        if 'Cell Index' in struct:
-            i = np.argmax(struct['Cell Index'][:] == gid)[0]
-        else:
-            i = gid
-
-    i = int(i)
-
-    start = struct['Attribute Pointer'][i]
-    stop = struct['Attribute Pointer'][i+1]
+        return np.array(attribute.split(), dtype=object)
+    if gid is not None:
+        i = attribute.row(gid)
 
-    return struct['Attribute Value'][start:stop].astype(float)
+    return attribute.get_row(int(i))
 
 
-def get_neuroh5_cell_data(f):
+def get_neuroh5_cell_data(f, namespace='Vector Stimulus 100'):
     """
 
     Parameters
     ----------
     f: h5py.File
+    namespace: str (optional)
 
     Yields
     -------
     dict
 
     """
-    labs = f['H5Types']['Population labels']
-    population_table = f['H5Types']['Populations']
-    cell_types_order = {labs.id.get_member_value(i): labs.id.get_member_name(i)
-                        for i in range(labs.id.get_nmembers())}
-    start_dict = {pop_name.decode(): population_table['Start'][population_table['Population'] == pop_int][0]
-                  for pop_int, pop_name in cell_types_order.items()}
+    start_dict = {cell_type: pop['start'] for cell_type, pop in get_population_info(f).items()}
 
     pops = f['Populations']
     for cell_type in pops:
-        spike_struct = pops[cell_type]['Vector Stimulus 100']['spiketrain']
-        for pop_id in spike_struct['Cell Index']:
-            spike_times = read_ragged_array(spike_struct, pop_id) / 1000
+        spike_struct = pops[cell_type][namespace]['spiketrain']
+        spiketrains = read_ragged_attribute(spike_struct, cache=False)
+        for pop_id, spike_times in zip(spiketrains.cell_index, spiketrains.split()):
             gid = pop_id + start_dict[cell_type]
-            yield {'id': int(gid), 'pop_id': int(pop_id), 'spike_times': spike_times, 'cell_type': cell_type}
+            yield {'id': int(gid), 'pop_id': int(pop_id), 'spike_times': spike_times / 1000,
+                   'cell_type': cell_type}
+
+
+def _trajectory_series(obj, name):
+    return SpatialSeries(name, data=np.array([obj['x'], obj['y']]).T,
+                         reference_frame='NA',
+                         conversion=1 / 100.,
+                         resolution=np.nan,
+                         rate=float(1000. / np.diff(obj['t'][:2])[0]))
 
 
 def write_position(nwbfile, f, name='Trajectory 100'):
@@ -89,21 +91,67 @@ def write_position(nwbfile, f, name='Trajectory 100'):
     pynwb.core.ProcessingModule
 
     """
-    obj = f[name]
     behavior_mod = check_module(nwbfile, 'behavior')
+    behavior_mod.add_data_interface(Position(_trajectory_series(f[name], 'Position')))
+
+    return behavior_mod
 
-    spatial_series = SpatialSeries('Position', data=np.array([obj['x'], obj['y']]).T,
-                                   reference_frame='NA',
-                                   conversion=1 / 100.,
-                                   resolution=np.nan,
-                                   rate=float(1 / np.diff(obj['t'][:2]) * 1000))
 
-    behavior_mod.add_data_interface(Position(spatial_series))
+def write_trajectories(nwbfile, f, names=None):
+    """Write every trajectory of a neuroh5 file as a SpatialSeries of one Position.
+
+    Parameters
+    ----------
+    nwbfile: pynwb.NWBFile
+    f: h5py.File
+    names: list(str) (optional)
+        Default is all trajectories in the file
+
+    Returns
+    -------
+    pynwb.core.ProcessingModule
+
+    """
+    if names is None:
+        names = list_trajectories(f)
+    behavior_mod = check_module(nwbfile, 'behavior')
+    behavior_mod.add_data_interface(
+        Position([_trajectory_series(f[name], name) for name in names]))
 
     return behavior_mod
 
 
-def neuroh5_to_nwb(fpath, out_path=None):
+def write_spike_namespaces(nwbfile, f, namespaces=None, units_namespace='Vector Stimulus 100'):
+    """Write the spike trains of every attribute namespace to its own Units table.
+
+    `units_namespace` goes to nwbfile.units; every other namespace goes to a
+    Units table of the same name in the 'spike_trains' processing module.
+    Population metadata is read once and shared by all namespaces.
+
+    Parameters
+    ----------
+    nwbfile: pynwb.NWBFile
+    f: h5py.File
+    namespaces: list(str) (optional)
+        Default is every namespace that has a 'spiketrain' attribute
+    units_namespace: str | None (optional)
+
+    """
+    if namespaces is None:
+        namespaces = [namespace for namespace, attributes in list_namespaces(f).items()
+                      if 'spiketrain' in attributes]
+    population_info = get_population_info(f)
+
+    for namespace in namespaces:
+        if namespace == units_namespace:
+            nwbfile.units = build_spike_units(f, namespace, population_info=population_info)
+        else:
+            check_module(nwbfile, 'spike_trains', 'spike trains of each stimulus').add_data_interface(
+                build_spike_units(f, namespace, population_info=population_info, name=namespace))
+
+
+def neuroh5_to_nwb(fpath, out_path=None, direct=True, namespaces=None,
+                   units_namespace='Vector Stimulus 100'):
     """
 
     Parameters
@@ -112,6 +160,15 @@ def neuroh5_to_nwb(fpath, out_path=None):
         path of neuroh5 file
     out_path: str (optional)
         where the NWB file is saved
+    direct: bool (optional)
+        If True (default), write every spike namespace and trajectory in the
+        file, with Units tables built straight from the neuroh5 pointer and
+        value datasets. If False, add the units of `units_namespace` one at a
+        time, along with 'Trajectory 100'.
+    namespaces: list(str) (optional)
+        namespaces to write when `direct` is True. Default is all.
+    units_namespace: str (optional)
+        namespace written to nwbfile.units
 
     """
 
@@ -127,18 +184,25 @@ def neuroh5_to_nwb(fpath, out_path=None):
                       institution='Stanford University', lab='Soltesz')
 
     with File(fpath, 'r') as f:
-        write_position(nwbfile, f)
+        if direct:
+            write_trajectories(nwbfile, f)
+            write_spike_namespaces(nwbfile, f, namespaces, units_namespace)
+        else:
+            write_position(nwbfile, f)
 
-        nwbfile.add_unit_column('cell_type', 'cell type')
-        nwbfile.add_unit_column('pop_id', 'cell number within population')
+            nwbfile.add_unit_column('cell_type', 'cell type')
+            nwbfile.add_unit_column('pop_id', 'cell number within population')
 
-        for unit_dict in tqdm(get_neuroh5_cell_data(f),
-                              total=38000+34000,
-                              desc='reading cell data'):
-            nwbfile.add_unit(**unit_dict)
+            counts = [pop['count'] for pop in get_population_info(f).values()]
+            total = sum(counts) if None not in counts else None
+            for unit_dict in tqdm(get_neuroh5_cell_data(f, units_namespace),
+                                  total=total,
+                                  desc='reading cell data'):
+                nwbfile.add_unit(**unit_dict)
 
-    with NWBHDF5IO(out_path, 'w') as io:
-        io.write(nwbfile)
+        # spike times are streamed from the neuroh5 file, so write before closing it
+        with NWBHDF5IO(out_path, 'w') as io:
+            io.write(nwbfile)
 
 
 def main(argv):
@@ -0,0 +1,303 @@
+"""Bulk readers for neuroh5 files.
+
+neuroh5 stores a cell attribute of a population (e.g. a spike train) as a
+ragged array: a flat 'Attribute Value' dataset, an 'Attribute Pointer'
+dataset with one more entry than there are cells, and a 'Cell Index' dataset
+with the population id of each cell. These are read once per population and
+split in memory, instead of issuing several small h5py reads per cell.
+"""
+import os
+import warnings
+
+import numpy as np
+
+from to_nwb.data_iterators import ConcatenatedBlockIterator
+from to_nwb.utils import build_units_table, natural_key
+
+
+# {(filename, mtime, group path, dtype): RaggedAttribute}
+_ATTRIBUTE_CACHE = {}
+# {(filename, mtime): population info}
+_POPULATION_CACHE = {}
+
+
+class RaggedAttribute(object):
+    """A neuroh5 ragged cell attribute loaded with one read per dataset.
+
+    Parameters
+    ----------
+    struct: h5py.Group
+        group holding 'Attribute Pointer', 'Attribute Value' and optionally
+        'Cell Index'
+    dtype: np.dtype, optional
+        dtype of the values. Default is float.
+
+    """
+
+    def __init__(self, struct, dtype=float):
+        self.pointer = struct['Attribute Pointer'][:].astype(np.int64)
+        self.values = struct['Attribute Value'][:].astype(dtype, copy=False)
+        if 'Cell Index' in struct:
+            self.cell_index = struct['Cell Index'][:]
+        else:
+            self.cell_index = np.arange(len(self.pointer) - 1)
+        self._gid_rows = None
+        self._sort_order = None
+
+    def __len__(self):
+        return len(self.cell_index)
+
+    @property
+    def offsets(self):
+        """Pointer relative to the start of `values`."""
+        return self.pointer - self.pointer[0]
+
+    @property
+    def counts(self):
+        """Number of values of each cell."""
+        return np.diff(self.pointer)
+
+    def split(self):
+        """Values of every cell, as views into `values`.
+
+        Returns
+        -------
+        list(np.ndarray)
+
+        """
+        return np.split(self.values[self.pointer[0]:self.pointer[-1]], self.offsets[1:-1])
+
+    def row(self, gid):
+        """Row of one cell, looked up in a dict built on first use.
+
+        Parameters
+        ----------
+        gid: int
+            id of the cell within the population, as in 'Cell Index'
+
+        Returns
+        -------
+        int
+
+        """
+        if self._gid_rows is None:
+            self._gid_rows = {int(g): i for i, g in enumerate(self.cell_index)}
+        return self._gid_rows[int(gid)]
+
+    def rows(self, gids):
+        """Rows of many cells at once, via a sorted copy of 'Cell Index'.
+
+        Parameters
+        ----------
+        gids: array-like
+
+        Returns
+        -------
+        np.ndarray
+
+        """
+        if self._sort_order is None:
+            self._sort_order = np.argsort(self.cell_index, kind='stable')
+        sorted_index = self.cell_index[self._sort_order]
+        gids = np.asarray(gids)
+        pos = np.searchsorted(sorted_index, gids)
+        pos = np.minimum(pos, len(sorted_index) - 1)
+        if not np.all(sorted_index[pos] == gids):
+            raise KeyError('gids not found in Cell Index: {}'.format(gids[sorted_index[pos] != gids]))
+        return self._sort_order[pos]
+
+    def get_row(self, i):
+        """Values of the cell in row `i`."""
+        return self.values[self.pointer[i]:self.pointer[i + 1]]
+
+    def get(self, gid):
+        """Values of the cell with id `gid`."""
+        return self.get_row(self.row(gid))
+
+
+def read_ragged_attribute(struct, dtype=float, cache=True):
+    """Read a ragged attribute in bulk, reusing an earlier read of the same group.
+
+    Parameters
+    ----------
+    struct: h5py.Group
+    dtype: np.dtype, optional
+    cache: bool, optional
+        Default is True
+
+    Returns
+    -------
+    RaggedAttribute
+
+    """
+    if not cache:
+        return RaggedAttribute(struct, dtype=dtype)
+    filename = struct.file.filename
+    key = (filename, os.path.getmtime(filename), struct.name, np.dtype(dtype).str)
+    if key not in _ATTRIBUTE_CACHE:
+        _ATTRIBUTE_CACHE[key] = RaggedAttribute(struct, dtype=dtype)
+    return _ATTRIBUTE_CACHE[key]
+
+
+def clear_cache():
+    """Drop all cached ragged attributes and population tables."""
+    _ATTRIBUTE_CACHE.clear()
+    _POPULATION_CACHE.clear()
+
+
+def get_population_info(f, cache=True):
+    """Read the population table of a neuroh5 file.
+
+    Parameters
+    ----------
+    f: h5py.File
+    cache: bool, optional
+        Reuse an earlier read of the same file. Default is True.
+
+    Returns
+    -------
+    dict
+        {population name: {'start': first gid, 'count': number of cells}}.
+        'count' is None if the table has no 'Count' field.
+
+    """
+    key = (f.filename, os.path.getmtime(f.filename))
+    if cache and key in _POPULATION_CACHE:
+        return _POPULATION_CACHE[key]
+
+    labs = f['H5Types']['Population labels']
+    population_table = f['H5Types']['Populations'][:]
+    names = {labs.id.get_member_value(i): labs.id.get_member_name(i).decode()
+             for i in range(labs.id.get_nmembers())}
+    has_count = 'Count' in population_table.dtype.names
+
+    out = {}
+    for row in population_table:
+        out[names[row['Population']]] = {'start': int(row['Start']),
+                                         'count': int(row['Count']) if has_count else None}
+
+    _POPULATION_CACHE[key] = out
+    return out
+
+
+def list_namespaces(f):
+    """List the cell attribute namespaces of all populations.
+
+    Parameters
+    ----------
+    f: h5py.File
+
+    Returns
+    -------
+    dict
+        {namespace: list of attribute names}, e.g.
+        {'Vector Stimulus 100': ['spiketrain']}
+
+    """
+    out = {}
+    for pop in f['Populations'].values():
+        for namespace, group in pop.items():
+            attributes = out.setdefault(namespace, [])
+            attributes += [name for name in group if name not in attributes]
+
+    return {namespace: out[namespace] for namespace in sorted(out, key=natural_key)}
+
+
+def list_trajectories(f):
+    """List the trajectory groups of a neuroh5 file, e.g. ['Trajectory 100']."""
+    return sorted((name for name in f if name.startswith('Trajectory')), key=natural_key)
+
+
+def _read_ragged_columns(f, namespace, attribute):
+    # pointer, cell index and value dataset of each population holding the attribute
+    out = {}
+    for cell_type, pop in f['Populations'].items():
+        if namespace not in pop or attribute not in pop[namespace]:
+            continue
+        struct = pop[namespace][attribute]
+        pointer = struct['Attribute Pointer'][:].astype(np.uint64)
+        if 'Cell Index' in struct:
+            cell_index = struct['Cell Index'][:]
+        else:
+            cell_index = np.arange(len(pointer) - 1)
+        value = struct['Attribute Value']
+        if pointer[0] != 0 or pointer[-1] != len(value):
+            value = value[int(pointer[0]):int(pointer[-1])]
+        out[cell_type] = (pointer - pointer[0], cell_index, value)
+
+    return out
+
+
+def _concat_ragged(columns):
+    index, values = [], []
+    offset = 0
+    for pointer, _, value in columns.values():
+        index.append(pointer[1:] + offset)
+        offset += int(pointer[-1])
+        values.append(value)
+
+    return np.concatenate(index), values
+
+
+def build_spike_units(f, namespace='Vector Stimulus 100', attribute='spiketrain',
+                      block_size=2 ** 20, population_info=None, name='units'):
+    """Build a Units table straight from the ragged spike arrays of a neuroh5 file.
+
+    neuroh5 pointer/value pairs already have the layout of NWB
+    spike_times/spike_times_index, so only the pointers are loaded. The
+    values are copied in blocks and rescaled from ms to s on the way to
+    disk; no per-unit Python objects are made. Other attributes of the
+    namespace that cover the same cells are added as ragged columns.
+
+    Parameters
+    ----------
+    f: h5py.File
+    namespace: str, optional
+    attribute: str, optional
+    block_size: int, optional
+        number of spike times read per block
+    population_info: dict, optional
+        output of `get_population_info`
+    name: str, optional
+        name of the Units table. Default is 'units'.
+
+    Returns
+    -------
+    pynwb.misc.Units
+
+    """
+    if population_info is None:
+        population_info = get_population_info(f)
+
+    spikes = _read_ragged_columns(f, namespace, attribute)
+    index, values = _concat_ragged(spikes)
+    spike_times = ConcatenatedBlockIterator(values, block_size=block_size,
+                                            transform=lambda x: x / 1000., dtype=np.float64)
+
+    ids = np.concatenate([cell_index.astype(np.int64) + population_info[cell_type]['start']
+                          for cell_type, (_, cell_index, _) in spikes.items()])
+    columns = [{'name': 'cell_type', 'description': 'cell type',
+                'data': np.concatenate([np.repeat(cell_type, len(cell_index))
+                                        for cell_type, (_, cell_index, _) in spikes.items()])},
+               {'name': 'pop_id', 'description': 'cell number within population',
+                'data': np.concatenate([cell_index for _, cell_index, _ in spikes.values()])}]
+
+    for other in list_namespaces(f)[namespace]:
+        if other == attribute:
+            continue
+        other_columns = _read_ragged_columns(f, namespace, other)
+        aligned = list(other_columns) == list(spikes) and all(
+            np.array_equal(other_columns[cell_type][1], spikes[cell_type][1]) for cell_type in spikes)
+        if not aligned:
+            warnings.warn('{}/{} does not cover the same cells as {}, skipping'.format(
+                namespace, other, attribute))
+            continue
+        other_index, other_values = _concat_ragged(other_columns)
+        columns.append({'name': other.replace(' ', '_'),
+                        'description': '{} from neuroh5 namespace {}'.format(other, namespace),
+                        'data': ConcatenatedBlockIterator(other_values, block_size=block_size),
+                        'index': other_index})
+
+    return build_units_table(
+        spike_times, index, ids=ids, columns=columns,
+        description='{} {} from neuroh5'.format(namespace, attribute), name=name)
@@ -0,0 +1,106 @@
+from datetime import datetime, timezone
+
+import h5py
+import numpy as np
+import pytest
+from pynwb import NWBFile, NWBHDF5IO
+
+from to_nwb.Soltesz.convert_neuroh5 import get_neuroh5_cell_data, read_ragged_array
+from to_nwb.Soltesz.neuroh5 import (RaggedAttribute, build_spike_units, clear_cache,
+                                    get_population_info, list_namespaces, list_trajectories,
+                                    read_ragged_attribute)
+
+# {population: (start gid, cell index, spike trains in ms)}
+POPULATIONS = {'GC': (0, [0, 1, 2], [[1., 2.5], [], [4., 5., 6.]]),
+               'MC': (3, [1, 0], [[10.], [20., 30.]])}
+
+
+def write_ragged(group, cell_index, rows, offset=0):
+    counts = [len(row) for row in rows]
+    group['Attribute Pointer'] = offset + np.concatenate(([0], np.cumsum(counts))).astype(np.uint64)
+    group['Attribute Value'] = np.concatenate([np.full(offset, -1.)] + [np.asarray(row, dtype=float)
+                                                                         for row in rows])
+    group['Cell Index'] = np.asarray(cell_index, dtype=np.uint32)
+
+
+@pytest.fixture
+def neuroh5_file(tmp_path):
+    path = str(tmp_path / 'cells.h5')
+    labels = h5py.enum_dtype({name: i for i, name in enumerate(POPULATIONS)}, basetype='u2')
+    with h5py.File(path, 'w') as f:
+        f['H5Types/Population labels'] = labels
+        table = np.array([(start, len(cells), i)
+                          for i, (start, cells, _) in enumerate(POPULATIONS.values())],
+                         dtype=[('Start', 'u8'), ('Count', 'u4'), ('Population', labels)])
+        f['H5Types/Populations'] = table
+        for offset, (name, (_, cells, trains)) in enumerate(POPULATIONS.items()):
+            for namespace in ('Vector Stimulus 100', 'Vector Stimulus 200'):
+                write_ragged(f.create_group('Populations/{}/{}/spiketrain'.format(name, namespace)),
+                             cells, trains, offset=offset)
+            write_ragged(f.create_group('Populations/{}/Vector Stimulus 100/trial'.format(name)),
+                         cells, [np.zeros(len(train)) + i for i, train in enumerate(trains)])
+        for name in ('Trajectory 100', 'Trajectory 20'):
+            f[name + '/x'] = np.arange(10.)
+            f[name + '/y'] = np.arange(10.) * 2
+            f[name + '/t'] = np.arange(10.) * 20
+    clear_cache()
+    yield path
+    clear_cache()
+
+
+def test_ragged_attribute(neuroh5_file):
+    with h5py.File(neuroh5_file, 'r') as f:
+        attribute = RaggedAttribute(f['Populations/MC/Vector Stimulus 100/spiketrain'])
+    assert len(attribute) == 2
+    np.testing.assert_array_equal(attribute.counts, [1, 2])
+    np.testing.assert_array_equal(attribute.offsets, [0, 1, 3])
+    assert [list(row) for row in attribute.split()] == [[10.], [20., 30.]]
+    np.testing.assert_array_equal(attribute.get(0), [20., 30.])
+    np.testing.assert_array_equal(attribute.rows([0, 1, 0]), [1, 0, 1])
+    with pytest.raises(KeyError):
+        attribute.rows([5])
+
+
+def test_read_ragged_attribute_cached(neuroh5_file):
+    with h5py.File(neuroh5_file, 'r') as f:
+        struct = f['Populations/GC/Vector Stimulus 100/spiketrain']
+        assert read_ragged_attribute(struct) is read_ragged_attribute(struct)
+        assert read_ragged_attribute(struct, cache=False) is not read_ragged_attribute(struct)
+        assert read_ragged_attribute(struct, dtype=np.float32).values.dtype == np.float32
+
+
+def test_file_listings(neuroh5_file):
+    with h5py.File(neuroh5_file, 'r') as f:
+        assert get_population_info(f) == {'GC': {'start': 0, 'count': 3}, 'MC': {'start': 3, 'count': 2}}
+        assert list_namespaces(f) == {'Vector Stimulus 100': ['spiketrain', 'trial'],
+                                      'Vector Stimulus 200': ['spiketrain']}
+        assert list_trajectories(f) == ['Trajectory 20', 'Trajectory 100']
+
+
+def test_build_spike_units_round_trip(neuroh5_file, tmp_path):
+    out_path = str(tmp_path / 'units.nwb')
+    nwbfile = NWBFile('neuroh5', 'id', datetime(2020, 1, 1, tzinfo=timezone.utc))
+    with h5py.File(neuroh5_file, 'r') as f:
+        nwbfile.units = build_spike_units(f, block_size=2)
+        with NWBHDF5IO(out_path, 'w') as io:
+            io.write(nwbfile)
+
+    with NWBHDF5IO(out_path, 'r') as io:
+        units = io.read().units
+        np.testing.assert_array_equal(units.id[:], [0, 1, 2, 4, 3])
+        assert [units['cell_type'][i] for i in range(5)] == ['GC', 'GC', 'GC', 'MC', 'MC']
+        np.testing.assert_array_equal(units['pop_id'][:], [0, 1, 2, 1, 0])
+        expected = [train for _, _, trains in POPULATIONS.values() for train in trains]
+        for i, train in enumerate(expected):
+            np.testing.assert_allclose(units['spike_times'][i], np.asarray(train) / 1000.)
+            np.testing.assert_array_equal(units['trial'][i], np.zeros(len(train)) + [0, 1, 2, 0, 1][i])
+
+
+def test_cell_data_generator(neuroh5_file):
+    with h5py.File(neuroh5_file, 'r') as f:
+        cells = list(get_neuroh5_cell_data(f))
+        np.testing.assert_array_equal(read_ragged_array(f['Populations/MC/Vector Stimulus 100/spiketrain'],
+                                                        gid=0), [20., 30.])
+    assert [(cell['id'], cell['pop_id'], cell['cell_type']) for cell in cells] == \
+        [(0, 0, 'GC'), (1, 1, 'GC'), (2, 2, 'GC'), (4, 1, 'MC'), (3, 0, 'MC')]
+    np.testing.assert_allclose(cells[2]['spike_times'], [.004, .005, .006])
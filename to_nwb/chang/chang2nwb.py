@@ -10,7 +10,6 @@ import numpy as np
 import pandas as pd
 import scipy.io as sio
 from h5py import File
-from nwbext_ecog import CorticalSurfaces, ECoGSubject
 from pynwb import NWBFile, TimeSeries, get_manager, NWBHDF5IO
 from pynwb.ecephys import ElectricalSeries
 from pynwb.behavior import BehavioralTimeSeries
@@ -33,8 +32,8 @@ from ..utils import remove_duplicates
 from ..tdt import load_wavs, load_anin
 
 
-# get_manager must come after dynamic imports
-manager = get_manager()
+# BuildManager created on first use, see get_io_manager
+_manager = None
 
 raw_htk_paths = ['/data_store1/human/prcsd_data', '/data_store0/human/HTK_raw']
 tdt_data_path = '/data_store0/human/HTK_raw'
@@ -48,6 +47,24 @@ Convert ECoG to NWB
 """
 
 
+def get_io_manager():
+    """BuildManager for reading and writing ECoG NWB files, created on first use.
+
+    get_manager must come after the extension classes are registered, so
+    nwbext_ecog is imported here rather than when this module is imported.
+
+    Returns
+    -------
+    hdmf.build.BuildManager
+
+    """
+    global _manager
+    if _manager is None:
+        import nwbext_ecog  # noqa: F401
+        _manager = get_manager()
+    return _manager
+
+
 def find_ekg_elecs(elec_metadata_file):
     elec_grp_df, coord = read_electrodes(elec_metadata_file)
     return np.where(elec_grp_df['device'] == 'EKG')[0]
@@ -183,6 +200,8 @@ def create_cortical_surfaces(pial_files, subject_id):
     if not len(pial_files):
         return None
 
+    from nwbext_ecog import CorticalSurfaces
+
     names = []
     cortical_surfaces = CorticalSurfaces()
     for pial_file in pial_files:
@@ -573,6 +592,8 @@ def chang2nwb(blockpath, outpath=None, session_start_time=None,
         hilb_mod.add_container(decomp_series)
 
     if include_cortical_surfaces:
+        from nwbext_ecog import ECoGSubject
+
         subject = ECoGSubject(subject_id=subject_id)
         subject.cortical_surfaces = create_cortical_surfaces(pial_files, subject_id)
     else:
@@ -587,9 +608,9 @@ def chang2nwb(blockpath, outpath=None, session_start_time=None,
             subj_nwbfile = NWBFile(
                 session_description=subject_id, identifier=subject_id, subject=subject,
                 session_start_time=datetime(1900, 1, 1).astimezone(timezone('UTC')))
-            with NWBHDF5IO(subj_fpath, manager=manager, mode='w') as subj_io:
+            with NWBHDF5IO(subj_fpath, manager=get_io_manager(), mode='w') as subj_io:
                 subj_io.write(subj_nwbfile)
-        subj_read_io = NWBHDF5IO(subj_fpath, manager=manager, mode='r')
+        subj_read_io = NWBHDF5IO(subj_fpath, manager=get_io_manager(), mode='r')
         subj_nwbfile = subj_read_io.read()
         subject = subj_nwbfile.subject
 
@@ -667,7 +688,7 @@ def chang2nwb(blockpath, outpath=None, session_start_time=None,
             print('No intensity file for ' + blockname)
 
     # Export the NWB file
-    with NWBHDF5IO(outpath, manager=manager, mode='w') as io:
+    with NWBHDF5IO(outpath, manager=get_io_manager(), mode='w') as io:
         io.write(nwbfile)
 
     if external_subject:
@@ -677,11 +698,12 @@ def chang2nwb(blockpath, outpath=None, session_start_time=None,
         file.close()
 
     # read check
-    with NWBHDF5IO(outpath, manager=manager, mode='r') as io:
+    with NWBHDF5IO(outpath, manager=get_io_manager(), mode='r') as io:
         io.read()
 
 
 def gen_external_subject(subject_id, basepath=None, imaging_path=None, outpath=None, subject_image_list=None):
+    from nwbext_ecog import ECoGSubject
 
     subject = ECoGSubject(subject_id=subject_id)
 
@@ -705,7 +727,7 @@ def gen_external_subject(subject_id, basepath=None, imaging_path=None, outpath=N
     subj_nwbfile = NWBFile(
         session_description=subject_id, identifier=subject_id, subject=subject,
         session_start_time=datetime(1900, 1, 1).astimezone(timezone('UTC')))
-    with NWBHDF5IO(subj_fpath, manager=manager, mode='w') as subj_io:
+    with NWBHDF5IO(subj_fpath, manager=get_io_manager(), mode='w') as subj_io:
         subj_io.write(subj_nwbfile)
 
 
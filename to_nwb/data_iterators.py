@@ -0,0 +1,283 @@
+"""Data chunk iterators for writing large arrays to NWB without loading them.
+
+These wrap one or more sliceable sources (h5py datasets, memmaps, ...) and
+hand HDF5IO one block at a time, with an optional transform applied to each
+block on the way through.
+"""
+import h5py
+import numpy as np
+from hdmf.backends.hdf5.h5_utils import H5DataIO
+from hdmf.data_utils import AbstractDataChunkIterator, DataChunk
+
+
+def _identity(x):
+    return x
+
+
+class ConcatenatedBlockIterator(AbstractDataChunkIterator):
+    """Write several 1D sources one after the other as a single 1D dataset.
+
+    Parameters
+    ----------
+    sources: list
+        1D sliceable objects, e.g. h5py datasets
+    block_size: int, optional
+        number of elements read per block. Default is 2 ** 20.
+    transform: callable, optional
+        applied to every block, e.g. `lambda x: x / 1000.`. Must preserve
+        the length of the block.
+    dtype: np.dtype, optional
+        dtype after `transform`. Default is the dtype of the first source.
+    chunk_size: int, optional
+        recommended HDF5 chunk length. Default is min(block_size, 2 ** 16).
+
+    """
+
+    def __init__(self, sources, block_size=2 ** 20, transform=None, dtype=None, chunk_size=None):
+        self.sources = list(sources)
+        self.block_size = int(block_size)
+        self.transform = transform if transform is not None else _identity
+        self._dtype = np.dtype(dtype) if dtype is not None else np.dtype(self.sources[0].dtype)
+        self._chunk_size = chunk_size
+        self._lengths = [len(source) for source in self.sources]
+        self._blocks = [(i, start, min(start + self.block_size, length))
+                        for i, length in enumerate(self._lengths)
+                        for start in range(0, length, self.block_size)]
+        self._offsets = np.concatenate(([0], np.cumsum(self._lengths)))
+        self._pos = 0
+
+    def __iter__(self):
+        return self
+
+    def __len__(self):
+        return int(self._offsets[-1])
+
+    def __next__(self):
+        if self._pos >= len(self._blocks):
+            raise StopIteration
+        i, start, stop = self._blocks[self._pos]
+        self._pos += 1
+        data = np.asarray(self.transform(self.sources[i][start:stop]), dtype=self._dtype)
+        offset = self._offsets[i]
+        return DataChunk(data=data, selection=np.s_[offset + start:offset + stop])
+
+    next = __next__
+
+    def recommended_chunk_shape(self):
+        if self._chunk_size is not None:
+            return (self._chunk_size,)
+        return (max(1, min(self.block_size, 2 ** 16, int(self._offsets[-1]))),)
+
+    def recommended_data_shape(self):
+        return (int(self._offsets[-1]),)
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    @property
+    def maxshape(self):
+        return (int(self._offsets[-1]),)
+
+
+class ArrayBlockIterator(AbstractDataChunkIterator):
+    """Copy an N-D sliceable source block by block along its first axis.
+
+    Parameters
+    ----------
+    data: array-like
+        e.g. an h5py dataset or np.memmap
+    block_size: int, optional
+        number of rows read per block. Default is a whole number of source
+        chunks (for chunked h5py datasets) of about 64 MB.
+    transform: callable, optional
+        applied to every block. Must preserve the shape of the block.
+    dtype: np.dtype, optional
+        dtype after `transform`. Default is the dtype of `data`.
+    chunk_shape: tuple, optional
+        recommended HDF5 chunk shape. Default is the chunk shape of `data`
+        if it has one, otherwise HDF5 picks one.
+
+    """
+
+    def __init__(self, data, block_size=None, transform=None, dtype=None, chunk_shape=None):
+        self.data = data
+        self.transform = transform if transform is not None else _identity
+        self._dtype = np.dtype(dtype) if dtype is not None else np.dtype(data.dtype)
+        self._shape = tuple(int(x) for x in data.shape)
+        source_chunks = getattr(data, 'chunks', None)
+        self._chunk_shape = chunk_shape if chunk_shape is not None else source_chunks
+        if block_size is None:
+            row_bytes = max(1, int(np.prod(self._shape[1:])) * np.dtype(data.dtype).itemsize)
+            block_size = max(1, 2 ** 26 // row_bytes)
+            if source_chunks:
+                block_size = max(1, block_size // source_chunks[0]) * source_chunks[0]
+        self.block_size = int(block_size)
+        self._pos = 0
+
+    def __iter__(self):
+        return self
+
+    def __len__(self):
+        return self._shape[0]
+
+    def __next__(self):
+        if self._pos >= self._shape[0]:
+            raise StopIteration
+        start, stop = self._pos, min(self._pos + self.block_size, self._shape[0])
+        self._pos = stop
+        data = np.asarray(self.transform(self.data[start:stop]), dtype=self._dtype)
+        selection = (slice(start, stop),) + tuple(slice(0, n) for n in self._shape[1:])
+        return DataChunk(data=data, selection=selection)
+
+    next = __next__
+
+    def recommended_chunk_shape(self):
+        return self._chunk_shape
+
+    def recommended_data_shape(self):
+        return self._shape
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    @property
+    def maxshape(self):
+        return self._shape
+
+
+class ColumnBlockIterator(AbstractDataChunkIterator):
+    """Write a 2D (time, column) dataset one group of columns at a time.
+
+    Useful when the columns come from many files, e.g. one per compartment:
+    each group is read only when hdmf asks for it and written into its
+    columns of a dataset that is created with its final shape.
+
+    Parameters
+    ----------
+    n_rows: int
+    widths: list(int)
+        number of columns of each group
+    read: callable
+        `read(i)` returns the (n_rows, widths[i]) block of group i
+    dtype: np.dtype, optional
+        Default is float64
+    chunk_shape: tuple, optional
+        recommended HDF5 chunk shape. Default is at most 1 MB per chunk and
+        no wider than the narrowest group.
+
+    """
+
+    def __init__(self, n_rows, widths, read, dtype=np.float64, chunk_shape=None):
+        self.n_rows = int(n_rows)
+        self.widths = [int(width) for width in widths]
+        self.read = read
+        self._dtype = np.dtype(dtype)
+        self._offsets = np.concatenate(([0], np.cumsum(self.widths))).astype(int)
+        if chunk_shape is None:
+            width = max(1, min(min(self.widths), 64))
+            rows = max(1, min(self.n_rows, 2 ** 20 // (width * self._dtype.itemsize)))
+            chunk_shape = (rows, width)
+        self._chunk_shape = tuple(chunk_shape)
+        self._pos = 0
+
+    def __iter__(self):
+        return self
+
+    def __len__(self):
+        return self.n_rows
+
+    def __next__(self):
+        if self._pos >= len(self.widths):
+            raise StopIteration
+        i = self._pos
+        self._pos += 1
+        data = np.asarray(self.read(i), dtype=self._dtype)
+        start, stop = self._offsets[i], self._offsets[i + 1]
+        if data.shape != (self.n_rows, stop - start):
+            raise ValueError('group {} has shape {}, expected {}'.format(
+                i, data.shape, (self.n_rows, stop - start)))
+        return DataChunk(data=data, selection=np.s_[:self.n_rows, start:stop])
+
+    next = __next__
+
+    def recommended_chunk_shape(self):
+        return self._chunk_shape
+
+    def recommended_data_shape(self):
+        return self.n_rows, int(self._offsets[-1])
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    @property
+    def maxshape(self):
+        return self.n_rows, int(self._offsets[-1])
+
+
+def _h5_io_settings(dset):
+    # storage settings of an h5py dataset that can be reused for a copy
+    settings = {}
+    if dset.chunks is not None:
+        settings['chunks'] = dset.chunks
+    if dset.compression in ('gzip', 'lzf') or (
+            dset.compression == 'szip' and h5py.h5z.filter_avail(h5py.h5z.FILTER_SZIP)):
+        settings['compression'] = dset.compression
+        if dset.compression_opts is not None:
+            settings['compression_opts'] = dset.compression_opts
+    if dset.shuffle:
+        settings['shuffle'] = True
+    if dset.fletcher32:
+        settings['fletcher32'] = True
+
+    return settings
+
+
+def copy_h5_dataset(dset, transform=None, dtype=None, block_size=None, **io_settings):
+    """Wrap an h5py dataset so that HDF5IO copies it into the NWB file without loading it.
+
+    Without a transform the dataset is copied by HDF5 itself (h5py `copy`),
+    which keeps its chunking, compression and dtype as they are. With a
+    transform or a new dtype the data are streamed through an
+    `ArrayBlockIterator`, and the chunking and compression of the source are
+    reused where they apply to the output.
+
+    Parameters
+    ----------
+    dset: h5py.Dataset
+    transform: callable, optional
+        applied to every block, e.g. `lambda x: x / 1000.`. Must preserve
+        the shape of the block.
+    dtype: np.dtype, optional
+        dtype after `transform`
+    block_size: int, optional
+        number of rows read per block, see `ArrayBlockIterator`
+    io_settings:
+        H5DataIO arguments that override the ones taken from the source,
+        e.g. compression='gzip'
+
+    Returns
+    -------
+    hdmf.backends.hdf5.h5_utils.H5DataIO
+        or the data themselves for scalar and empty datasets that need a
+        transform
+
+    """
+    if transform is None and (dtype is None or np.dtype(dtype) == dset.dtype) and not io_settings:
+        return H5DataIO(dset, link_data=False)
+
+    if not dset.shape or not dset.size:
+        # nothing to stream or chunk
+        data = dset[()]
+        return data if transform is None else np.asarray(transform(data), dtype=dtype)
+
+    settings = _h5_io_settings(dset)
+    if 'compression' in io_settings:
+        settings.pop('compression_opts', None)
+    settings.update(io_settings)
+    data = ArrayBlockIterator(dset, block_size=block_size, transform=transform, dtype=dtype,
+                              chunk_shape=settings.get('chunks'))
+
+    return H5DataIO(data, **settings)
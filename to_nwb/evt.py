@@ -0,0 +1,446 @@
+"""Read and write Neuroscope event (.evt) files.
+
+An .evt file holds one event per line: a time in ms and a description,
+separated by a tab. Events with several time points, such as ripples, are
+stored as consecutive lines (e.g. start, peak, end), which is called a layout
+here. Files are parsed and formatted in bulk, never line by line in Python.
+
+`read_session_events` is the single entry point for all .evt files of a
+Neuroscope session: it finds them once, parses them in threads and caches the
+parsed arrays, so building AnnotationSeries and TimeIntervals from the same
+session does not parse anything twice.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+
+import numpy as np
+import pandas as pd
+from hdmf.common import VectorData
+from pynwb.epoch import TimeIntervals
+from pynwb.misc import AnnotationSeries
+from typing import Iterable, Optional, Union
+
+from .utils import natural_key
+
+
+EVT_LAYOUTS = {'ripple': ('start', 'peak', 'end'),
+               'noise': ('start', 'end')}
+
+# {evt file path: ((size, mtime), (times, descriptions))}
+_EVT_CACHE = {}
+
+
+def get_layout(layout: Union[str, Iterable[str]]):
+    """Return the event names of a layout.
+
+    Parameters
+    ----------
+    layout: str | Iterable(str)
+        a key of EVT_LAYOUTS, or the event names themselves
+
+    Returns
+    -------
+    tuple(str)
+
+    """
+    if isinstance(layout, str):
+        if layout not in EVT_LAYOUTS:
+            raise ValueError('unknown evt layout {}, choose from {}'.format(layout, tuple(EVT_LAYOUTS)))
+        return EVT_LAYOUTS[layout]
+    return tuple(layout)
+
+
+def read_evt(evt_file: str):
+    """Read all events of an .evt file.
+
+    Parameters
+    ----------
+    evt_file: str
+
+    Returns
+    -------
+    times: np.ndarray(dtype=float)
+        in ms
+    descriptions: np.ndarray(dtype=object)
+
+    """
+    try:
+        df = pd.read_csv(evt_file, sep='\t', names=('time', 'desc'),
+                         dtype={'time': float, 'desc': str}, skipinitialspace=True)
+    except pd.errors.EmptyDataError:
+        return np.empty(0), np.empty(0, dtype=object)
+
+    return df['time'].values, df['desc'].values.astype(object)
+
+
+def split_layout(times: np.ndarray, descriptions: np.ndarray,
+                 layout: Union[str, Iterable[str]]):
+    """Split interleaved multi-point events into one array per event name.
+
+    Parameters
+    ----------
+    times: np.ndarray
+    descriptions: np.ndarray
+    layout: str | Iterable(str)
+
+    Returns
+    -------
+    dict
+        {event name: np.ndarray of times}
+
+    """
+    names = get_layout(layout)
+    n_names = len(names)
+    if len(times) % n_names:
+        raise ValueError('{} events cannot be split into groups of {}'.format(len(times), names))
+    descriptions = np.asarray(descriptions, dtype=str).reshape(-1, n_names)
+    if not np.all(np.char.strip(descriptions) == np.array(names)):
+        raise ValueError('event descriptions do not follow the layout {}'.format(names))
+
+    times = np.asarray(times).reshape(-1, n_names)
+    return {name: times[:, i] for i, name in enumerate(names)}
+
+
+def read_evt_layout(evt_file: str, layout: Union[str, Iterable[str]]):
+    """Read an .evt file of multi-point events.
+
+    Parameters
+    ----------
+    evt_file: str
+    layout: str | Iterable(str)
+        'ripple', 'noise' or the event names in the order they are stored
+
+    Returns
+    -------
+    dict
+        {event name: np.ndarray of times in ms}
+
+    """
+    return split_layout(*read_evt(evt_file), layout)
+
+
+def format_evt(times: np.ndarray, descriptions: Union[str, np.ndarray]):
+    """Format events as .evt text.
+
+    Parameters
+    ----------
+    times: np.ndarray
+        in ms
+    descriptions: str | np.ndarray
+
+    Returns
+    -------
+    str
+
+    """
+    times = np.asarray(times, dtype=float).ravel()
+    if not len(times):
+        return ''
+    descriptions = np.broadcast_to(np.asarray(descriptions, dtype=str), times.shape)
+    lines = np.char.add(np.char.mod(' %0.1f\t', times), descriptions)
+
+    return '\n'.join(lines.tolist()) + '\n'
+
+
+def write_evt(evt_file: str, times: np.ndarray, descriptions: Union[str, np.ndarray],
+              mode: str = 'w'):
+    """Write events to an .evt file with a single write.
+
+    Parameters
+    ----------
+    evt_file: str
+    times: np.ndarray
+        in ms
+    descriptions: str | np.ndarray
+    mode: str, optional
+        'w' (default) to overwrite or 'a' to append
+
+    """
+    text = format_evt(times, descriptions)
+    with open(evt_file, mode) as f:
+        f.write(text)
+
+
+def write_evt_layout(evt_file: str, events: Union[dict, np.ndarray],
+                     layout: Union[str, Iterable[str]], mode: str = 'w'):
+    """Write multi-point events to an .evt file.
+
+    Parameters
+    ----------
+    evt_file: str
+    events: dict | np.ndarray
+        {event name: times in ms} or an array of shape (n_events, n_names)
+    layout: str | Iterable(str)
+    mode: str, optional
+
+    """
+    names = get_layout(layout)
+    if isinstance(events, dict):
+        events = np.column_stack([events[name] for name in names])
+    events = np.asarray(events, dtype=float).reshape(-1, len(names))
+    write_evt(evt_file, events.ravel(), np.tile(np.array(names), len(events)), mode=mode)
+
+
+def evt_to_annotation_series(name: str, times: np.ndarray, descriptions: np.ndarray):
+    """Build an AnnotationSeries from events read with `read_evt`.
+
+    Parameters
+    ----------
+    name: str
+    times: np.ndarray
+        in ms
+    descriptions: np.ndarray
+
+    Returns
+    -------
+    pynwb.misc.AnnotationSeries
+
+    """
+    return AnnotationSeries(name=name, data=descriptions, timestamps=np.asarray(times) / 1000)
+
+
+def evt_to_time_intervals(name: str, events: dict,
+                          layout: Union[str, Iterable[str]],
+                          description: Optional[str] = None):
+    """Build a TimeIntervals table from multi-point events in one step.
+
+    The first and last event names become start_time and stop_time; any
+    names in between become '<name>_time' columns.
+
+    Parameters
+    ----------
+    name: str
+    events: dict
+        {event name: times in ms}, as returned by `read_evt_layout`
+    layout: str | Iterable(str)
+    description: str, optional
+
+    Returns
+    -------
+    pynwb.epoch.TimeIntervals
+
+    """
+    names = get_layout(layout)
+    if description is None:
+        description = '{} events from Neuroscope'.format(name)
+
+    columns = [VectorData(name='start_time', description='Start time of event, in seconds',
+                          data=np.asarray(events[names[0]]) / 1000),
+               VectorData(name='stop_time', description='Stop time of event, in seconds',
+                          data=np.asarray(events[names[-1]]) / 1000)]
+    columns += [VectorData(name=point + '_time', description='{} time of event, in seconds'.format(point),
+                           data=np.asarray(events[point]) / 1000)
+                for point in names[1:-1]]
+
+    return TimeIntervals(name=name, description=description, columns=columns)
+
+
+def annotation_series_to_evt(evt_file: str, annotation_series: AnnotationSeries, mode: str = 'w'):
+    """Write an AnnotationSeries to an .evt file.
+
+    Parameters
+    ----------
+    evt_file: str
+    annotation_series: pynwb.misc.AnnotationSeries
+    mode: str, optional
+
+    """
+    times = np.asarray(annotation_series.timestamps[:]) * 1000
+    descriptions = np.asarray(annotation_series.data[:]).astype(str)
+    write_evt(evt_file, times, descriptions, mode=mode)
+
+
+def time_intervals_to_evt(evt_file: str, time_intervals: TimeIntervals,
+                          layout: Union[str, Iterable[str]], mode: str = 'w'):
+    """Write a TimeIntervals table made by `evt_to_time_intervals` to an .evt file.
+
+    Parameters
+    ----------
+    evt_file: str
+    time_intervals: pynwb.epoch.TimeIntervals
+    layout: str | Iterable(str)
+    mode: str, optional
+
+    """
+    names = get_layout(layout)
+    columns = ['start_time'] + [point + '_time' for point in names[1:-1]] + ['stop_time']
+    events = np.column_stack([np.asarray(time_intervals[col].data[:]) for col in columns]) * 1000
+    write_evt_layout(evt_file, events, names, mode=mode)
+
+
+def detect_layout(descriptions: np.ndarray, layouts: Optional[Iterable] = None,
+                  min_groups: int = 2):
+    """Find which multi-point layout the events of an .evt file follow, if any.
+
+    Only the given layouts are tried, so a file of unrelated single events
+    (e.g. lick, reward, tone on) is never taken for grouped events. A layout
+    matches when every group of consecutive events carries exactly its names,
+    in order, and there are at least `min_groups` groups.
+
+    Parameters
+    ----------
+    descriptions: np.ndarray
+    layouts: Iterable(str | Iterable(str)), optional
+        layouts to try, as keys of EVT_LAYOUTS or event names. Default is all
+        of EVT_LAYOUTS.
+    min_groups: int, optional
+        Default is 2.
+
+    Returns
+    -------
+    tuple(str) | None
+        event names of the matching layout, or None
+
+    """
+    if layouts is None:
+        layouts = EVT_LAYOUTS
+    descriptions = np.char.strip(np.asarray(descriptions, dtype=str))
+    for layout in layouts:
+        names = get_layout(layout)
+        n_names = len(names)
+        if n_names < 2 or len(descriptions) % n_names or len(descriptions) < n_names * min_groups:
+            continue
+        if np.all(descriptions.reshape(-1, n_names) == np.array(names)):
+            return names
+    return None
+
+
+def find_evt_files(session_path: str, suffixes: Optional[Iterable[str]] = None):
+    """Find the .evt files of a Neuroscope session and name their events.
+
+    Parameters
+    ----------
+    session_path: str
+    suffixes: Iterable(str), optional
+        e.g. ('.rip.evt',). If None, detect all in session_path
+
+    Returns
+    -------
+    dict
+        {event name: evt file path}, e.g. {'rip': '.../session.rip.evt'}
+
+    """
+    session_name = os.path.split(session_path)[1]
+
+    if suffixes is None:
+        evt_files = glob(os.path.join(session_path, session_name) + '.evt.*') + \
+                    glob(os.path.join(session_path, session_name) + '.*.evt')
+        evt_files = sorted(evt_files, key=natural_key)
+    else:
+        evt_files = [os.path.join(session_path, session_name + s)
+                     for s in suffixes]
+
+    out = {}
+    for evt_file in evt_files:
+        parts = os.path.split(evt_file)[1].split('.')
+        if parts[-1] == 'evt':
+            name = '.'.join(parts[1:-1])
+        else:
+            name = parts[-1]
+        out[name] = evt_file
+
+    return out
+
+
+def _read_evt_cached(evt_file: str):
+    stat = os.stat(evt_file)
+    key = (stat.st_size, stat.st_mtime_ns)
+    cached = _EVT_CACHE.get(evt_file)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    parsed = read_evt(evt_file)
+    _EVT_CACHE[evt_file] = (key, parsed)
+    return parsed
+
+
+def read_session_events(session_path: str, suffixes: Optional[Iterable[str]] = None,
+                        n_jobs: int = 8):
+    """Parse every .evt file of a session, in parallel and with caching.
+
+    Parsed arrays are cached per file and reused until the file changes on
+    disk.
+
+    Parameters
+    ----------
+    session_path: str
+    suffixes: Iterable(str), optional
+        If None, detect all in session_path
+    n_jobs: int, optional
+        number of threads. Default is 8.
+
+    Returns
+    -------
+    dict
+        {event name: (times in ms, descriptions)}. Files that do not exist
+        map to None.
+
+    """
+    evt_files = find_evt_files(session_path, suffixes)
+
+    def read_one(evt_file):
+        if not os.path.isfile(evt_file):
+            return None
+        return _read_evt_cached(evt_file)
+
+    if n_jobs > 1 and len(evt_files) > 1:
+        with ThreadPoolExecutor(min(n_jobs, len(evt_files))) as pool:
+            parsed = list(pool.map(read_one, evt_files.values()))
+    else:
+        parsed = [read_one(evt_file) for evt_file in evt_files.values()]
+
+    return dict(zip(evt_files, parsed))
+
+
+def clear_evt_cache():
+    """Drop all cached .evt parses."""
+    _EVT_CACHE.clear()
+
+
+def events_to_nwb(events: dict, kind: str = 'annotation', layouts: Optional[dict] = None):
+    """Build NWB objects from the output of `read_session_events`.
+
+    Parameters
+    ----------
+    events: dict
+        {event name: (times in ms, descriptions)}
+    kind: str, optional
+        'annotation': one AnnotationSeries per event file (default)
+        'intervals': one TimeIntervals per event file that follows a layout,
+                     and an AnnotationSeries for every other file
+        'both': AnnotationSeries for every file, plus a TimeIntervals named
+                '<name>_intervals' for each file that follows a layout
+    layouts: dict, optional
+        {event name: layout} for files whose layout is not in EVT_LAYOUTS.
+        Files are only read as TimeIntervals if they follow EVT_LAYOUTS or
+        the layout given here (see `detect_layout`).
+
+    Returns
+    -------
+    list
+
+    """
+    if kind not in ('annotation', 'intervals', 'both'):
+        raise ValueError("kind must be 'annotation', 'intervals' or 'both', got {}".format(kind))
+    if layouts is None:
+        layouts = {}
+
+    out = []
+    for name, parsed in events.items():
+        if parsed is None or not len(parsed[0]):
+            continue
+        times, descriptions = parsed
+        layout = None
+        if kind in ('intervals', 'both'):
+            candidates = list(EVT_LAYOUTS.values())
+            if name in layouts:
+                candidates.insert(0, layouts[name])
+            layout = detect_layout(descriptions, candidates)
+        if kind == 'both' or layout is None:
+            out.append(evt_to_annotation_series(name, times, descriptions))
+        if layout is not None:
+            intervals_name = name if kind == 'intervals' else name + '_intervals'
+            out.append(evt_to_time_intervals(
+                intervals_name, split_layout(times, descriptions, layout), layout))
+
+    return out
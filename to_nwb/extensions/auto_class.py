@@ -1,17 +1,81 @@
+import importlib
+import os
+import pickle
 import re
+import warnings
+from collections.abc import Iterable
 
 from hdmf.utils import docval
-from pynwb import __NS_CATALOG
+from pynwb import register_class
+from pynwb.core import MultiContainerInterface
 
-from pynwb.ecephys import *
-from pynwb.icephys import *
-from pynwb.file import *
-from pynwb.device import *
-from pynwb.misc import *
-from pynwb.ophys import *
-from pynwb.ogen import *
-from pynwb.retinotopy import *
-from pynwb.behavior import *
+try:
+    from pynwb import __NS_CATALOG
+except ImportError:
+    # newer pynwb keeps the namespace catalog only on its global type map
+    from pynwb import __TYPE_MAP
+    __NS_CATALOG = __TYPE_MAP.namespace_catalog
+
+
+# modules searched for the parents of extension types, imported on first use
+PYNWB_MODULES = ('pynwb.base', 'pynwb.core', 'pynwb.file', 'pynwb.device', 'pynwb.ecephys',
+                 'pynwb.icephys', 'pynwb.misc', 'pynwb.ophys', 'pynwb.ogen',
+                 'pynwb.retinotopy', 'pynwb.behavior', 'pynwb.image', 'pynwb.epoch')
+
+# {data_type: class} of the pynwb modules, filled on first use
+_PYNWB_CLASSES = {}
+
+# {(namespace, version, data_type): (docval args, __nwbfields__)}
+_SPEC_CACHE = {}
+
+# {(namespace, version, data_type): (class, init_pre, init_post)}
+_CLASS_CACHE = {}
+
+
+def _pynwb_classes():
+    if not _PYNWB_CLASSES:
+        for module_name in PYNWB_MODULES:
+            try:
+                module = importlib.import_module(module_name)
+            except ImportError:
+                continue
+            for name, obj in vars(module).items():
+                if isinstance(obj, type):
+                    _PYNWB_CLASSES.setdefault(name, obj)
+    return _PYNWB_CLASSES
+
+
+def _namespace_version(namespace):
+    return __NS_CATALOG.get_namespace(namespace).get('version')
+
+
+def find_class(namespace, data_type):
+    """Look up the class of a data type.
+
+    Generated classes of `namespace` come first, then the pynwb classes.
+    A type that is only defined in the spec of `namespace` is generated.
+
+    Parameters
+    ----------
+    namespace: str
+    data_type: str
+
+    Returns
+    -------
+    class
+
+    """
+    key = (namespace, _namespace_version(namespace), data_type)
+    if key in _CLASS_CACHE:
+        return _CLASS_CACHE[key][0]
+    classes = _pynwb_classes()
+    if data_type in classes:
+        return classes[data_type]
+    try:
+        __NS_CATALOG.get_spec(namespace, data_type)
+    except (KeyError, ValueError):
+        raise KeyError('no class for data type {} of namespace {}'.format(data_type, namespace))
+    return get_class(namespace, data_type)
 
 
 def attributes2docval(attributes, prefix):
@@ -52,7 +116,7 @@ def attributes2docval(attributes, prefix):
     return args_spec
 
 
-def spec2docval(spec, prefix=''):
+def spec2docval(spec, prefix='', namespace='core'):
     """
     Reads spec and automatically generates teh appropriate docval args for the
     constructor.
@@ -61,6 +125,8 @@ def spec2docval(spec, prefix=''):
     ----------
     spec: dict
     prefix: str
+    namespace: str
+        namespace in which the parent type is looked up, see `find_class`
 
     Returns
     -------
@@ -101,7 +167,8 @@ def spec2docval(spec, prefix=''):
 
     names = [x['name'] for x in args_spec]
     if 'neurodata_type_inc' in spec:
-        super_args = eval(spec['neurodata_type_inc']).__init__.__docval__['args']
+        parent = find_class(namespace, spec['neurodata_type_inc'])
+        super_args = parent.__init__.__docval__['args']
         for x in super_args:
             if x['name'] not in names:
                 args_spec.append(x)
@@ -169,15 +236,26 @@ def get_class(namespace, data_type, init_pre=lambda **kwargs: None,
     class
 
     """
-    spec = __NS_CATALOG.get_spec(namespace, data_type)
-    __nwbfields__ = spec2nwbfields(spec)
+    key = (namespace, _namespace_version(namespace), data_type)
+    if key in _CLASS_CACHE:
+        cls, cached_pre, cached_post = _CLASS_CACHE[key]
+        if cached_pre is init_pre and cached_post is init_post:
+            return cls
 
-    @docval(*spec2docval(spec))
+    spec = __NS_CATALOG.get_spec(namespace, data_type)
+    if key not in _SPEC_CACHE:
+        _SPEC_CACHE[key] = (spec2docval(spec, namespace=namespace), spec2nwbfields(spec))
+    docval_args, __nwbfields__ = _SPEC_CACHE[key]
+    parent = find_class(namespace, spec['neurodata_type_inc'])
+
+    # call the parent found here rather than super(type(self), self), which
+    # is the class of the instance and recurses for subclasses of this class
+    @docval(*docval_args)
     def __init__(self, **kwargs):
         init_pre(**kwargs)
-        super_args = [x['name'] for x in super(type(self), self).__init__.__docval__['args']]
-        super(type(self), self).__init__(**{arg: kwargs[arg] for arg in super_args
-                                            if arg in kwargs and kwargs[arg] is not None})
+        super_args = [x['name'] for x in parent.__init__.__docval__['args']]
+        parent.__init__(self, **{arg: kwargs[arg] for arg in super_args
+                                 if arg in kwargs and kwargs[arg] is not None})
         for attr, val in kwargs.items():
             try:
                 setattr(self, attr, val)
@@ -186,12 +264,62 @@ def get_class(namespace, data_type, init_pre=lambda **kwargs: None,
         init_post(**kwargs)
 
     d = {'__init__': __init__, '__nwbfields__': __nwbfields__}
-
-    cls = type(spec['neurodata_type_def'], (eval(spec['neurodata_type_inc']),), d)
+    cls = type(spec['neurodata_type_def'], (parent,), d)
     register_class(data_type, namespace,  cls)
+    _CLASS_CACHE[key] = (cls, init_pre, init_post)
     return cls
 
 
+def save_class_cache(path):
+    """
+    Save the docval args and __nwbfields__ of every class generated so far,
+    so that `load_class_cache` can skip reading the specs in a later session.
+    Entries whose defaults cannot be pickled are left out.
+
+    Parameters
+    ----------
+    path: str
+
+    """
+    entries = {}
+    for key, value in _SPEC_CACHE.items():
+        try:
+            pickle.dumps(value)
+        except (pickle.PicklingError, AttributeError, TypeError):
+            continue
+        entries[key] = value
+    with open(path, 'wb') as f:
+        pickle.dump(entries, f)
+
+
+def load_class_cache(path):
+    """
+    Load docval args and __nwbfields__ saved by `save_class_cache`. They are
+    used for any (namespace, version, data_type) they were saved for, so bump
+    the namespace version when its spec changes.
+
+    Parameters
+    ----------
+    path: str
+
+    Returns
+    -------
+    int
+        number of entries loaded
+
+    """
+    if not os.path.isfile(path):
+        return 0
+    try:
+        with open(path, 'rb') as f:
+            entries = pickle.load(f)
+    except Exception as e:
+        warnings.warn('could not load class cache {}: {}'.format(path, e))
+        return 0
+    _SPEC_CACHE.update(entries)
+    return len(entries)
+
+
 def camel2underscore(name):
     """
     Converts camelcase to underscore e.g. CamelCase -> camel_case
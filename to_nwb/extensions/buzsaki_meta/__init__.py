@@ -1 +1,5 @@
-from .buzsaki_meta import *
\ No newline at end of file
+from ..registry import lazy_module
+
+__all__ = ('BuzSubject', 'Histology', 'Probe', 'VirusInjection', 'VirusInjections',
+           'Surgery', 'Surgeries', 'Manipulation', 'Manipulations')
+__getattr__, __dir__ = lazy_module(__name__, '.buzsaki_meta', __all__)
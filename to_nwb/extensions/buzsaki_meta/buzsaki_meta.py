@@ -1,12 +1,9 @@
-from pynwb import load_namespaces
-
 from ..auto_class import get_class, get_multi_container
+from ..registry import load_namespace
 
 # load custom classes
 namespace = 'buzsaki_meta'
-ns_path = namespace + '.namespace.yaml'
-ext_source = namespace + '.extensions.yaml'
-load_namespaces(ns_path)
+load_namespace(namespace)
 
 BuzSubject = get_class(namespace, 'BuzSubject')
 Histology = get_class(namespace, 'Histology')
@@ -1 +1,4 @@
-from .ecog import *
+from ..registry import lazy_module
+
+__all__ = ('Surface', 'CorticalSurfaces', 'surface_init_add')
+__getattr__, __dir__ = lazy_module(__name__, '.ecog', __all__)
@@ -1,15 +1,11 @@
-import os
-
-from pynwb import load_namespaces
 from ..auto_class import get_class, get_multi_container
+from ..registry import load_namespace
 
 import numpy as np
 
-filepath = os.path.realpath(__file__)
-basedir = os.path.split(filepath)[0]
 name = 'ecog'
 
-load_namespaces(os.path.join(basedir, name + '.namespace.yaml'))
+load_namespace(name)
 
 
 def surface_init_add(faces, vertices, **kwargs):
@@ -1 +1,4 @@
-from .general import *
\ No newline at end of file
+from ..registry import lazy_module
+
+__all__ = ('CatCellInfo',)
+__getattr__, __dir__ = lazy_module(__name__, '.general', __all__)
@@ -1,13 +1,9 @@
-import os
-
-from pynwb import load_namespaces
 from ..auto_class import get_class
+from ..registry import load_namespace
 
-filepath = os.path.realpath(__file__)
-basedir = os.path.split(filepath)[0]
 name = 'general'
 
-load_namespaces(os.path.join(basedir, name + '.namespace.yaml'))
+load_namespace(name)
 
 
 CatCellInfo = get_class(name, 'CatCellInfo')
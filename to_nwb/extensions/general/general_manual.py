@@ -1,16 +1,16 @@
-from collections import Iterable
+from collections.abc import Iterable
 
-from pynwb import load_namespaces, register_class, TimeSeries, register_map
+from pynwb import register_class, TimeSeries, register_map
 from pynwb.core import NWBDataInterface
 from hdmf.utils import docval, getargs, popargs, fmt_docval_args
 from hdmf.data_utils import AbstractDataChunkIterator, DataIO
 from hdmf.build import ObjectMapper
 
+from ..registry import load_namespace
+
 # load custom classes
 name = 'general'
-ns_path = name + '.namespace.yaml'
-ext_source = name + '.extensions.yaml'
-load_namespaces(ns_path)
+load_namespace(name)
 
 
 @register_class('CatCellInfo', name)
@@ -0,0 +1,116 @@
+"""Load extension namespaces the first time one of their types is used.
+
+Importing an extension package does not load its namespace or generate its
+classes. Each package names the attributes it provides with `lazy_module`,
+and the module that defines them (which loads the namespace and builds the
+classes) is imported on first access of any of them. `load_namespace`
+loads a namespace once per session, from the yaml next to its package, and
+`extension_class` gets a single type without importing its package.
+pynwb itself is only imported once a namespace is loaded.
+"""
+import importlib
+import os
+import sys
+
+EXTENSIONS_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# {namespace: path of the namespace yaml it was loaded from}
+_LOADED = {}
+
+
+def namespace_path(namespace):
+    """Path of the namespace yaml of an extension in to_nwb.extensions.
+
+    Parameters
+    ----------
+    namespace: str
+
+    Returns
+    -------
+    str
+
+    """
+    return os.path.join(EXTENSIONS_DIR, namespace, namespace + '.namespace.yaml')
+
+
+def load_namespace(namespace, path=None):
+    """Load an extension namespace, unless it was loaded before.
+
+    Parameters
+    ----------
+    namespace: str
+    path: str, optional
+        namespace yaml. Default is `namespace_path(namespace)`.
+
+    Returns
+    -------
+    str
+        path the namespace was loaded from
+
+    """
+    if namespace not in _LOADED:
+        from pynwb import load_namespaces
+
+        if path is None:
+            path = namespace_path(namespace)
+        load_namespaces(path)
+        _LOADED[namespace] = path
+    return _LOADED[namespace]
+
+
+def extension_class(namespace, data_type):
+    """Class of an extension type, loading its namespace if needed.
+
+    Parameters
+    ----------
+    namespace: str
+    data_type: str
+
+    Returns
+    -------
+    class
+
+    """
+    from .auto_class import find_class
+
+    load_namespace(namespace)
+    return find_class(namespace, data_type)
+
+
+def lazy_module(package, module, names):
+    """Module-level __getattr__ and __dir__ that import `module` on first use.
+
+    Use in the __init__ of an extension package:
+
+        __all__ = ('Surface', 'CorticalSurfaces')
+        __getattr__, __dir__ = lazy_module(__name__, '.ecog', __all__)
+
+    Parameters
+    ----------
+    package: str
+        name of the package
+    module: str
+        module defining the attributes, relative to `package`
+    names: iterable(str)
+        attributes provided by `module`
+
+    Returns
+    -------
+    __getattr__: function
+    __dir__: function
+
+    """
+    names = frozenset(names)
+
+    def __getattr__(name):
+        if name not in names:
+            raise AttributeError('module {!r} has no attribute {!r}'.format(package, name))
+        value = getattr(importlib.import_module(module, package), name)
+        # later lookups find the attribute without calling __getattr__
+        setattr(sys.modules[package], name, value)
+        return value
+
+    def __dir__():
+        return sorted(names | set(vars(sys.modules[package])))
+
+    return __getattr__, __dir__
@@ -0,0 +1,29 @@
+from pynwb import load_namespaces
+from pynwb.spec import NWBAttributeSpec, NWBGroupSpec, NWBNamespaceBuilder
+
+from to_nwb.extensions.auto_class import get_class
+
+
+def test_child_of_generated_parent(tmp_path):
+    # BaseThing is only defined in the spec, so get_class generates it as
+    # the parent of ChildThing
+    namespace = 'auto_class_two_level'
+    builder = NWBNamespaceBuilder('two generated levels', namespace, version='0.1.0')
+    builder.include_type('NWBDataInterface', namespace='core')
+    base = NWBGroupSpec(neurodata_type_def='BaseThing', neurodata_type_inc='NWBDataInterface',
+                        doc='generated parent',
+                        attributes=[NWBAttributeSpec(name='foo', doc='foo', dtype='text')])
+    child = NWBGroupSpec(neurodata_type_def='ChildThing', neurodata_type_inc='BaseThing',
+                         doc='generated child',
+                         attributes=[NWBAttributeSpec(name='bar', doc='bar', dtype='int')])
+    for spec in (base, child):
+        builder.add_spec(namespace + '.extensions.yaml', spec)
+    builder.export(namespace + '.namespace.yaml', outdir=str(tmp_path))
+    load_namespaces(str(tmp_path / (namespace + '.namespace.yaml')))
+
+    ChildThing = get_class(namespace, 'ChildThing')
+    BaseThing = get_class(namespace, 'BaseThing')
+    assert issubclass(ChildThing, BaseThing)
+
+    thing = ChildThing(name='thing', foo='x', bar=3)
+    assert (thing.name, thing.foo, thing.bar) == ('thing', 'x', 3)
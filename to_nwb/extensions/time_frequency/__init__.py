@@ -1 +1,4 @@
-from .time_frequency import *
+from ..registry import lazy_module
+
+__all__ = ('HilbertSeries',)
+__getattr__, __dir__ = lazy_module(__name__, '.time_frequency', __all__)
@@ -0,0 +1,145 @@
+"""Content hashes of large source files, for keying conversion caches.
+
+Files are hashed in large blocks (or through an mmap) so that memory use
+does not depend on file size. The quick mode hashes only the file size and
+its first and last blocks, which is enough to tell apart recordings for a
+cache key at a tiny fraction of the cost. Hashes are remembered for the
+session, keyed by (path, size, mtime). Full hashes are also stored in a
+JSON sidecar next to the file, so a file is hashed once until it changes.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import warnings
+
+
+# {(abspath, size, mtime_ns, mode): hex digest}
+_HASH_CACHE = {}
+
+QUICK_BLOCK_SIZE = 2 ** 20
+
+
+def _sidecar_path(filename):
+    return filename + '.hashes.json'
+
+
+def _hash_stream(f, h, block_size):
+    buf = bytearray(block_size)
+    view = memoryview(buf)
+    while True:
+        n = f.readinto(buf)
+        if not n:
+            break
+        h.update(view[:n])
+
+
+def _hash_mmap(f, h, block_size):
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        view = memoryview(m)
+        try:
+            for start in range(0, len(m), block_size):
+                h.update(view[start:start + block_size])
+        finally:
+            view.release()
+
+
+def _hash_quick(f, h, size, block_size):
+    h.update(struct.pack('<Q', size))
+    h.update(f.read(block_size))
+    if size > block_size:
+        f.seek(max(block_size, size - block_size))
+        h.update(f.read(block_size))
+
+
+def _read_sidecar(filename, stat):
+    try:
+        with open(_sidecar_path(filename), 'r') as f:
+            sidecar = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if [sidecar.get('size'), sidecar.get('mtime_ns')] != [stat.st_size, stat.st_mtime_ns]:
+        return {}
+    return sidecar.get('hashes', {})
+
+
+def _write_sidecar(filename, stat, hashes):
+    # write to a temporary file and rename it, so that concurrent readers
+    # never see a partly written sidecar
+    path = _sidecar_path(filename)
+    try:
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'path': os.path.abspath(filename), 'size': stat.st_size,
+                           'mtime_ns': stat.st_mtime_ns, 'hashes': hashes}, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    except OSError as e:
+        warnings.warn('could not cache hash of {}: {}'.format(filename, e))
+
+
+def file_hash(filename, algorithm='sha1', quick=False, use_mmap=False, block_size=2 ** 24,
+              cache=True):
+    """Hex digest of a file, read in blocks.
+
+    Parameters
+    ----------
+    filename: str
+    algorithm: str, optional
+        any hashlib algorithm. Default is 'sha1', which gives the same
+        digests as earlier versions; 'blake2b' is faster on large files.
+    quick: bool, optional
+        hash only the size and the first and last MB. Default is False.
+    use_mmap: bool, optional
+        read the file through an mmap instead of into a buffer. Default is
+        False.
+    block_size: int, optional
+        bytes hashed per read. Default is 16 MB.
+    cache: bool, optional
+        look up and store the digest in the session cache and, unless
+        `quick`, in the sidecar file `filename + '.hashes.json'`. Default
+        is True.
+
+    Returns
+    -------
+    str
+
+    """
+    stat = os.stat(filename)
+    mode = algorithm + ('-quick' if quick else '')
+    key = (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns, mode)
+    if cache:
+        if key in _HASH_CACHE:
+            return _HASH_CACHE[key]
+        # reading the sidecar costs about as much as a quick hash
+        hashes = {} if quick else _read_sidecar(filename, stat)
+        if mode in hashes:
+            _HASH_CACHE[key] = hashes[mode]
+            return hashes[mode]
+
+    h = hashlib.new(algorithm)
+    with open(filename, 'rb', buffering=0) as f:
+        if quick:
+            _hash_quick(f, h, stat.st_size, QUICK_BLOCK_SIZE)
+        elif use_mmap and stat.st_size:
+            _hash_mmap(f, h, block_size)
+        else:
+            _hash_stream(f, h, block_size)
+    digest = h.hexdigest()
+
+    if cache:
+        _HASH_CACHE[key] = digest
+        if not quick:
+            hashes[mode] = digest
+            _write_sidecar(filename, stat, hashes)
+    return digest
+
+
+def clear_hash_cache():
+    """Forget hashes computed in this session (sidecar files are kept)."""
+    _HASH_CACHE.clear()
@@ -0,0 +1,270 @@
+"""Lazy ingest of imaging stacks stored in HDF5.
+
+Imaging data is often stored with a different axis order than NWB expects
+(e.g. t, z, y, x, c instead of one t, x, y, z series per channel).
+`AxisView` presents an h5py dataset with its axes permuted and some axes
+fixed (e.g. the channel), reading only the requested part of the source on
+each access. `imaging_data` wraps such a view in a block iterator aligned to
+the source chunking, so a multi-hour recording is copied into NWB with
+bounded memory.
+
+ROI masks are kept sparse: the coordinates of all ROIs are gathered into
+one pixel_mask or voxel_mask ragged column, and the PlaneSegmentation is
+built from that column directly.
+"""
+import numpy as np
+from hdmf.backends.hdf5.h5_utils import H5DataIO
+from hdmf.common import VectorData, VectorIndex, ElementIdentifiers
+from pynwb.ophys import PlaneSegmentation
+
+from to_nwb.data_iterators import ArrayBlockIterator
+from to_nwb.utils import ragged_index
+
+
+class AxisView(object):
+    """Read-only view of an array with permuted axes and optionally fixed indices.
+
+    Parameters
+    ----------
+    data: array-like
+        e.g. an h5py dataset
+    order: tuple(int)
+        source axis of each axis of the view, e.g. (0, 3, 2, 1) for
+        t, z, y, x -> t, x, y, z. Default is the source order without the
+        fixed axes.
+    fixed: dict, optional
+        {source axis: index} of axes to drop, e.g. {4: channel}
+
+    """
+
+    def __init__(self, data, order=None, fixed=None):
+        self.data = data
+        self.fixed = {int(axis): int(index) for axis, index in (fixed or {}).items()}
+        free = [axis for axis in range(len(data.shape)) if axis not in self.fixed]
+        self.order = tuple(free) if order is None else tuple(int(axis) for axis in order)
+        if sorted(self.order) != free:
+            raise ValueError('order {} must list every source axis except {}'.format(
+                self.order, sorted(self.fixed)))
+        self.shape = tuple(int(data.shape[axis]) for axis in self.order)
+        self.dtype = np.dtype(data.dtype)
+        source_chunks = getattr(data, 'chunks', None)
+        self.chunks = None
+        if source_chunks is not None:
+            self.chunks = tuple(source_chunks[axis] for axis in self.order)
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            i = key.index(Ellipsis)
+            key = key[:i] + (slice(None),) * (self.ndim - len(key) + 1) + key[i + 1:]
+        key = key + (slice(None),) * (self.ndim - len(key))
+
+        source_key = [slice(None)] * len(self.data.shape)
+        for axis, index in self.fixed.items():
+            source_key[axis] = index
+        for axis, k in zip(self.order, key):
+            source_key[axis] = k
+        out = np.asarray(self.data[tuple(source_key)])
+
+        # axes of `out` are the source axes that were not indexed by an int, in source order
+        kept = [axis for axis in range(len(self.data.shape))
+                if not isinstance(source_key[axis], (int, np.integer))]
+        return np.transpose(out, [kept.index(axis) for axis in self.order if axis in kept])
+
+
+def imaging_data(data, order=None, fixed=None, block_size=None, **io_settings):
+    """Wrap (part of) an imaging dataset so that it is written block by block.
+
+    Parameters
+    ----------
+    data: array-like
+        e.g. an h5py dataset, with time on axis 0
+    order: tuple(int), optional
+        see `AxisView`. Time must stay first.
+    fixed: dict, optional
+        see `AxisView`
+    block_size: int, optional
+        frames per block. Default is a whole number of source chunks of
+        about 64 MB.
+    io_settings:
+        H5DataIO arguments, e.g. compression='gzip'. By default the output
+        uses the (permuted) chunk shape of the source.
+
+    Returns
+    -------
+    hdmf.backends.hdf5.h5_utils.H5DataIO
+
+    """
+    view = AxisView(data, order=order, fixed=fixed)
+    if view.order[0] != 0:
+        raise ValueError('time (source axis 0) must stay the first axis')
+    io_settings.setdefault('chunks', view.chunks)
+    if io_settings['chunks'] is None:
+        del io_settings['chunks']
+
+    return H5DataIO(ArrayBlockIterator(view, block_size=block_size,
+                                       chunk_shape=io_settings.get('chunks')), **io_settings)
+
+
+def split_channels(data, channel_axis=-1, order=None, block_size=None, **io_settings):
+    """One block-wise writable dataset per channel of an imaging dataset.
+
+    Each channel is read on its own, so the other channels are never held in
+    memory.
+
+    Parameters
+    ----------
+    data: array-like
+    channel_axis: int, optional
+        Default is the last axis
+    order: tuple(int), optional
+        order of the remaining source axes, see `AxisView`
+    block_size: int, optional
+    io_settings:
+        H5DataIO arguments
+
+    Returns
+    -------
+    list(hdmf.backends.hdf5.h5_utils.H5DataIO)
+
+    """
+    channel_axis = channel_axis % len(data.shape)
+    return [imaging_data(data, order=order, fixed={channel_axis: c}, block_size=block_size,
+                         **io_settings)
+            for c in range(data.shape[channel_axis])]
+
+
+PIXEL_MASK_DTYPE = np.dtype([('x', np.uint32), ('y', np.uint32), ('weight', np.float32)])
+VOXEL_MASK_DTYPE = np.dtype([('x', np.uint32), ('y', np.uint32), ('z', np.uint32),
+                             ('weight', np.float32)])
+
+
+def sparse_voxel_mask(planes):
+    """Voxel mask of one ROI from one sparse (y, x) matrix per plane.
+
+    Parameters
+    ----------
+    planes: list(scipy.sparse matrix)
+        e.g. the `mask` of a SIMA ROI
+
+    Returns
+    -------
+    np.ndarray(dtype=VOXEL_MASK_DTYPE)
+
+    """
+    coos = [plane.tocoo() for plane in planes]
+    out = np.empty(sum(coo.nnz for coo in coos), dtype=VOXEL_MASK_DTYPE)
+    start = 0
+    for z, coo in enumerate(coos):
+        stop = start + coo.nnz
+        out['x'][start:stop] = coo.col
+        out['y'][start:stop] = coo.row
+        out['z'][start:stop] = z
+        out['weight'][start:stop] = coo.data
+        start = stop
+
+    return out
+
+
+def sparse_roi_masks(rois, ndim=3):
+    """Ragged pixel or voxel masks of many ROIs given as sparse matrices.
+
+    Parameters
+    ----------
+    rois: list(list(scipy.sparse matrix))
+        one sparse (y, x) matrix per plane for each ROI
+    ndim: int, optional
+        3 for voxel masks (default), 2 for pixel masks of single-plane ROIs
+
+    Returns
+    -------
+    data: np.ndarray(dtype=VOXEL_MASK_DTYPE or PIXEL_MASK_DTYPE)
+    index: np.ndarray(dtype=uint64)
+        end offset of each ROI in data
+
+    """
+    masks = [sparse_voxel_mask(planes) for planes in rois]
+    data = np.concatenate(masks) if masks else np.empty(0, dtype=VOXEL_MASK_DTYPE)
+    index = ragged_index([len(mask) for mask in masks])
+    if ndim == 2:
+        if data.size and data['z'].any():
+            raise ValueError('ROIs span more than one plane, use voxel masks')
+        data = _drop_z(data)
+
+    return data, index
+
+
+def dense_roi_masks(images, threshold=0):
+    """Ragged pixel masks of ROIs given as dense images.
+
+    Parameters
+    ----------
+    images: np.ndarray
+        (n_rois, x, y)
+    threshold: float, optional
+        pixels above this value belong to the ROI. Default is 0.
+
+    Returns
+    -------
+    data: np.ndarray(dtype=PIXEL_MASK_DTYPE)
+    index: np.ndarray(dtype=uint64)
+
+    """
+    images = np.asarray(images)
+    roi, x, y = np.nonzero(images > threshold)
+    data = np.empty(len(roi), dtype=PIXEL_MASK_DTYPE)
+    data['x'] = x
+    data['y'] = y
+    data['weight'] = images[roi, x, y]
+
+    return data, ragged_index(np.bincount(roi, minlength=len(images)))
+
+
+def _drop_z(voxels):
+    out = np.empty(len(voxels), dtype=PIXEL_MASK_DTYPE)
+    for field in PIXEL_MASK_DTYPE.names:
+        out[field] = voxels[field]
+    return out
+
+
+def build_plane_segmentation(mask_data, mask_index, imaging_plane, name='PlaneSegmentation',
+                             description='ROIs', reference_images=None, ids=None):
+    """Build a PlaneSegmentation from ragged masks in one go, instead of one add_roi per ROI.
+
+    Parameters
+    ----------
+    mask_data: np.ndarray(dtype=PIXEL_MASK_DTYPE or VOXEL_MASK_DTYPE)
+    mask_index: array-like
+        end offset of each ROI in mask_data
+    imaging_plane: pynwb.ophys.ImagingPlane
+    name: str, optional
+    description: str, optional
+    reference_images: ImageSeries, optional
+    ids: array-like, optional
+        Default is 0..n_rois-1
+
+    Returns
+    -------
+    pynwb.ophys.PlaneSegmentation
+
+    """
+    column = 'voxel_mask' if 'z' in mask_data.dtype.names else 'pixel_mask'
+    if ids is None:
+        ids = np.arange(len(mask_index))
+
+    # as in build_units_table, the VectorIndex goes before its target
+    mask = VectorData(name=column, description='{}s for each ROI'.format(column.replace('_', ' ')),
+                      data=mask_data)
+    columns = [VectorIndex(name=column + '_index', data=mask_index, target=mask), mask]
+
+    return PlaneSegmentation(description=description, imaging_plane=imaging_plane, name=name,
+                             reference_images=reference_images,
+                             id=ElementIdentifiers(name='id', data=ids), columns=columns)
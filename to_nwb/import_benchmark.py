@@ -0,0 +1,118 @@
+"""Measure how long it takes to import to_nwb modules.
+
+Each module is imported in a fresh interpreter with `python -X importtime`,
+so every measurement includes the module's own dependencies and nothing is
+already cached by an earlier import. The report lists the total import time
+of each module and the slowest packages it pulls in.
+
+    python -m to_nwb.import_benchmark to_nwb.chang.chang2nwb to_nwb.extensions.ecog
+"""
+import argparse
+import re
+import subprocess
+import sys
+
+DEFAULT_MODULES = ('to_nwb.utils', 'to_nwb.extensions.auto_class', 'to_nwb.extensions.ecog',
+                   'to_nwb.extensions.general', 'to_nwb.extensions.time_frequency',
+                   'to_nwb.mworks.events', 'to_nwb.movshon.blackrock')
+
+_IMPORTTIME = re.compile(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def import_times(module, python=sys.executable):
+    """Import `module` in a new interpreter and parse its -X importtime report.
+
+    Parameters
+    ----------
+    module: str
+    python: str, optional
+        interpreter to run. Default is the current one.
+
+    Returns
+    -------
+    list(tuple(str, int, int, int))
+        (module, self us, cumulative us, nesting depth) of every module
+        imported, in the order the imports finished
+
+    Raises
+    ------
+    ImportError
+        if `module` cannot be imported
+
+    """
+    result = subprocess.run([python, '-X', 'importtime', '-c', 'import ' + module],
+                            stderr=subprocess.PIPE, universal_newlines=True)
+    times = []
+    errors = []
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            times.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+        else:
+            errors.append(line)
+    if result.returncode:
+        raise ImportError('could not import {}:\n{}'.format(module, '\n'.join(errors)))
+    return times
+
+
+def benchmark(module, repeat=3, top=5, python=sys.executable):
+    """Import time of a module, best of several fresh interpreters.
+
+    Parameters
+    ----------
+    module: str
+    repeat: int, optional
+        number of interpreters to run. Default is 3.
+    top: int, optional
+        number of slowest packages to report. Default is 5.
+    python: str, optional
+
+    Returns
+    -------
+    total: float
+        cumulative import time of `module` in s
+    slowest: list(tuple(str, float))
+        (package, cumulative s) of the slowest top-level packages imported
+        in the best run, other than the package of `module` and the modules
+        every interpreter imports at startup
+
+    """
+    best = None
+    for _ in range(repeat):
+        times = import_times(module, python=python)
+        total = max(cumulative for name, _, cumulative, _ in times if name == module)
+        if best is None or total < best[0]:
+            best = (total, times)
+    total, times = best
+    startup = {name for name, _, _, _ in import_times('sys', python=python)}
+    package = module.split('.')[0]
+    outside = [(name, cumulative) for name, _, cumulative, _ in times
+               if '.' not in name and name != package and name not in startup]
+    slowest = sorted(outside, key=lambda x: -x[1])[:top]
+    return total / 1e6, [(name, cumulative / 1e6) for name, cumulative in slowest]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='report the import time of to_nwb modules')
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES,
+                        help='modules to import. Default is a set of converters and extensions.')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='fresh interpreters per module, the best is reported')
+    parser.add_argument('-t', '--top', type=int, default=5,
+                        help='number of slowest packages to list per module')
+    args = parser.parse_args()
+
+    for module in args.modules:
+        try:
+            total, slowest = benchmark(module, repeat=args.repeat, top=args.top)
+        except ImportError as e:
+            print('{:<40} failed: {}'.format(module, str(e).splitlines()[-1]))
+            continue
+        print('{:<40} {:8.3f} s'.format(module, total))
+        for name, cumulative in slowest:
+            print('    {:<36} {:8.3f} s'.format(name, cumulative))
+
+
+if __name__ == '__main__':
+    main()
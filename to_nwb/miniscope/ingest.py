@@ -0,0 +1,197 @@
+"""Index a Miniscope session: timestamps of every camera and frames of every AVI.
+
+timestamp.dat is parsed once and split by camera in one groupby. The frame
+count of each AVI is read from its RIFF header (the OpenDML 'dmlh' chunk,
+the video stream header or the main 'avih' header), so no frame is decoded,
+and the files are probed in a thread pool. The counts give the
+`starting_frame` of each file in an externally linked ImageSeries.
+"""
+import os
+import struct
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+
+import numpy as np
+import pandas as pd
+from pynwb.image import ImageSeries
+
+from to_nwb.utils import natural_key
+
+
+def load_timestamps(fpath):
+    """Read the timestamps of all cameras of a session.
+
+    Parameters
+    ----------
+    fpath: str
+        timestamp.dat or the session directory containing it
+
+    Returns
+    -------
+    dict
+        {camNum: timestamps in s, relative to the first frame of that camera}
+
+    """
+    if not fpath[-4:] == '.dat':
+        fpath = os.path.join(fpath, 'timestamp.dat')
+    df = pd.read_csv(fpath, sep='\t', usecols=['camNum', 'sysClock'])
+
+    out = {}
+    for cam_num, df_cam in df.groupby('camNum', sort=True):
+        tt = df_cam['sysClock'].values / 1000
+        tt[0] = 0
+        out[int(cam_num)] = tt
+
+    return out
+
+
+def _iter_chunks(buf, start, stop):
+    # (fourcc, list type or None, data start, data stop) of the RIFF chunks in buf[start:stop]
+    pos = start
+    while pos + 8 <= stop:
+        fourcc, size = struct.unpack_from('<4sI', buf, pos)
+        data_start, data_stop = pos + 8, min(pos + 8 + size, stop)
+        if fourcc == b'LIST':
+            yield fourcc, buf[data_start:data_start + 4], data_start + 4, data_stop
+        else:
+            yield fourcc, None, data_start, data_stop
+        pos = data_start + size + (size & 1)
+
+
+def read_avi_header(path):
+    """Read the frame count and frame size of an AVI file from its header.
+
+    Parameters
+    ----------
+    path: str
+
+    Returns
+    -------
+    dict
+        n_frames, width, height
+
+    """
+    with open(path, 'rb') as f:
+        riff, _, form = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or form != b'AVI ':
+            raise ValueError('{} is not an AVI file'.format(path))
+        fourcc, size = struct.unpack('<4sI', f.read(8))
+        if fourcc != b'LIST' or f.read(4) != b'hdrl':
+            raise ValueError('{} has no AVI header list'.format(path))
+        hdrl = f.read(size - 4)
+
+    fields = {}
+
+    def walk(start, stop):
+        for fourcc, list_type, data_start, data_stop in _iter_chunks(hdrl, start, stop):
+            if list_type is not None:
+                walk(data_start, data_stop)
+            elif fourcc == b'avih' and data_stop - data_start >= 40:
+                fields.setdefault('avih', struct.unpack_from('<I', hdrl, data_start + 16)[0])
+                fields.setdefault('width', struct.unpack_from('<I', hdrl, data_start + 32)[0])
+                # negative for top-down frames
+                fields.setdefault('height', abs(struct.unpack_from('<i', hdrl, data_start + 36)[0]))
+            elif fourcc == b'strh' and data_stop - data_start >= 36:
+                if hdrl[data_start:data_start + 4] == b'vids':
+                    fields.setdefault('strh', struct.unpack_from('<I', hdrl, data_start + 32)[0])
+            elif fourcc == b'dmlh' and data_stop - data_start >= 4:
+                fields.setdefault('dmlh', struct.unpack_from('<I', hdrl, data_start)[0])
+
+    walk(0, len(hdrl))
+    n_frames = next((fields[key] for key in ('dmlh', 'strh', 'avih') if fields.get(key)), 0)
+
+    return {'n_frames': int(n_frames), 'width': int(fields.get('width', 0)),
+            'height': int(fields.get('height', 0))}
+
+
+def avi_frame_count(path):
+    """Number of frames of an AVI file, read from its header.
+
+    Parameters
+    ----------
+    path: str
+
+    Returns
+    -------
+    int
+
+    """
+    return read_avi_header(path)['n_frames']
+
+
+def probe_frame_counts(paths, n_jobs=8):
+    """Frame count of each AVI file, probed concurrently.
+
+    Parameters
+    ----------
+    paths: list(str)
+    n_jobs: int, optional
+        Default is 8
+
+    Returns
+    -------
+    np.ndarray(dtype=int)
+
+    """
+    paths = list(paths)
+    if n_jobs > 1 and len(paths) > 1:
+        with ThreadPoolExecutor(min(n_jobs, len(paths))) as pool:
+            counts = list(pool.map(avi_frame_count, paths))
+    else:
+        counts = [avi_frame_count(path) for path in paths]
+
+    return np.array(counts, dtype=int)
+
+
+def starting_frames(frame_counts):
+    """Index of the first frame of each file in the concatenated video.
+
+    Parameters
+    ----------
+    frame_counts: array-like(dtype=int)
+
+    Returns
+    -------
+    np.ndarray(dtype=int)
+
+    """
+    return np.concatenate(([0], np.cumsum(frame_counts)[:-1])).astype(int)
+
+
+def find_videos(data_dir, prefix):
+    """AVI files of one camera in natural order, e.g. prefix='msCam'."""
+    return sorted(glob(os.path.join(data_dir, prefix + '*.avi')), key=natural_key)
+
+
+def external_image_series(name, paths, timestamps, n_jobs=8, **kwargs):
+    """ImageSeries linking AVI files, with the correct starting frame of each.
+
+    Parameters
+    ----------
+    name: str
+    paths: list(str)
+        AVI files in order. They are linked by file name, relative to the
+        NWB file.
+    timestamps: np.ndarray
+        one per frame of all files together
+    n_jobs: int, optional
+        number of files probed concurrently
+    kwargs:
+        passed to ImageSeries
+
+    Returns
+    -------
+    pynwb.image.ImageSeries
+
+    """
+    frame_counts = probe_frame_counts(paths, n_jobs=n_jobs)
+    if frame_counts.sum() != len(timestamps):
+        warnings.warn('{}: {} frames in {} files but {} timestamps'.format(
+            name, frame_counts.sum(), len(paths), len(timestamps)))
+
+    return ImageSeries(name=name, format='external',
+                       external_file=[os.path.split(path)[1] for path in paths],
+                       timestamps=timestamps,
+                       starting_frame=starting_frames(frame_counts),
+                       **kwargs)
@@ -4,23 +4,14 @@ from ndx_miniscope import Miniscope
 from pynwb import NWBFile, NWBHDF5IO
 from datetime import datetime
 from dateutil.tz import tzlocal
-from pynwb.image import ImageSeries
-from natsort import natsorted
-from glob import glob
 
-
-def load_miniscope_timestamps(fpath, cam_num=1):
-    if not fpath[-4:] == '.dat':
-        fpath = os.path.join(fpath, 'timestamp.dat')
-    df = pd.read_csv(fpath, sep='\t')
-    df_cam = df[df['camNum'] == cam_num]
-    tt = df_cam['sysClock'].values/1000
-    tt[0] = 0
-
-    return tt
+from to_nwb.miniscope.ingest import load_timestamps, find_videos, external_image_series
+from to_nwb.miniscope.video import embedded_image_series
 
 
 data_dir = '/Volumes/black_backup/data/Soltesz/example_miniscope'
+# copy the frames into the NWB file instead of linking the AVI files
+EMBED_VIDEO = False
 
 settings_and_notes_file = os.path.join(data_dir, 'settings_and_notes.dat')
 
@@ -36,31 +27,27 @@ miniscope = Miniscope(name='Miniscope', excitation=int(df['excitation']),
 
 nwb.add_device(miniscope)
 
-ms_files = [os.path.split(x)[1] for x in
-            natsorted(glob(os.path.join(data_dir, 'msCam*.avi')))]
+# timestamp.dat is read once for both cameras
+timestamps = load_timestamps(data_dir)
 
-behav_files = [os.path.split(x)[1] for x in
-               natsorted(glob(os.path.join(data_dir, 'behavCam*.avi')))]
+if EMBED_VIDEO:
+    nwb.add_acquisition(
+        embedded_image_series('OnePhotonSeries', find_videos(data_dir, 'msCam'), timestamps[1],
+                              chunking='time')
+    )
 
-nwb.add_acquisition(
-    ImageSeries(
-        name='OnePhotonSeries',
-        format='external',
-        external_file=ms_files,
-        timestamps=load_miniscope_timestamps(data_dir),
-        starting_frame=[0] * len(ms_files)
+    nwb.add_acquisition(
+        embedded_image_series('behaviorCam', find_videos(data_dir, 'behavCam'), timestamps[2],
+                              gray=False)
+    )
+else:
+    nwb.add_acquisition(
+        external_image_series('OnePhotonSeries', find_videos(data_dir, 'msCam'), timestamps[1])
     )
-)
 
-nwb.add_acquisition(
-    ImageSeries(
-        name='behaviorCam',
-        format='external',
-        external_file=behav_files,
-        timestamps=load_miniscope_timestamps(data_dir, cam_num=2),
-        starting_frame=[0] * len(behav_files)
+    nwb.add_acquisition(
+        external_image_series('behaviorCam', find_videos(data_dir, 'behavCam'), timestamps[2])
     )
-)
 
 save_path = os.path.join(data_dir, 'test_out.nwb')
 with NWBHDF5IO(save_path, 'w') as io:
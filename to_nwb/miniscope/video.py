@@ -0,0 +1,196 @@
+"""Embed Miniscope AVI videos in the NWB file instead of linking them.
+
+AVI files are decoded with OpenCV in a process pool, a few files ahead of
+the writer, and reassembled in order by a chunk iterator that hands HDF5IO
+one file of frames at a time. The HDF5 chunk shape can be one frame per
+chunk (fast frame access, e.g. for viewing) or tiled in time (fast access
+to the history of a few pixels, e.g. for trace extraction).
+"""
+import warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from hdmf.backends.hdf5.h5_utils import H5DataIO
+from hdmf.data_utils import AbstractDataChunkIterator, DataChunk
+from pynwb.image import ImageSeries
+
+from .ingest import read_avi_header
+
+try:
+    import cv2
+except ImportError:
+    warnings.warn("opencv-python not found, to_nwb.miniscope.video will not work")
+
+
+def read_avi(path, gray=True, n_frames=None):
+    """Decode all frames of an AVI file.
+
+    Parameters
+    ----------
+    path: str
+    gray: bool, optional
+        convert frames to one channel. Default is True.
+    n_frames: int, optional
+        number of frames to read. Default is all.
+
+    Returns
+    -------
+    np.ndarray(dtype=uint8)
+        (n_frames, height, width) or (n_frames, height, width, 3). If no
+        frame can be decoded, n_frames is 0 and height and width are read
+        from the AVI header.
+
+    """
+    cap = cv2.VideoCapture(path)
+    frames = []
+    try:
+        while n_frames is None or len(frames) < n_frames:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            if gray:
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            else:
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            frames.append(frame)
+    finally:
+        cap.release()
+
+    if frames:
+        return np.stack(frames)
+    header = read_avi_header(path)
+    shape = (0, header['height'], header['width']) + (() if gray else (3,))
+    return np.empty(shape, dtype=np.uint8)
+
+
+def _chunk_shape(frame_shape, chunking, n_frames):
+    if chunking == 'frame':
+        return (1,) + tuple(frame_shape)
+    if chunking == 'time':
+        # ~1 MB chunks of 32 x 32 pixel tiles
+        tile = tuple(min(32, n) for n in frame_shape[:2]) + tuple(frame_shape[2:])
+        return (max(1, min(n_frames, 2 ** 20 // int(np.prod(tile)))),) + tile
+    return tuple(chunking)
+
+
+class VideoFrameIterator(AbstractDataChunkIterator):
+    """Write the frames of several AVI files as one (time, height, width[, 3]) dataset.
+
+    Parameters
+    ----------
+    paths: list(str)
+        AVI files in order
+    gray: bool, optional
+        convert frames to one channel. Default is True.
+    n_jobs: int, optional
+        number of files decoded in parallel processes. Default is 4.
+    chunking: str | tuple, optional
+        'frame' (default) for one frame per chunk, 'time' for time-tiled
+        chunks, or an explicit chunk shape
+
+    """
+
+    def __init__(self, paths, gray=True, n_jobs=4, chunking='frame'):
+        self.paths = list(paths)
+        self.gray = gray
+        self.n_jobs = int(n_jobs)
+        headers = [read_avi_header(path) for path in self.paths]
+        self.frame_counts = np.array([header['n_frames'] for header in headers], dtype=int)
+        self._offsets = np.concatenate(([0], np.cumsum(self.frame_counts))).astype(int)
+        self._frame_shape = (headers[0]['height'], headers[0]['width']) + (() if gray else (3,))
+        self._chunk_shape = _chunk_shape(self._frame_shape, chunking, int(self._offsets[-1]))
+        self._file = 0
+        self._pending = deque()
+        self._pool = None
+
+    def __iter__(self):
+        return self
+
+    def __len__(self):
+        return int(self._offsets[-1])
+
+    def _submit(self):
+        # keep up to n_jobs files decoding ahead of the writer
+        while len(self._pending) < self.n_jobs and self._file + len(self._pending) < len(self.paths):
+            i = self._file + len(self._pending)
+            self._pending.append(self._pool.submit(read_avi, self.paths[i], self.gray,
+                                                   int(self.frame_counts[i])))
+
+    def _close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __next__(self):
+        if self._file >= len(self.paths):
+            self._close()
+            raise StopIteration
+        i = self._file
+        if self.n_jobs > 1:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(self.n_jobs)
+            self._submit()
+            frames = self._pending.popleft().result()
+        else:
+            frames = read_avi(self.paths[i], self.gray, int(self.frame_counts[i]))
+        self._file += 1
+
+        if len(frames) != self.frame_counts[i]:
+            warnings.warn('{}: decoded {} frames, header says {}'.format(
+                self.paths[i], len(frames), self.frame_counts[i]))
+        start = self._offsets[i]
+        selection = (slice(start, start + len(frames)),) + tuple(slice(0, n) for n in self._frame_shape)
+        return DataChunk(data=frames, selection=selection)
+
+    next = __next__
+
+    def recommended_chunk_shape(self):
+        return self._chunk_shape
+
+    def recommended_data_shape(self):
+        return (int(self._offsets[-1]),) + self._frame_shape
+
+    @property
+    def dtype(self):
+        return np.dtype(np.uint8)
+
+    @property
+    def maxshape(self):
+        return (int(self._offsets[-1]),) + self._frame_shape
+
+
+def embedded_image_series(name, paths, timestamps, gray=True, n_jobs=4, chunking='frame',
+                          compression='gzip', **kwargs):
+    """ImageSeries holding the decoded frames of AVI files.
+
+    Parameters
+    ----------
+    name: str
+    paths: list(str)
+        AVI files in order
+    timestamps: np.ndarray
+        one per frame of all files together
+    gray: bool, optional
+        Default is True. Use False for color behavior cameras.
+    n_jobs: int, optional
+        number of files decoded in parallel. Default is 4.
+    chunking: str | tuple, optional
+        see `VideoFrameIterator`
+    compression: str, optional
+        Default is 'gzip'
+    kwargs:
+        passed to ImageSeries
+
+    Returns
+    -------
+    pynwb.image.ImageSeries
+
+    """
+    data = VideoFrameIterator(paths, gray=gray, n_jobs=n_jobs, chunking=chunking)
+    if len(data) != len(timestamps):
+        warnings.warn('{}: {} frames in {} files but {} timestamps'.format(
+            name, len(data), len(data.paths), len(timestamps)))
+
+    return ImageSeries(name=name, data=H5DataIO(data, compression=compression),
+                       timestamps=timestamps, unit='n.a.', **kwargs)
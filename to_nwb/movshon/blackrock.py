@@ -0,0 +1,523 @@
+"""Read Blackrock .nev spike files and .nsX continuous files without brpylib.
+
+The NEV data packets are memory-mapped as one structured array and scanned
+once in large blocks. The spike packets are then sorted by electrode and
+unit in a single stable sort, which gives the flat spike_times and
+spike_times_index arrays of a Units table directly, instead of one getdata
+call (and one pass over the file) per electrode. Each NSx data segment is
+memory-mapped as a (time, channel) int16 array and written to an
+ElectricalSeries block by block. NSx 3.0 files with PTP timestamps hold one
+sample per data packet; their packets are mapped as one structured array
+and written as a single ElectricalSeries with explicit timestamps.
+
+Blackrock file specs 2.2, 2.3 and 3.0 are supported.
+"""
+import os
+import warnings
+from datetime import datetime, timezone
+
+import numpy as np
+from hdmf.backends.hdf5 import H5DataIO
+from pynwb.ecephys import ElectricalSeries
+
+from to_nwb.data_iterators import ArrayBlockIterator
+from to_nwb.utils import build_units_table
+
+
+NEV_BASIC_HEADER = np.dtype([
+    ('file_type_id', 'S8'), ('file_spec', 'u1', 2), ('additional_flags', '<u2'),
+    ('bytes_in_header', '<u4'), ('bytes_in_data_packets', '<u4'),
+    ('timestamp_resolution', '<u4'), ('sample_resolution', '<u4'),
+    ('time_origin', '<u2', 8), ('application', 'S32'), ('comment', 'S256'),
+    ('n_extended_headers', '<u4')])
+
+NEV_EXTENDED_HEADER = np.dtype([('packet_id', 'S8'), ('payload', 'V24')])
+
+NEUEVWAV = np.dtype([
+    ('electrode_id', '<u2'), ('connector', 'u1'), ('pin', 'u1'),
+    ('digitization_factor', '<u2'), ('energy_threshold', '<u2'),
+    ('high_threshold', '<i2'), ('low_threshold', '<i2'), ('n_sorted_units', 'u1'),
+    ('bytes_per_sample', 'u1'), ('spike_width', '<u2'), ('empty', 'V8')])
+
+NEUEVLBL = np.dtype([('electrode_id', '<u2'), ('label', 'S16'), ('empty', 'V6')])
+
+NSX_BASIC_HEADER = np.dtype([
+    ('file_type_id', 'S8'), ('file_spec', 'u1', 2), ('bytes_in_header', '<u4'),
+    ('label', 'S16'), ('comment', 'S256'), ('period', '<u4'),
+    ('timestamp_resolution', '<u4'), ('time_origin', '<u2', 8), ('channel_count', '<u4')])
+
+NSX_CHANNEL_HEADER = np.dtype([
+    ('type', 'S2'), ('electrode_id', '<u2'), ('label', 'S16'), ('connector', 'u1'),
+    ('pin', 'u1'), ('min_digital', '<i2'), ('max_digital', '<i2'), ('min_analog', '<i2'),
+    ('max_analog', '<i2'), ('units', 'S16'), ('high_freq_corner', '<u4'),
+    ('high_freq_order', '<u4'), ('high_filter_type', '<u2'), ('low_freq_corner', '<u4'),
+    ('low_freq_order', '<u4'), ('low_filter_type', '<u2')])
+
+# NSx samples are always timed against a 30 kHz clock
+NSX_CLOCK = 30000.
+
+# spike classification of noise packets
+NOISE_UNIT = 255
+
+# analog units of NSx channels, in V
+UNIT_SCALE = {'V': 1., 'mV': 1e-3, 'uV': 1e-6}
+
+
+def _timestamp_dtype(file_spec):
+    # spec 3.0 has 64 bit (PTP) timestamps
+    return np.dtype('<u8') if tuple(file_spec) >= (3, 0) else np.dtype('<u4')
+
+
+def _packet_header_dtype(timestamp_dtype):
+    return np.dtype([('header', 'u1'), ('timestamp', timestamp_dtype), ('n_samples', '<u4')])
+
+
+def _system_time(time_origin):
+    # Windows SYSTEMTIME in UTC: year, month, weekday, day, hour, minute, second, ms
+    year, month, _, day, hour, minute, second, ms = (int(x) for x in time_origin)
+    return datetime(year, month, day, hour, minute, second, ms * 1000, tzinfo=timezone.utc)
+
+
+def read_nev_header(path):
+    """Read the basic and extended headers of a .nev file.
+
+    Parameters
+    ----------
+    path: str
+
+    Returns
+    -------
+    dict
+        file_spec, timestamp_resolution, session_start_time, packet_size,
+        data_offset, timestamp_dtype and electrodes, a structured array of
+        the NEUEVWAV headers with a 'label' field from the NEUEVLBL headers
+
+    """
+    with open(path, 'rb') as f:
+        basic = np.fromfile(f, NEV_BASIC_HEADER, count=1)[0]
+        if basic['file_type_id'] != b'NEURALEV':
+            raise ValueError('{} is not a NEV file'.format(path))
+        extended = np.fromfile(f, NEV_EXTENDED_HEADER, count=int(basic['n_extended_headers']))
+
+    waveform_headers = extended[extended['packet_id'] == b'NEUEVWAV']['payload'].copy()
+    waveforms = waveform_headers.view(NEUEVWAV)
+    label_headers = extended[extended['packet_id'] == b'NEUEVLBL']['payload'].copy()
+    label_headers = label_headers.view(NEUEVLBL)
+    labels = dict(zip(label_headers['electrode_id'].tolist(), label_headers['label']))
+
+    electrodes = np.zeros(len(waveforms), dtype=[('electrode_id', '<u2'), ('label', 'U16'),
+                                                 ('n_sorted_units', 'u1')])
+    electrodes['electrode_id'] = waveforms['electrode_id']
+    electrodes['n_sorted_units'] = waveforms['n_sorted_units']
+    electrodes['label'] = [labels.get(x, b'').decode('latin-1')
+                           for x in waveforms['electrode_id'].tolist()]
+
+    return {'file_spec': tuple(int(x) for x in basic['file_spec']),
+            'timestamp_resolution': float(basic['timestamp_resolution']),
+            'session_start_time': _system_time(basic['time_origin']),
+            'packet_size': int(basic['bytes_in_data_packets']),
+            'data_offset': int(basic['bytes_in_header']),
+            'timestamp_dtype': _timestamp_dtype(basic['file_spec']),
+            'electrodes': electrodes}
+
+
+def nev_packets(path, header=None):
+    """Memory-map the data packets of a .nev file.
+
+    Parameters
+    ----------
+    path: str
+    header: dict, optional
+        see `read_nev_header`
+
+    Returns
+    -------
+    np.memmap
+        structured, with fields timestamp, packet_id (the electrode of spike
+        packets, 0 for digital events), classification (the unit of spike
+        packets, the insertion reason of digital events) and value (the
+        digital input of digital events)
+
+    """
+    if header is None:
+        header = read_nev_header(path)
+    ts_dtype = header['timestamp_dtype']
+    rest = header['packet_size'] - ts_dtype.itemsize - 6
+    dtype = np.dtype([('timestamp', ts_dtype), ('packet_id', '<u2'), ('classification', 'u1'),
+                      ('reserved', 'u1'), ('value', '<u2'), ('rest', 'V{}'.format(rest))])
+    n_packets = (os.path.getsize(path) - header['data_offset']) // header['packet_size']
+    return np.memmap(path, dtype=dtype, mode='r', offset=header['data_offset'],
+                     shape=(n_packets,))
+
+
+def _packet_blocks(packets, block_size):
+    for start in range(0, len(packets), block_size):
+        yield packets[start:start + block_size]
+
+
+def read_nev_spikes(path, header=None, exclude_noise=True, block_size=None):
+    """Spike timestamps, electrodes and units of a .nev file in one pass.
+
+    Parameters
+    ----------
+    path: str
+    header: dict, optional
+        see `read_nev_header`
+    exclude_noise: bool, optional
+        drop packets classified as noise (255). Default is True.
+    block_size: int, optional
+        packets read per block. Default is about 64 MB worth.
+
+    Returns
+    -------
+    timestamps: np.ndarray
+    electrodes: np.ndarray
+    units: np.ndarray
+        0 for unsorted, 1-16 for sorted units
+
+    """
+    if header is None:
+        header = read_nev_header(path)
+    packets = nev_packets(path, header)
+    if block_size is None:
+        block_size = max(1, 2 ** 26 // header['packet_size'])
+
+    # spike packets carry the id of their electrode. 0 is a digital event,
+    # and ids above the electrodes are comments, tracking and configuration
+    spike_ids = np.unique(header['electrodes']['electrode_id'])
+    if not len(spike_ids):
+        spike_ids = np.arange(1, 2049)
+    is_spike_id = np.zeros(65536, dtype=bool)
+    is_spike_id[spike_ids] = True
+
+    timestamps, electrodes, units = [], [], []
+    for block in _packet_blocks(packets, block_size):
+        block = np.asarray(block)
+        is_spike = is_spike_id[block['packet_id']]
+        if exclude_noise:
+            is_spike &= block['classification'] != NOISE_UNIT
+        timestamps.append(block['timestamp'][is_spike])
+        electrodes.append(block['packet_id'][is_spike])
+        units.append(block['classification'][is_spike])
+
+    if not timestamps:
+        return (np.empty(0, header['timestamp_dtype']), np.empty(0, '<u2'), np.empty(0, 'u1'))
+    return np.concatenate(timestamps), np.concatenate(electrodes), np.concatenate(units)
+
+
+def read_nev_digital_events(path, header=None, block_size=None):
+    """Timestamps and values of the digital input events of a .nev file.
+
+    Parameters
+    ----------
+    path: str
+    header: dict, optional
+        see `read_nev_header`
+    block_size: int, optional
+        packets read per block
+
+    Returns
+    -------
+    timestamps: np.ndarray
+    values: np.ndarray(dtype=uint16)
+
+    """
+    if header is None:
+        header = read_nev_header(path)
+    packets = nev_packets(path, header)
+    if block_size is None:
+        block_size = max(1, 2 ** 26 // header['packet_size'])
+
+    timestamps, values = [], []
+    for block in _packet_blocks(packets, block_size):
+        block = np.asarray(block)
+        is_digital = block['packet_id'] == 0
+        timestamps.append(block['timestamp'][is_digital])
+        values.append(block['value'][is_digital])
+
+    if not timestamps:
+        return np.empty(0, header['timestamp_dtype']), np.empty(0, '<u2')
+    return np.concatenate(timestamps), np.concatenate(values)
+
+
+def demux_spikes(timestamps, electrodes, units):
+    """Group spikes by electrode and unit with one stable sort.
+
+    Parameters
+    ----------
+    timestamps: np.ndarray
+    electrodes: np.ndarray
+    units: np.ndarray
+
+    Returns
+    -------
+    unit_electrodes: np.ndarray
+        electrode of each (electrode, unit) pair, in ascending order
+    unit_numbers: np.ndarray
+        unit of each pair
+    spike_timestamps: np.ndarray
+        timestamps grouped by pair, in time order within each pair
+    counts: np.ndarray
+        number of spikes of each pair
+
+    """
+    keys = electrodes.astype(np.int64) * 256 + units
+    order = np.argsort(keys, kind='stable')
+    pairs, counts = np.unique(keys[order], return_counts=True)
+    return pairs // 256, pairs % 256, timestamps[order], counts
+
+
+def build_nev_units(path, electrode_table=None, header=None, exclude_noise=True):
+    """Build a Units table with every sorted and unsorted unit of a .nev file.
+
+    Parameters
+    ----------
+    path: str
+    electrode_table: pynwb.file.ElectrodeTable, optional
+        if given, each unit refers to the row of its electrode, matched by
+        id, in an 'electrodes' column. Otherwise the electrode id is stored
+        in an 'electrode_id' column.
+    header: dict, optional
+        see `read_nev_header`
+    exclude_noise: bool, optional
+        Default is True
+
+    Returns
+    -------
+    pynwb.misc.Units
+
+    """
+    if header is None:
+        header = read_nev_header(path)
+    unit_electrodes, unit_numbers, spike_timestamps, counts = demux_spikes(
+        *read_nev_spikes(path, header, exclude_noise=exclude_noise))
+    spike_times = spike_timestamps / header['timestamp_resolution']
+
+    columns = [{'name': 'unit_number', 'data': unit_numbers.astype(np.uint8),
+                'description': 'Blackrock spike classification: 0 unsorted, 1-16 sorted units'}]
+    if electrode_table is None:
+        columns.append({'name': 'electrode_id', 'data': unit_electrodes.astype(np.uint16),
+                        'description': 'Blackrock electrode id'})
+    else:
+        ids = np.asarray(electrode_table.id.data)
+        order = np.argsort(ids)
+        rows = order[np.searchsorted(ids, unit_electrodes, sorter=order)]
+        if not np.array_equal(ids[rows], unit_electrodes):
+            raise ValueError('electrodes {} of {} are not in the electrode table'.format(
+                np.setdiff1d(unit_electrodes, ids).tolist(), path))
+        # the electrodes column of Units is ragged, with one electrode per unit here
+        columns.append({'name': 'electrodes', 'data': rows, 'table': electrode_table,
+                        'index': np.arange(1, len(rows) + 1, dtype=np.uint64),
+                        'description': 'electrode of each unit'})
+
+    return build_units_table(spike_times, np.cumsum(counts, dtype=np.uint64), columns=columns,
+                             description='spikes from ' + os.path.split(path)[1])
+
+
+def read_nsx_header(path):
+    """Read the basic and channel headers of a .ns1-.ns6 file.
+
+    Parameters
+    ----------
+    path: str
+
+    Returns
+    -------
+    dict
+        file_spec, rate, timestamp_resolution, session_start_time,
+        data_offset, timestamp_dtype, ptp (True if every data packet holds
+        one sample with its own timestamp) and channels, a structured array
+        of the channel headers
+
+    """
+    with open(path, 'rb') as f:
+        basic = np.fromfile(f, NSX_BASIC_HEADER, count=1)[0]
+        if basic['file_type_id'] not in (b'NEURALCD', b'BRSMPGRP'):
+            raise ValueError('{} is not an NSx 2.2+ file'.format(path))
+        channels = np.fromfile(f, NSX_CHANNEL_HEADER, count=int(basic['channel_count']))
+        timestamp_dtype = _timestamp_dtype(basic['file_spec'])
+        ptp = False
+        if timestamp_dtype.itemsize == 8:
+            f.seek(int(basic['bytes_in_header']))
+            first = np.fromfile(f, _packet_header_dtype(timestamp_dtype), count=1)
+            ptp = len(first) == 1 and int(first[0]['n_samples']) == 1
+
+    return {'file_spec': tuple(int(x) for x in basic['file_spec']),
+            'rate': NSX_CLOCK / basic['period'],
+            'timestamp_resolution': float(basic['timestamp_resolution']),
+            'session_start_time': _system_time(basic['time_origin']),
+            'data_offset': int(basic['bytes_in_header']),
+            'timestamp_dtype': timestamp_dtype,
+            'ptp': ptp,
+            'channels': channels}
+
+
+def nsx_segments(path, header=None):
+    """Memory-map each data segment of an NSx file.
+
+    A recording paused and resumed within one file has several segments.
+
+    Parameters
+    ----------
+    path: str
+    header: dict, optional
+        see `read_nsx_header`
+
+    Returns
+    -------
+    list(tuple(float, np.memmap))
+        start time in s and (time, channel) int16 samples of each segment
+
+    Raises
+    ------
+    ValueError
+        for PTP files, whose packets are one-sample segments, see
+        `nsx_ptp_packets`
+
+    """
+    if header is None:
+        header = read_nsx_header(path)
+    if header['ptp']:
+        raise ValueError('{} has one sample per data packet (PTP timestamps), '
+                         'read it with nsx_ptp_packets'.format(path))
+    n_channels = len(header['channels'])
+    segment_header = _packet_header_dtype(header['timestamp_dtype'])
+    file_size = os.path.getsize(path)
+
+    segments = []
+    offset = header['data_offset']
+    with open(path, 'rb') as f:
+        while offset + segment_header.itemsize <= file_size:
+            f.seek(offset)
+            seg = np.fromfile(f, segment_header, count=1)[0]
+            if seg['header'] != 1:
+                raise ValueError('bad data packet header at byte {} of {}'.format(offset, path))
+            offset += segment_header.itemsize
+            # the last segment of an interrupted recording may be shorter than stated
+            n_samples = min(int(seg['n_samples']), (file_size - offset) // (2 * n_channels))
+            if n_samples:
+                segments.append((seg['timestamp'] / header['timestamp_resolution'],
+                                 np.memmap(path, dtype='<i2', mode='r', offset=offset,
+                                           shape=(n_samples, n_channels))))
+            offset += n_samples * n_channels * 2
+    return segments
+
+
+def nsx_ptp_packets(path, header=None):
+    """Memory-map the one-sample data packets of an NSx 3.0 file with PTP timestamps.
+
+    Parameters
+    ----------
+    path: str
+    header: dict, optional
+        see `read_nsx_header`
+
+    Returns
+    -------
+    timestamps: np.memmap
+        uint64 timestamp of each sample, in units of
+        header['timestamp_resolution']
+    samples: np.memmap
+        (time, channel) int16
+
+    """
+    if header is None:
+        header = read_nsx_header(path)
+    n_channels = len(header['channels'])
+    packet = np.dtype(_packet_header_dtype(header['timestamp_dtype']).descr +
+                      [('samples', '<i2', (n_channels,))])
+    # a packet cut off at the end of the file is dropped
+    n_packets = (os.path.getsize(path) - header['data_offset']) // packet.itemsize
+    packets = np.memmap(path, dtype=packet, mode='r', offset=header['data_offset'],
+                        shape=(n_packets,))
+    if n_packets and (packets[0]['header'] != 1 or packets[-1]['header'] != 1
+                      or packets[-1]['n_samples'] != 1):
+        raise ValueError('{} does not have one sample per data packet throughout'.format(path))
+    return packets['timestamp'], packets['samples']
+
+
+def channel_conversion(channels):
+    """Factor from int16 samples to volts of each NSx channel.
+
+    Parameters
+    ----------
+    channels: np.ndarray
+        channel headers, see `read_nsx_header`
+
+    Returns
+    -------
+    np.ndarray
+
+    """
+    conversion = ((channels['max_analog'].astype(float) - channels['min_analog'])
+                  / (channels['max_digital'].astype(float) - channels['min_digital']))
+    scale = []
+    for units in channels['units']:
+        units = units.decode('latin-1')
+        if units not in UNIT_SCALE:
+            warnings.warn('unknown analog units {!r}, conversion to V is not applied'.format(units))
+        scale.append(UNIT_SCALE.get(units, 1.))
+    return conversion * np.array(scale)
+
+
+def nsx_electrical_series(path, electrodes, name='ElectricalSeries', header=None,
+                          block_size=None, **io_settings):
+    """One ElectricalSeries per data segment of an NSx file.
+
+    The samples are streamed from the memory-mapped file when the NWB file
+    is written. Files with PTP timestamps (one sample per packet) give a
+    single ElectricalSeries with the timestamp of every sample instead of
+    a rate.
+
+    Parameters
+    ----------
+    path: str
+    electrodes: pynwb.core.DynamicTableRegion
+        one row for each channel of the file, in file order
+    name: str, optional
+        segments after the first get the suffix _1, _2, ...
+    header: dict, optional
+        see `read_nsx_header`
+    block_size: int, optional
+        samples read per block. Default is about 64 MB worth.
+    io_settings:
+        H5DataIO arguments, e.g. compression='gzip'. The default chunks hold
+        8192 samples of up to 64 channels.
+
+    Returns
+    -------
+    list(pynwb.ecephys.ElectricalSeries)
+
+    """
+    if header is None:
+        header = read_nsx_header(path)
+    conversion = channel_conversion(header['channels'])
+    if np.all(conversion == conversion[0]):
+        conversion_kwargs = {'conversion': float(conversion[0])}
+    else:
+        conversion_kwargs = {'conversion': 1., 'channel_conversion': conversion}
+
+    if header['ptp']:
+        timestamps, samples = nsx_ptp_packets(path, header)
+        settings = dict(io_settings)
+        settings.setdefault('chunks', (min(len(samples), 2 ** 13), min(samples.shape[1], 64)))
+        data = H5DataIO(ArrayBlockIterator(samples, block_size=block_size,
+                                           chunk_shape=settings['chunks']), **settings)
+        resolution = header['timestamp_resolution']
+        timestamps = H5DataIO(ArrayBlockIterator(timestamps, transform=lambda t: t / resolution,
+                                                 dtype=np.float64, block_size=block_size,
+                                                 chunk_shape=settings['chunks'][:1]),
+                              **{key: value for key, value in settings.items() if key != 'chunks'})
+        return [ElectricalSeries(name=name, data=data, electrodes=electrodes,
+                                 timestamps=timestamps, **conversion_kwargs)]
+
+    series = []
+    for i, (starting_time, samples) in enumerate(nsx_segments(path, header)):
+        settings = dict(io_settings)
+        settings.setdefault('chunks', (min(len(samples), 2 ** 13), min(samples.shape[1], 64)))
+        data = H5DataIO(ArrayBlockIterator(samples, block_size=block_size,
+                                           chunk_shape=settings['chunks']), **settings)
+        series.append(ElectricalSeries(name=name if i == 0 else '{}_{}'.format(name, i),
+                                       data=data, electrodes=electrodes, rate=header['rate'],
+                                       starting_time=float(starting_time), **conversion_kwargs))
+    return series
@@ -0,0 +1,210 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+from pynwb import NWBFile, NWBHDF5IO
+
+from to_nwb.movshon import blackrock as br
+
+# SYSTEMTIME: year, month, weekday, day, hour, minute, second, ms
+TIME_ORIGIN = [2018, 7, 1, 16, 12, 30, 5, 250]
+START = datetime(2018, 7, 16, 12, 30, 5, 250000, tzinfo=timezone.utc)
+NEV_PACKET_SIZE = 104
+ELECTRODES = [1, 2, 3]
+
+
+def packet_dtype(timestamp_dtype='<u4'):
+    return np.dtype([('timestamp', timestamp_dtype), ('packet_id', '<u2'), ('classification', 'u1'),
+                     ('reserved', 'u1'), ('value', '<u2'), ('rest', 'V{}'.format(NEV_PACKET_SIZE - 10))])
+
+
+@pytest.fixture
+def nev(tmp_path):
+    rng = np.random.default_rng(0)
+    extended = []
+    for electrode_id in ELECTRODES:
+        waveform = np.zeros(1, br.NEUEVWAV)
+        waveform['electrode_id'] = electrode_id
+        waveform['n_sorted_units'] = 2
+        label = np.zeros(1, br.NEUEVLBL)
+        label['electrode_id'] = electrode_id
+        label['label'] = 'elec{}'.format(electrode_id).encode()
+        extended += [b'NEUEVWAV' + waveform.tobytes(), b'NEUEVLBL' + label.tobytes()]
+
+    basic = np.zeros(1, br.NEV_BASIC_HEADER)
+    basic['file_type_id'] = b'NEURALEV'
+    basic['file_spec'] = (2, 3)
+    basic['timestamp_resolution'] = 30000
+    basic['bytes_in_data_packets'] = NEV_PACKET_SIZE
+    basic['time_origin'] = TIME_ORIGIN
+    basic['n_extended_headers'] = len(extended)
+    basic['bytes_in_header'] = br.NEV_BASIC_HEADER.itemsize + 32 * len(extended)
+
+    packets = np.zeros(3000, packet_dtype())
+    packets['timestamp'] = np.sort(rng.integers(0, 30000 * 60, len(packets)))
+    packets['packet_id'] = rng.choice([0, 1, 2, 3, 65535], len(packets))
+    packets['classification'] = rng.choice([0, 1, 2, br.NOISE_UNIT], len(packets))
+    packets['value'] = rng.integers(0, 100, len(packets))
+
+    path = str(tmp_path / 'session.nev')
+    with open(path, 'wb') as f:
+        f.write(basic.tobytes() + b''.join(extended) + packets.tobytes())
+    return path, packets
+
+
+def nsx_header(file_spec, n_channels=4):
+    basic = np.zeros(1, br.NSX_BASIC_HEADER)
+    basic['file_type_id'] = b'NEURALCD'
+    basic['file_spec'] = file_spec
+    basic['period'] = 1
+    basic['timestamp_resolution'] = 30000
+    basic['time_origin'] = TIME_ORIGIN
+    basic['channel_count'] = n_channels
+    basic['bytes_in_header'] = br.NSX_BASIC_HEADER.itemsize + br.NSX_CHANNEL_HEADER.itemsize * n_channels
+
+    channels = np.zeros(n_channels, br.NSX_CHANNEL_HEADER)
+    channels['type'] = b'CC'
+    channels['electrode_id'] = ELECTRODES + [129]
+    channels['label'] = [b'elec1', b'elec2', b'elec3', b'ainp1']
+    channels['min_digital'], channels['max_digital'] = -32764, 32764
+    channels['min_analog'], channels['max_analog'] = -8191, 8191
+    channels['units'] = b'uV'
+    channels[3]['min_analog'], channels[3]['max_analog'], channels[3]['units'] = -5000, 5000, b'mV'
+    return basic.tobytes() + channels.tobytes()
+
+
+def nsx_packet(timestamp, samples, timestamp_dtype='<u4'):
+    header = np.array([(1, timestamp, len(samples))],
+                      dtype=br._packet_header_dtype(np.dtype(timestamp_dtype)))
+    return header.tobytes() + samples.astype('<i2').tobytes()
+
+
+@pytest.fixture
+def nsx(tmp_path):
+    rng = np.random.default_rng(1)
+    segments = [rng.integers(-1000, 1000, (7000, 4)), rng.integers(-1000, 1000, (100, 4))]
+    path = str(tmp_path / 'session.ns6')
+    with open(path, 'wb') as f:
+        f.write(nsx_header((2, 3)) + nsx_packet(0, segments[0]) + nsx_packet(90000, segments[1]))
+        # interrupted recording: the last segment is shorter than its header says
+        f.write(nsx_packet(120000, segments[1])[:-(8 * 10 + 3)])
+    return path, segments
+
+
+@pytest.fixture
+def ptp(tmp_path):
+    samples = np.random.default_rng(2).integers(-1000, 1000, (500, 4))
+    timestamps = (np.arange(500) * 1000 + 7).astype(np.uint64)
+    path = str(tmp_path / 'session_ptp.ns6')
+    with open(path, 'wb') as f:
+        f.write(nsx_header((3, 0)))
+        for t, sample in zip(timestamps, samples):
+            f.write(nsx_packet(t, sample[np.newaxis], '<u8'))
+    return path, timestamps, samples
+
+
+def test_nev_header(nev):
+    header = br.read_nev_header(nev[0])
+    assert header['session_start_time'] == START
+    assert header['packet_size'] == NEV_PACKET_SIZE and header['timestamp_dtype'] == np.uint32
+    assert header['electrodes']['label'].tolist() == ['elec1', 'elec2', 'elec3']
+    assert header['electrodes']['n_sorted_units'].tolist() == [2, 2, 2]
+
+
+@pytest.mark.parametrize('exclude_noise', [True, False])
+def test_nev_spikes(nev, exclude_noise):
+    path, packets = nev
+    timestamps, electrodes, units = br.read_nev_spikes(path, exclude_noise=exclude_noise, block_size=333)
+    is_spike = np.isin(packets['packet_id'], ELECTRODES)
+    if exclude_noise:
+        is_spike &= packets['classification'] != br.NOISE_UNIT
+    np.testing.assert_array_equal(timestamps, packets['timestamp'][is_spike])
+    np.testing.assert_array_equal(electrodes, packets['packet_id'][is_spike])
+    np.testing.assert_array_equal(units, packets['classification'][is_spike])
+
+
+def test_nev_digital_events(nev):
+    path, packets = nev
+    timestamps, values = br.read_nev_digital_events(path, block_size=100)
+    is_digital = packets['packet_id'] == 0
+    np.testing.assert_array_equal(timestamps, packets['timestamp'][is_digital])
+    np.testing.assert_array_equal(values, packets['value'][is_digital])
+
+
+def test_demux_spikes():
+    timestamps = np.array([1, 2, 3, 4, 5, 6])
+    electrodes = np.array([2, 1, 2, 1, 1, 2])
+    units = np.array([0, 1, 0, 0, 1, 3])
+    unit_electrodes, unit_numbers, spike_timestamps, counts = br.demux_spikes(timestamps, electrodes, units)
+    np.testing.assert_array_equal(unit_electrodes, [1, 1, 2, 2])
+    np.testing.assert_array_equal(unit_numbers, [0, 1, 0, 3])
+    np.testing.assert_array_equal(spike_timestamps, [4, 2, 5, 1, 3, 6])
+    np.testing.assert_array_equal(counts, [1, 2, 2, 1])
+
+
+def test_build_nev_units(nev):
+    path, packets = nev
+    units = br.build_nev_units(path)
+    assert len(units) == len(ELECTRODES) * 3
+    for i, (electrode, unit) in enumerate(zip(units['electrode_id'].data, units['unit_number'].data)):
+        is_unit = (packets['packet_id'] == electrode) & (packets['classification'] == unit)
+        np.testing.assert_allclose(units['spike_times'][i], packets['timestamp'][is_unit] / 30000.)
+
+
+def test_nsx_segments(nsx):
+    path, segments = nsx
+    header = br.read_nsx_header(path)
+    assert header['rate'] == 30000. and not header['ptp']
+    assert header['session_start_time'] == START
+
+    read = br.nsx_segments(path, header)
+    assert [start for start, _ in read] == [0., 3., 4.]
+    np.testing.assert_array_equal(read[0][1], segments[0])
+    np.testing.assert_array_equal(read[1][1], segments[1])
+    np.testing.assert_array_equal(read[2][1], segments[1][:89])
+
+
+def test_channel_conversion(nsx):
+    conversion = br.channel_conversion(br.read_nsx_header(nsx[0])['channels'])
+    np.testing.assert_allclose(conversion, [8191 / 32764 * 1e-6] * 3 + [5000 / 32764 * 1e-3])
+
+
+def test_nsx_ptp(ptp):
+    path, timestamps, samples = ptp
+    header = br.read_nsx_header(path)
+    assert header['ptp'] and header['timestamp_dtype'] == np.uint64
+    with pytest.raises(ValueError):
+        br.nsx_segments(path, header)
+
+    read_timestamps, read_samples = br.nsx_ptp_packets(path, header)
+    np.testing.assert_array_equal(read_timestamps, timestamps)
+    np.testing.assert_array_equal(read_samples, samples)
+
+
+@pytest.mark.parametrize('ptp_file', [False, True])
+def test_nsx_electrical_series_round_trip(nsx, ptp, tmp_path, ptp_file):
+    path = ptp[0] if ptp_file else nsx[0]
+    nwbfile = NWBFile('blackrock', 'id', START)
+    device = nwbfile.create_device('device')
+    group = nwbfile.create_electrode_group('electrodes', 'electrodes', 'unknown', device)
+    for electrode_id in ELECTRODES + [129]:
+        nwbfile.add_electrode(id=electrode_id, location='unknown', group=group)
+    region = nwbfile.create_electrode_table_region(list(range(4)), 'all electrodes')
+    for series in br.nsx_electrical_series(path, region, name='raw', block_size=64):
+        nwbfile.add_acquisition(series)
+    out_path = str(tmp_path / 'out.nwb')
+    with NWBHDF5IO(out_path, 'w') as io:
+        io.write(nwbfile)
+
+    with NWBHDF5IO(out_path, 'r') as io:
+        acquisition = io.read().acquisition
+        if ptp_file:
+            assert sorted(acquisition) == ['raw']
+            np.testing.assert_array_equal(acquisition['raw'].data[:], ptp[2])
+            np.testing.assert_allclose(acquisition['raw'].timestamps[:], ptp[1] / 30000.)
+        else:
+            assert sorted(acquisition) == ['raw', 'raw_1', 'raw_2']
+            np.testing.assert_array_equal(acquisition['raw_1'].data[:], nsx[1][1])
+            assert acquisition['raw_1'].starting_time == 3.
+        np.testing.assert_allclose(acquisition['raw'].channel_conversion[:],
+                                   br.channel_conversion(br.read_nsx_header(path)['channels']))
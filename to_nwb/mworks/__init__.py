@@ -1,6 +1 @@
-import hashlib
-
-
-def file_hash(filename):
-    with open(filename, 'rb') as fp:
-        return hashlib.sha1(fp.read()).hexdigest()
+from to_nwb.hashing import file_hash
@@ -4,6 +4,11 @@ import shutil
 from ._mworks import ReservedEventCode, _MWKFile, _MWKStream
 
 
+# {(path, size, mtime_ns): (codec, reverse codec)}, shared by all MWKFile
+# instances; a stat key needs no read of the (possibly huge) data file
+_CODEC_CACHE = {}
+
+
 class IndexingException(IOError):
     pass
 
@@ -31,6 +36,13 @@ class MWKFile(_MWKFile):
     def exists(self):
         return os.path.exists(self.file)
 
+    @property
+    def data_file(self):
+        # an indexed .mwk is a directory holding the original file and its index
+        if os.path.isdir(self.file):
+            return os.path.join(self.file, os.path.basename(os.path.normpath(self.file)))
+        return self.file
+
     def _prepare_events_iter(self, codes=(), time_range=(None, None)):
         if not codes:
             codes = []
@@ -62,31 +74,53 @@ class MWKFile(_MWKFile):
     def codec(self):
         if self._codec is not None:
             return self._codec
-    
+
+        stat = os.stat(self.data_file)
+        key = (os.path.abspath(self.data_file), stat.st_size, stat.st_mtime_ns)
+        if key in _CODEC_CACHE:
+            self._codec, self._reverse_codec = _CODEC_CACHE[key]
+            return self._codec
+
         self._select_events([ReservedEventCode.RESERVED_CODEC_CODE],
                             self.minimum_time,
                             self.maximum_time)
         e = self._get_next_event()
         if e.empty:
-            self._codec = {}
-            return self._codec
+            codec = {}
+        else:
+            raw_codec = e.value
+            codec = dict((key, raw_codec[key]["tagname"]) for key in raw_codec)
 
-        raw_codec = e.value
-        codec = dict((key, raw_codec[key]["tagname"]) for key in raw_codec)
-        
         self._codec = codec
+        self._reverse_codec = dict((v, k) for k, v in codec.items())
+        _CODEC_CACHE[key] = (self._codec, self._reverse_codec)
         return codec
-    
+
     @property
     def reverse_codec(self):
         if self._reverse_codec is not None:
             return self._reverse_codec
-    
-        rc = dict((v, k) for k, v in self.codec.items())
 
-        self._reverse_codec = rc
-        return rc
+        self.codec
+        return self._reverse_codec
     
+    @property
+    def index_file(self):
+        name = os.path.basename(os.path.normpath(self.file))
+        return os.path.join(self.file, name + '.idx')
+
+    def open_indexed(self):
+        # open, rebuilding the index once if it is missing or cannot be read
+        if os.path.isdir(self.file) and not os.path.isfile(self.index_file):
+            self.unindex()
+        try:
+            self.open()
+        except (IOError, RuntimeError):
+            if not os.path.isdir(self.file):
+                raise
+            self.unindex()
+            self.open()
+
     def reindex(self):
         self.close()
         self.unindex()
@@ -0,0 +1,323 @@
+"""Extract MWorks variables from a .mwk file into NWB.
+
+The requested codes are selected once with `_select_events` and read in a
+single bulk call. Times and codes are pulled into arrays and the events are
+grouped by code with one stable sort, so each variable ends up as a pair of
+typed arrays (times and values) without any per-event Python bookkeeping.
+Each variable is then written, keyed by its tagname, as a TimeSeries
+(numeric values), an AnnotationSeries (text and structured values) or a
+TimeIntervals table (on/off state variables).
+
+Long sessions can be read in parallel: `read_events_parallel` splits the
+time range of the file into slices that worker processes read with their
+own file handles, and merges the slices back in time order.
+"""
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+
+import numpy as np
+from hdmf.common import VectorData
+from pynwb import TimeSeries
+from pynwb.epoch import TimeIntervals
+from pynwb.misc import AnnotationSeries
+
+from to_nwb.utils import check_module
+
+try:
+    from .data import MWKFile
+except ImportError:
+    # add_mworks_events works without the extension, reading .mwk files fails
+    MWKFile = None
+
+
+def typed_values(values):
+    """Convert the values of one variable to the narrowest array type.
+
+    Parameters
+    ----------
+    values: list
+
+    Returns
+    -------
+    np.ndarray
+        bool, int64 or float64 for numeric values, object (str) otherwise.
+        Values that are not numbers or strings (dicts, lists, None) are
+        stored as JSON.
+
+    """
+    kinds = set(map(type, values))
+    if kinds <= {bool}:
+        return np.array(values, dtype=bool)
+    if kinds <= {bool, int}:
+        return np.array(values, dtype=np.int64)
+    if kinds <= {bool, int, float}:
+        return np.array(values, dtype=np.float64)
+    if kinds <= {str}:
+        return np.array(values, dtype=object)
+    return np.array([value if isinstance(value, str) else json.dumps(value, default=str)
+                     for value in values], dtype=object)
+
+
+def collect_events(mwk, codes=(), time_range=(None, None)):
+    """Times and values of every selected variable of an open .mwk file.
+
+    Parameters
+    ----------
+    mwk: to_nwb.mworks.data.MWKFile
+    codes: iterable, optional
+        tagnames or codes. Default is all variables.
+    time_range: tuple, optional
+        (min_time, max_time) in MWorks time (us). Default is the whole file.
+
+    Returns
+    -------
+    dict
+        {tagname: (times, values)}, with times in us (int64) and values
+        from `typed_values`
+
+    """
+    by_code = _group_events(mwk.get_events(codes=codes, time_range=time_range))
+    codec = mwk.codec
+    return {codec.get(code, str(code)): variable for code, variable in by_code.items()}
+
+
+def _group_events(events):
+    # {code: (times, values)} of a list of events in time order
+    n_events = len(events)
+    event_codes = np.fromiter((event.code for event in events), dtype=np.int64, count=n_events)
+    times = np.fromiter((event.time for event in events), dtype=np.int64, count=n_events)
+
+    order = np.argsort(event_codes, kind='stable')
+    unique_codes, starts, counts = np.unique(event_codes[order], return_index=True,
+                                             return_counts=True)
+
+    variables = {}
+    for code, start, count in zip(unique_codes.tolist(), starts, counts):
+        idx = order[start:start + count]
+        variables[code] = (times[idx], typed_values([events[i].value for i in idx]))
+    return variables
+
+
+def time_slices(min_time, max_time, n_slices):
+    """Split [min_time, max_time] into inclusive integer (us) slices that do not overlap.
+
+    Parameters
+    ----------
+    min_time: int
+    max_time: int
+    n_slices: int
+
+    Returns
+    -------
+    list(tuple(int, int))
+
+    """
+    edges = np.linspace(min_time, max_time + 1, n_slices + 1).astype(np.int64)
+    return [(int(lo), int(hi) - 1) for lo, hi in zip(edges[:-1], edges[1:]) if hi > lo]
+
+
+def _read_slice(args):
+    path, codes, (min_time, max_time) = args
+    mwk = MWKFile(path)
+    mwk.open()
+    try:
+        mwk._select_events(codes, min_time, max_time)
+        return _group_events(mwk._get_events())
+    finally:
+        mwk.close()
+
+
+def _concat_values(parts):
+    if all(part.dtype != object for part in parts):
+        return np.concatenate(parts)
+    # retype the raw values, so that e.g. numbers and JSON strings from
+    # different slices end up as one kind
+    return typed_values(list(chain.from_iterable(part.tolist() for part in parts)))
+
+
+def read_events_parallel(mwk, codes=(), n_jobs=None, n_slices=None, time_range=(None, None)):
+    """Like `collect_events`, reading time slices of the file in worker processes.
+
+    The codec and time range come from an open file, so the file is indexed
+    before the workers start and they do not race to build the index. Given
+    a path, the file is opened (and indexed, or re-indexed if its index is
+    missing) here; given an open MWKFile, that handle is used as is, and
+    the index is never rebuilt under it.
+
+    Parameters
+    ----------
+    mwk: str | to_nwb.mworks.data.MWKFile
+        path of a .mwk file, or an open MWKFile
+    codes: iterable, optional
+        tagnames or codes. Default is all variables.
+    n_jobs: int, optional
+        number of worker processes. Default is the number of CPUs.
+    n_slices: int, optional
+        number of time slices. Default is 4 per worker, to balance slices
+        with more events than others.
+    time_range: tuple, optional
+        (min_time, max_time) in MWorks time (us). Default is the whole file.
+
+    Returns
+    -------
+    dict
+        {tagname: (times, values)}, see `collect_events`
+
+    Raises
+    ------
+    ImportError
+        if the mworks extension is not installed
+
+    """
+    if MWKFile is None:
+        raise ImportError('mworks extension not found, .mwk files cannot be read')
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+    if n_slices is None:
+        n_slices = 4 * n_jobs
+
+    own_handle = not isinstance(mwk, MWKFile)
+    if own_handle:
+        mwk = MWKFile(mwk)
+        mwk.open_indexed()
+    try:
+        path = mwk.file
+        codec = mwk.codec
+        reverse_codec = mwk.reverse_codec
+        min_time, max_time = time_range
+        if min_time is None:
+            min_time = mwk.minimum_time
+        if max_time is None:
+            max_time = mwk.maximum_time
+    finally:
+        if own_handle:
+            mwk.close()
+
+    codes = [reverse_codec.get(code, code) for code in codes]
+    slices = time_slices(min_time, max_time, n_slices)
+    with ProcessPoolExecutor(n_jobs) as pool:
+        parts = list(pool.map(_read_slice, [(path, codes, time_slice) for time_slice in slices]))
+
+    variables = {}
+    for code in sorted(set(chain.from_iterable(parts))):
+        code_parts = [part[code] for part in parts if code in part]
+        variables[codec.get(code, str(code))] = (
+            np.concatenate([times for times, _ in code_parts]),
+            _concat_values([values for _, values in code_parts]))
+    return variables
+
+
+def state_intervals(times, values):
+    """On intervals of a state variable: from each change to nonzero to the next zero.
+
+    Parameters
+    ----------
+    times: np.ndarray
+    values: np.ndarray
+
+    Returns
+    -------
+    start_times: np.ndarray
+    stop_times: np.ndarray
+        the last interval stops at the last time if the state never
+        returns to zero
+
+    """
+    on = np.asarray(values) != 0
+    was_on = np.concatenate(([False], on[:-1]))
+    starts = np.flatnonzero(on & ~was_on)
+    stops = np.flatnonzero(~on & was_on)
+    next_stop = np.searchsorted(stops, starts)
+    has_stop = next_stop < len(stops)
+    stop_times = np.full(len(starts), times[-1] if len(times) else np.nan, dtype=float)
+    stop_times[has_stop] = times[stops[next_stop[has_stop]]]
+    return times[starts], stop_times
+
+
+def _time_intervals(name, start_times, stop_times, description):
+    columns = [VectorData(name='start_time', description='start time of each interval',
+                          data=start_times),
+               VectorData(name='stop_time', description='stop time of each interval',
+                          data=stop_times)]
+    return TimeIntervals(name=name, description=description, columns=columns,
+                         id=np.arange(len(start_times)))
+
+
+def add_mworks_events(nwbfile, variables, time_zero=0, interval_variables=(),
+                      module_name='mworks'):
+    """Add MWorks variables to an NWB file.
+
+    Parameters
+    ----------
+    nwbfile: pynwb.NWBFile
+    variables: dict
+        {tagname: (times, values)}, see `collect_events`
+    time_zero: int, optional
+        MWorks time (us) of the start of the NWB session. Default is 0.
+    interval_variables: iterable(str), optional
+        tagnames of state variables to write as TimeIntervals tables of
+        their on periods instead of as time series
+    module_name: str, optional
+        processing module for the time series. Default is 'mworks'.
+
+    Returns
+    -------
+    pynwb.ProcessingModule
+
+    """
+    module = check_module(nwbfile, module_name, 'variables recorded by MWorks')
+    interval_variables = set(interval_variables)
+    for tagname, (times, values) in sorted(variables.items()):
+        timestamps = (times - time_zero) / 1e6
+        if tagname in interval_variables:
+            start_times, stop_times = state_intervals(timestamps, values)
+            nwbfile.add_time_intervals(_time_intervals(
+                tagname, start_times, stop_times,
+                'periods when MWorks variable {} was on'.format(tagname)))
+        elif values.dtype == object:
+            module.add(AnnotationSeries(name=tagname, data=values, timestamps=timestamps,
+                                        description='MWorks variable ' + tagname))
+        else:
+            module.add(TimeSeries(name=tagname, data=values, timestamps=timestamps, unit='n/a',
+                                  description='MWorks variable ' + tagname))
+    return module
+
+
+def mwk_to_nwb(mwk, nwbfile, codes=(), time_zero=None, interval_variables=(),
+               module_name='mworks', n_jobs=1):
+    """Extract the selected variables of an open .mwk file into an NWB file.
+
+    Parameters
+    ----------
+    mwk: to_nwb.mworks.data.MWKFile
+    nwbfile: pynwb.NWBFile
+    codes: iterable, optional
+        tagnames or codes. Default is all variables except the codec.
+    time_zero: int, optional
+        MWorks time (us) of the start of the NWB session. Default is the
+        first time in the file.
+    interval_variables: iterable(str), optional
+        see `add_mworks_events`
+    module_name: str, optional
+    n_jobs: int, optional
+        read time slices of the file in this many processes, see
+        `read_events_parallel`. Default is 1.
+
+    Returns
+    -------
+    pynwb.ProcessingModule
+
+    """
+    if time_zero is None:
+        time_zero = mwk.minimum_time
+    if not codes:
+        # code 0 is the codec itself
+        codes = [code for code in mwk.codec if code != 0]
+    if n_jobs > 1:
+        variables = read_events_parallel(mwk, codes=codes, n_jobs=n_jobs)
+    else:
+        variables = collect_events(mwk, codes=codes)
+    return add_mworks_events(nwbfile, variables, time_zero=time_zero,
+                             interval_variables=interval_variables, module_name=module_name)
@@ -0,0 +1,370 @@
+"""Record MWorks variables from a live conduit into an NWB file during acquisition.
+
+`create_recording_file` writes an NWB file in which every recorded variable
+is an empty TimeSeries with resizable data and timestamps. A
+`ConduitRecorder` then subscribes to a conduit, keeps the incoming events
+of each variable in a fixed-size ring buffer, and a background thread
+periodically appends the buffered events to those datasets, so the NWB
+file grows with the experiment instead of being converted afterwards.
+
+When a buffer fills up faster than it is flushed, the conduit callback
+either waits for the next flush (backpressure, the default) or drops the
+event, and both are counted in `ConduitRecorder.metrics`. Events that
+arrive after `ConduitRecorder.stop` are ignored. `LocalConduit` stands in for an MWorks conduit to test recorders without MWorks.
+"""
+import json
+import threading
+import time
+from collections import namedtuple
+
+import h5py
+import numpy as np
+from hdmf.backends.hdf5 import H5DataIO
+from pynwb import NWBHDF5IO, TimeSeries
+
+from to_nwb.utils import check_module
+
+
+class RingBuffer(object):
+    """Fixed-capacity FIFO of the times and values of one variable.
+
+    Parameters
+    ----------
+    capacity: int
+    dtype: np.dtype
+        dtype of the values, object for text
+
+    """
+
+    def __init__(self, capacity, dtype):
+        self.capacity = int(capacity)
+        self.times = np.empty(self.capacity, dtype=np.int64)
+        self.values = np.empty(self.capacity, dtype=dtype)
+        self._start = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def full(self):
+        return self._size == self.capacity
+
+    def push(self, time, value):
+        """Add one event. The buffer must not be full."""
+        i = (self._start + self._size) % self.capacity
+        self.times[i] = time
+        self.values[i] = value
+        self._size += 1
+
+    def drain(self):
+        """Remove and return all events, oldest first.
+
+        Returns
+        -------
+        times: np.ndarray
+        values: np.ndarray
+
+        """
+        idx = (self._start + np.arange(self._size)) % self.capacity
+        times, values = self.times[idx], self.values[idx]
+        self._start = (self._start + self._size) % self.capacity
+        self._size = 0
+        return times, values
+
+
+def _storage_dtype(dtype):
+    return h5py.string_dtype() if dtype is str else np.dtype(dtype)
+
+
+def appendable_series(name, dtype, chunk_size=4096, description=None):
+    """An empty TimeSeries whose data and timestamps can be appended to once written.
+
+    Parameters
+    ----------
+    name: str
+    dtype: type | np.dtype
+        str for text values
+    chunk_size: int, optional
+        HDF5 chunk length of data and timestamps. Default is 4096.
+    description: str, optional
+
+    Returns
+    -------
+    pynwb.TimeSeries
+
+    """
+    data = H5DataIO(np.empty(0, dtype=_storage_dtype(dtype)), maxshape=(None,),
+                    chunks=(chunk_size,))
+    timestamps = H5DataIO(np.empty(0), maxshape=(None,), chunks=(chunk_size,))
+    return TimeSeries(name=name, data=data, timestamps=timestamps, unit='n/a',
+                      description=description or 'MWorks variable ' + name)
+
+
+def create_recording_file(nwbfile, path, variables, module_name='mworks', chunk_size=4096):
+    """Write `nwbfile` with an appendable TimeSeries for each variable.
+
+    Parameters
+    ----------
+    nwbfile: pynwb.NWBFile
+    path: str
+    variables: dict
+        {tagname: dtype}, with str for text values
+    module_name: str, optional
+        Default is 'mworks'
+    chunk_size: int, optional
+
+    """
+    module = check_module(nwbfile, module_name, 'variables recorded by MWorks')
+    for tagname, dtype in variables.items():
+        module.add(appendable_series(tagname, dtype, chunk_size=chunk_size))
+    with NWBHDF5IO(path, mode='w') as io:
+        io.write(nwbfile)
+
+
+ConduitEvent = namedtuple('ConduitEvent', ['code', 'time', 'data'])
+
+
+class LocalConduit(object):
+    """In-process stand-in for an MWorks IPCClientConduit.
+
+    Events sent with `send_data` are delivered synchronously to the
+    callbacks registered for their name.
+
+    Parameters
+    ----------
+    names: iterable(str), optional
+        variables known to the conduit. Others get codes as they are sent.
+
+    """
+
+    def __init__(self, names=()):
+        self.reverse_codec = {}
+        self._callbacks = {}
+        self._t0 = time.time()
+        for name in names:
+            self._code(name)
+
+    @property
+    def codec(self):
+        return {code: name for name, code in self.reverse_codec.items()}
+
+    def _code(self, name):
+        return self.reverse_codec.setdefault(name, len(self.reverse_codec) + 1)
+
+    def initialize(self):
+        return True
+
+    def finalize(self):
+        self._callbacks.clear()
+
+    def register_callback_for_name(self, name, callback):
+        self._callbacks.setdefault(self._code(name), []).append(callback)
+
+    def send_data(self, name, data, time_us=None):
+        """Deliver one event. The time defaults to now, in us since the conduit started."""
+        if time_us is None:
+            time_us = int((time.time() - self._t0) * 1e6)
+        event = ConduitEvent(self._code(name), time_us, data)
+        for callback in self._callbacks.get(event.code, ()):
+            callback(event)
+
+
+class ConduitRecorder(object):
+    """Append MWorks events from a conduit to an NWB file made by `create_recording_file`.
+
+    Parameters
+    ----------
+    path: str
+        NWB file
+    variables: dict
+        {tagname: dtype} of the variables to record, as given to
+        `create_recording_file`
+    conduit: IPCClientConduit | LocalConduit
+        an initialized conduit
+    module_name: str, optional
+        Default is 'mworks'
+    capacity: int, optional
+        events buffered per variable. Default is 2 ** 16.
+    flush_interval: float, optional
+        seconds between flushes. Default is 1.
+    high_water: float, optional
+        fraction of a buffer's capacity at which a flush is started early.
+        Default is 0.5.
+    on_full: str, optional
+        'block' (default) to make the conduit callback wait for the next
+        flush when a buffer is full, or 'drop' to drop the event
+    block_timeout: float, optional
+        longest wait of a blocked callback in s, after which the event is
+        dropped. Default is 10.
+    time_zero: int, optional
+        MWorks time (us) of the start of the NWB session. Default is the
+        time of the first recorded event.
+
+    """
+
+    def __init__(self, path, variables, conduit, module_name='mworks', capacity=2 ** 16,
+                 flush_interval=1., high_water=0.5, on_full='block', block_timeout=10.,
+                 time_zero=None):
+        if on_full not in ('block', 'drop'):
+            raise ValueError("on_full must be 'block' or 'drop', not {!r}".format(on_full))
+        self.path = path
+        self.conduit = conduit
+        self.module_name = module_name
+        self.flush_interval = flush_interval
+        self.high_water = int(high_water * capacity)
+        self.on_full = on_full
+        self.block_timeout = block_timeout
+        self.time_zero = time_zero
+
+        self._text = {tagname for tagname, dtype in variables.items() if dtype is str}
+        self._buffers = {tagname: RingBuffer(capacity, object if tagname in self._text else dtype)
+                         for tagname, dtype in variables.items()}
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._file = None
+        self._recording = False
+
+        self._received = 0
+        self._written = 0
+        self._dropped = 0
+        self._blocked_time = 0.
+        self._max_fill = 0.
+        self._flushes = 0
+        self._latency_last = np.nan
+        self._latency_sum = 0.
+        self._latency_max = np.nan
+
+    def start(self):
+        """Open the NWB file for appending, subscribe to the conduit and start flushing."""
+        self._file = h5py.File(self.path, 'a')
+        with self._cond:
+            self._recording = True
+        for tagname in self._buffers:
+            self.conduit.register_callback_for_name(tagname, self._callback(tagname))
+        self._thread = threading.Thread(target=self._run, name='ConduitRecorder', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop recording, write the buffered events and close the NWB file.
+
+        The conduit callbacks stay registered but ignore later events.
+        """
+        with self._cond:
+            self._recording = False
+            # release callbacks waiting for a full buffer, their events are dropped
+            self._cond.notify_all()
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, type, value, tb):
+        self.stop()
+
+    def _callback(self, tagname):
+        def callback(event):
+            self._push(tagname, event.time, event.data)
+        return callback
+
+    def _push(self, tagname, time_us, value):
+        if tagname in self._text and not isinstance(value, str):
+            value = json.dumps(value, default=str)
+        buffer = self._buffers[tagname]
+        with self._cond:
+            if not self._recording:
+                return
+            self._received += 1
+            if self.time_zero is None:
+                self.time_zero = time_us
+            if buffer.full and self.on_full == 'block':
+                self._wake.set()
+                start = time.perf_counter()
+                self._cond.wait_for(lambda: not buffer.full or not self._recording,
+                                    timeout=self.block_timeout)
+                self._blocked_time += time.perf_counter() - start
+            if buffer.full or not self._recording:
+                self._dropped += 1
+                return
+            buffer.push(time_us, value)
+            fill = len(buffer) / float(buffer.capacity)
+            self._max_fill = max(self._max_fill, fill)
+            if len(buffer) >= self.high_water:
+                self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Append all buffered events to the NWB file now."""
+        # drain and append under one lock, so that concurrent flushes write
+        # their events in the order they were drained
+        with self._write_lock:
+            start = time.perf_counter()
+            with self._cond:
+                drained = {tagname: buffer.drain() for tagname, buffer in self._buffers.items()
+                           if len(buffer)}
+                time_zero = self.time_zero
+                self._cond.notify_all()
+            if not drained:
+                return
+
+            for tagname, (times, values) in drained.items():
+                group = self._file['processing'][self.module_name][tagname]
+                _append(group['data'], values)
+                _append(group['timestamps'], (times - time_zero) / 1e6)
+            self._file.flush()
+            latency = time.perf_counter() - start
+        with self._cond:
+            self._written += sum(len(times) for times, _ in drained.values())
+            self._latency_max = max(self._latency_max, latency) if self._flushes else latency
+            self._flushes += 1
+            self._latency_last = latency
+            self._latency_sum += latency
+
+    def metrics(self):
+        """Counters and timings of the recording so far.
+
+        Returns
+        -------
+        dict
+            events_received, events_written, events_dropped, events_buffered,
+            blocked_time (s spent waiting for flushes in conduit callbacks),
+            max_fill (largest buffer fill fraction), flushes and
+            flush_latency_last/mean/max (s per flush)
+
+        """
+        with self._cond:
+            buffered = sum(len(buffer) for buffer in self._buffers.values())
+            return {'events_received': self._received,
+                    'events_written': self._written,
+                    'events_dropped': self._dropped,
+                    'events_buffered': buffered,
+                    'blocked_time': self._blocked_time,
+                    'max_fill': self._max_fill,
+                    'flushes': self._flushes,
+                    'flush_latency_last': self._latency_last,
+                    'flush_latency_mean': (self._latency_sum / self._flushes
+                                           if self._flushes else np.nan),
+                    'flush_latency_max': self._latency_max}
+
+
+def _append(dset, values):
+    n = dset.shape[0]
+    dset.resize((n + len(values),))
+    dset[n:] = values
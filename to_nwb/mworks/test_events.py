@@ -0,0 +1,112 @@
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+from pynwb import NWBFile, TimeSeries
+from pynwb.misc import AnnotationSeries
+
+from to_nwb.mworks import events
+from to_nwb.mworks.events import (_concat_values, _group_events, add_mworks_events, collect_events,
+                                  state_intervals, time_slices, typed_values)
+
+Event = namedtuple('Event', ['code', 'time', 'value'])
+
+EVENTS = [Event(2, 10, 1), Event(3, 11, 'a'), Event(2, 12, 2.5), Event(4, 13, True),
+          Event(3, 14, {'x': 1}), Event(4, 15, False), Event(2, 16, 0)]
+
+
+class EventSource(object):
+    # the part of MWKFile used by collect_events
+
+    codec = {2: 'x', 3: 'stim', 4: 'on'}
+
+    def get_events(self, codes=(), time_range=(None, None)):
+        return [event for event in EVENTS if not codes or event.code in codes]
+
+
+@pytest.fixture
+def nwbfile(monkeypatch):
+    # check_module uses the NWBFile.modules of older pynwb versions
+    if not hasattr(NWBFile, 'modules'):
+        monkeypatch.setattr(NWBFile, 'modules', property(lambda self: self.processing), raising=False)
+    return NWBFile('mworks', 'id', datetime(2020, 1, 1, tzinfo=timezone.utc))
+
+
+def test_typed_values():
+    assert typed_values([True, False]).dtype == bool
+    assert typed_values([True, 2]).dtype == np.int64
+    assert typed_values([1, 2.5]).dtype == np.float64
+    assert typed_values(['a', 'b']).tolist() == ['a', 'b']
+    assert typed_values([1, 'a', None, [1, 2]]).tolist() == ['1', 'a', 'null', '[1, 2]']
+    assert typed_values([]).dtype == bool
+
+
+def test_group_events():
+    grouped = _group_events(EVENTS)
+    assert sorted(grouped) == [2, 3, 4]
+    times, values = grouped[2]
+    np.testing.assert_array_equal(times, [10, 12, 16])
+    assert values.dtype == np.float64 and values.tolist() == [1., 2.5, 0.]
+    assert grouped[3][1].tolist() == ['a', '{"x": 1}']
+    assert grouped[4][1].dtype == bool
+    assert _group_events([]) == {}
+
+
+def test_collect_events_uses_tagnames():
+    variables = collect_events(EventSource(), codes=[2, 4])
+    assert sorted(variables) == ['on', 'x']
+    np.testing.assert_array_equal(variables['on'][0], [13, 15])
+
+
+def test_time_slices_cover_range_once():
+    slices = time_slices(100, 1099, 7)
+    assert slices[0][0] == 100 and slices[-1][1] == 1099
+    assert all(lo <= hi for lo, hi in slices)
+    assert all(a[1] + 1 == b[0] for a, b in zip(slices[:-1], slices[1:]))
+    assert time_slices(5, 6, 10) == [(5, 5), (6, 6)]
+
+
+def test_slices_reassemble_events():
+    times = np.array([event.time for event in EVENTS])
+    parts = [_group_events([event for event in EVENTS if lo <= event.time <= hi])
+             for lo, hi in time_slices(times.min(), times.max(), 3)]
+    whole = _group_events(EVENTS)
+    for code, (times, values) in whole.items():
+        code_parts = [part[code] for part in parts if code in part]
+        np.testing.assert_array_equal(np.concatenate([t for t, _ in code_parts]), times)
+        assert _concat_values([v for _, v in code_parts]).tolist() == values.tolist()
+
+
+def test_concat_values_retypes_mixed_parts():
+    assert _concat_values([np.array([1, 2]), np.array([2.5])]).dtype == np.float64
+    mixed = _concat_values([np.array([1, 2]), np.array(['a'], dtype=object)])
+    assert mixed.tolist() == ['1', '2', 'a']
+
+
+def test_state_intervals():
+    times = np.array([0., 1., 2., 3., 4., 5.])
+    starts, stops = state_intervals(times, [0, 1, 1, 0, 2, 3])
+    np.testing.assert_array_equal(starts, [1., 4.])
+    np.testing.assert_array_equal(stops, [3., 5.])
+    starts, stops = state_intervals(np.empty(0), np.empty(0))
+    assert len(starts) == len(stops) == 0
+
+
+def test_add_mworks_events(nwbfile):
+    variables = collect_events(EventSource())
+    module = add_mworks_events(nwbfile, variables, time_zero=10, interval_variables=['on'])
+
+    assert isinstance(module['x'], TimeSeries)
+    np.testing.assert_allclose(module['x'].timestamps, [0., 2e-6, 6e-6])
+    assert isinstance(module['stim'], AnnotationSeries)
+    assert 'on' not in module.data_interfaces
+    on = nwbfile.intervals['on']
+    np.testing.assert_allclose(on['start_time'].data, [3e-6])
+    np.testing.assert_allclose(on['stop_time'].data, [5e-6])
+
+
+def test_parallel_read_needs_extension(monkeypatch):
+    monkeypatch.setattr(events, 'MWKFile', None)
+    with pytest.raises(ImportError):
+        events.read_events_parallel('session.mwk')
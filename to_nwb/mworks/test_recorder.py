@@ -0,0 +1,123 @@
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+from pynwb import NWBFile, NWBHDF5IO
+
+from to_nwb.mworks.recorder import ConduitRecorder, LocalConduit, RingBuffer, create_recording_file
+
+VARIABLES = {'eye_h': float, 'trial': int, 'stim': str}
+
+
+@pytest.fixture
+def recording_file(tmp_path, monkeypatch):
+    # check_module uses the NWBFile.modules of older pynwb versions
+    if not hasattr(NWBFile, 'modules'):
+        monkeypatch.setattr(NWBFile, 'modules', property(lambda self: self.processing), raising=False)
+
+    def create(variables):
+        path = str(tmp_path / 'recording.nwb')
+        nwbfile = NWBFile('recording', 'id', datetime(2020, 1, 1, tzinfo=timezone.utc))
+        create_recording_file(nwbfile, path, variables, chunk_size=16)
+        return path
+    return create
+
+
+def test_ring_buffer_wraps():
+    buffer = RingBuffer(4, float)
+    for i in range(3):
+        buffer.push(i, float(i))
+    buffer.drain()
+    for i in range(3, 7):
+        buffer.push(i, float(i))
+    assert buffer.full
+    times, values = buffer.drain()
+    np.testing.assert_array_equal(times, [3, 4, 5, 6])
+    np.testing.assert_array_equal(values, [3., 4., 5., 6.])
+    assert len(buffer) == 0
+
+
+def test_record_and_read_back(recording_file):
+    path = recording_file(VARIABLES)
+    conduit = LocalConduit(VARIABLES)
+    n = 2000
+
+    with ConduitRecorder(path, VARIABLES, conduit, capacity=64, flush_interval=0.01) as recorder:
+        def produce(name, value):
+            for i in range(n):
+                conduit.send_data(name, value(i), time_us=1000 + 10 * i)
+        threads = [threading.Thread(target=produce, args=args)
+                   for args in [('eye_h', float), ('trial', lambda i: i // 100),
+                                ('stim', lambda i: 'img' if i % 2 else {'k': i})]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        conduit.send_data('other', 1.)
+
+    metrics = recorder.metrics()
+    assert metrics['events_received'] == metrics['events_written'] == 3 * n
+    assert metrics['events_dropped'] == 0 and metrics['events_buffered'] == 0
+    assert metrics['flushes'] >= 1 and metrics['max_fill'] <= 1
+
+    with NWBHDF5IO(path, 'r') as io:
+        module = io.read().processing['mworks']
+        assert sorted(module.data_interfaces) == sorted(VARIABLES)
+        np.testing.assert_array_equal(module['eye_h'].data[:], np.arange(n))
+        np.testing.assert_allclose(module['eye_h'].timestamps[:], np.arange(n) * 1e-5)
+        np.testing.assert_array_equal(module['trial'].data[:], np.arange(n) // 100)
+        stim = [s.decode() if isinstance(s, bytes) else s for s in module['stim'].data[:2]]
+        assert stim == ['{"k": 0}', 'img']
+
+
+def test_block_waits_for_flush(recording_file):
+    path = recording_file({'x': float})
+    conduit = LocalConduit()
+    recorder = ConduitRecorder(path, {'x': float}, conduit, capacity=10, flush_interval=100.,
+                               high_water=2., on_full='block').start()
+    for i in range(25):
+        conduit.send_data('x', float(i), time_us=i)
+    recorder.stop()
+
+    metrics = recorder.metrics()
+    assert metrics['events_written'] == 25 and metrics['events_dropped'] == 0
+    assert metrics['blocked_time'] > 0 and metrics['flushes'] >= 3
+    with NWBHDF5IO(path, 'r') as io:
+        np.testing.assert_array_equal(io.read().processing['mworks']['x'].data[:], np.arange(25))
+
+
+def test_drop_when_full(recording_file):
+    path = recording_file({'x': float})
+    conduit = LocalConduit()
+    recorder = ConduitRecorder(path, {'x': float}, conduit, capacity=10, flush_interval=100.,
+                               high_water=2., on_full='drop').start()
+    for i in range(25):
+        conduit.send_data('x', float(i), time_us=i)
+    recorder.stop()
+
+    metrics = recorder.metrics()
+    assert metrics['events_received'] == 25
+    assert metrics['events_written'] == 10 and metrics['events_dropped'] == 15
+    assert metrics['blocked_time'] == 0
+    with NWBHDF5IO(path, 'r') as io:
+        np.testing.assert_array_equal(io.read().processing['mworks']['x'].data[:], np.arange(10))
+
+
+def test_events_after_stop_ignored(recording_file):
+    path = recording_file({'x': float})
+    conduit = LocalConduit()
+    with ConduitRecorder(path, {'x': float}, conduit, flush_interval=100.) as recorder:
+        conduit.send_data('x', 1., time_us=0)
+    conduit.send_data('x', 2., time_us=10)
+
+    metrics = recorder.metrics()
+    assert metrics['events_received'] == metrics['events_written'] == 1
+    assert metrics['events_buffered'] == 0
+    with NWBHDF5IO(path, 'r') as io:
+        np.testing.assert_array_equal(io.read().processing['mworks']['x'].data[:], [1.])
+
+
+def test_invalid_on_full(recording_file):
+    with pytest.raises(ValueError):
+        ConduitRecorder(recording_file({'x': float}), {'x': float}, LocalConduit(), on_full='wait')
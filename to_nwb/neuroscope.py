@@ -1,6 +1,5 @@
 """Authors: Ben Dichter, Cody Baker."""
 import os
-from glob import glob
 import numpy as np
 import pandas as pd
 from lxml import etree as et
@@ -9,9 +8,9 @@ from pynwb.behavior import SpatialSeries
 from pynwb.ecephys import ElectricalSeries, LFP, SpikeEventSeries
 from hdmf.backends.hdf5.h5_utils import H5DataIO
 from hdmf.data_utils import DataChunkIterator
-from pynwb.misc import AnnotationSeries
 from tqdm import tqdm
 from .utils import check_module
+from .evt import read_session_events, events_to_nwb
 from typing import Optional, List, Iterable
 import sys
 if sys.version >= '3.8':
@@ -457,7 +456,8 @@ def add_lfp(nwbfile: NWBFile, session_path: str,
     write_lfp(nwbfile, data[:, all_shank_channels], fs, name, description)
 
 
-def get_events(session_path: str, suffixes: Iterable[int] = None):
+def get_events(session_path: str, suffixes: Iterable[str] = None, kind: str = 'annotation',
+               layouts: Optional[dict] = None):
     """Retrieve event information from Neuroscope evt files.
 
     Parameters
@@ -465,40 +465,24 @@ def get_events(session_path: str, suffixes: Iterable[int] = None):
     session_path: str
     suffixes: Iterable(str), optional
         The 3-letter names for the events to write. If None, detect all in session_path
+    kind: str, optional
+        'annotation', 'intervals' or 'both', see `evt.events_to_nwb`
+    layouts: dict, optional
+        {event name: layout} of files with multi-point events not in
+        `evt.EVT_LAYOUTS`
 
     """
-    session_name = os.path.split(session_path)[1]
-
-    if suffixes is None:
-        evt_files = glob(os.path.join(session_path, session_name) + '.evt.*') + \
-                    glob(os.path.join(session_path, session_name) + '.*.evt')
-    else:
-        evt_files = [os.path.join(session_path, session_name + s)
-                     for s in suffixes]
-
-    out = []
-    for evt_file in evt_files:
-        parts = os.path.split(evt_file)[1].split('.')
-        if parts[-1] == 'evt':
-            name = '.'.join(parts[1:-1])
-        else:
-            name = parts[-1]
-        if os.path.isfile(evt_file):
-            df = pd.read_csv(evt_file, sep='\t', names=('time', 'desc'))
-            if len(df):
-                timestamps = df.values[:, 0].astype(float) / 1000
-                data = df['desc'].values
-                annotation_series = AnnotationSeries(name=name, data=data, timestamps=timestamps)
-                out.append(annotation_series)
-        else:
-            print("Warning: No .evt file found at the path location!"
-                  "Unable to retrieve annotation_series.")
-            out = None
+    events = read_session_events(session_path, suffixes)
+    if any(parsed is None for parsed in events.values()):
+        print("Warning: No .evt file found at the path location!"
+              "Unable to retrieve annotation_series.")
+        return None
 
-    return out
+    return events_to_nwb(events, kind=kind, layouts=layouts)
 
 
-def write_events(nwbfile: NWBFile, session_path: str, suffixes: Iterable[str], module=None):
+def write_events(nwbfile: NWBFile, session_path: str, suffixes: Iterable[str], module=None,
+                 kind: str = 'annotation', layouts: Optional[dict] = None):
     """Write the event information from Neurscope into the NWBFile.
 
     Parameters
@@ -508,35 +492,21 @@ def write_events(nwbfile: NWBFile, session_path: str, suffixes: Iterable[str], m
     suffixes: Iterable(str), optional
         The 3-letter names for the events to write. If None, detect all in session_path
     module: pynwb.processing_module
+    kind: str, optional
+        'annotation', 'intervals' or 'both', see `evt.events_to_nwb`
+    layouts: dict, optional
+        {event name: layout} of files with multi-point events not in
+        `evt.EVT_LAYOUTS`
 
     """
-    session_name = os.path.split(session_path)[1]
-
-    if suffixes is None:
-        evt_files = glob(os.path.join(session_path, session_name) + '.evt.*') + \
-                    glob(os.path.join(session_path, session_name) + '.*.evt')
-    else:
-        evt_files = [os.path.join(session_path, session_name + s)
-                     for s in suffixes]
+    events = read_session_events(session_path, suffixes)
     if module is None:
         module = check_module(nwbfile, 'events')
-    for evt_file in evt_files:
-        parts = os.path.split(evt_file)[1].split('.')
-        if parts[-1] == 'evt':
-            name = '.'.join(parts[1:-1])
-        else:
-            name = parts[-1]
-        if os.path.isfile(evt_file):
-            df = pd.read_csv(evt_file, sep='\t', names=('time', 'desc'))
-            if len(df):
-                timestamps = df.values[:, 0].astype(float) / 1000
-                data = df['desc'].values
-                annotation_series = AnnotationSeries(
-                    name=name, data=data, timestamps=timestamps)
-                module.add_data_interface(annotation_series)
-        else:
-            print("Warning: No .evt file found at the path location!"
-                  "Unable to write annotation_series.")
+    if any(parsed is None for parsed in events.values()):
+        print("Warning: No .evt file found at the path location!"
+              "Unable to write annotation_series.")
+    for obj in events_to_nwb(events, kind=kind, layouts=layouts):
+        module.add_data_interface(obj)
 
 
 def write_spike_waveforms(nwbfile: NWBFile, session_path: str, shankn: int,
@@ -9,6 +9,8 @@ from h5py import File
 import numpy as np
 from datetime import datetime
 
+from to_nwb.imaging import imaging_data, dense_roi_masks, build_plane_segmentation
+
 
 base_dir = '/Users/bendichter/Desktop/Schnitzer/data/Example Data'
 
@@ -55,24 +57,24 @@ imaging_plane = nwbfile.create_imaging_plane(
 
 
 images_path = os.path.join(base_dir, 'm655_D11_S1.hdf5')
-with File(images_path, 'r') as file:
-    image_series = TwoPhotonSeries(name='test_iS', dimension=[2], data=file['Data']['Images'][:],
-                                   imaging_plane=imaging_plane, starting_frame=[0], starting_time=0.0, rate=5.0,
-                                   scan_line_rate=np.nan, pmt_gain=np.nan)
+# streamed from the source file when the NWB file is written
+images_file = File(images_path, 'r')
+image_series = TwoPhotonSeries(name='test_iS', dimension=[2], data=imaging_data(images_file['Data']['Images']),
+                               imaging_plane=imaging_plane, starting_frame=[0], starting_time=0.0, rate=5.0,
+                               scan_line_rate=np.nan, pmt_gain=np.nan)
 nwbfile.add_acquisition(image_series)
 
 
 mod = nwbfile.create_processing_module('rois', 'example data module')
 img_seg = ImageSegmentation()
-ps = img_seg.create_plane_segmentation('Ca2+ imaging example', imaging_plane, 'my_planeseg', image_series)
+# pixel masks of all cells at once, from the nonzero pixels of the cell images
+mask_data, mask_index = dense_roi_masks(mat_data['cellImages'])
+ps = build_plane_segmentation(mask_data, mask_index, imaging_plane, name='my_planeseg',
+                              description='Ca2+ imaging example', reference_images=image_series)
+img_seg.add_plane_segmentation(ps)
 mod.add_data_interface(img_seg)
 
 
-for i, img_mask in enumerate(zip(mat_data['cellImages'])):
-    pixel_mask = np.array(np.where(img_mask)).T
-    ps.add_roi(str(i), pixel_mask, img_mask)
-
-
 region = ps.create_roi_table_region('all', region=list(range(len(mat_data['cellImages']))))
 
 roi_response = RoiResponseSeries('RoiResponseSeries', mat_data['cellTraces'],
@@ -83,6 +85,7 @@ mod.add_data_interface(fl)
 fname_out = 'm655_D11_S1.nwb'
 with NWBHDF5IO(fname_out, 'w') as io:
     io.write(nwbfile)
+images_file.close()
 
 with NWBHDF5IO(fname_out, 'r') as io:
     io.read()
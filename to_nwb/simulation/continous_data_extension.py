@@ -5,6 +5,8 @@ import h5py
 from pynwb.spec import (NWBGroupSpec, NWBDatasetSpec, NWBNamespaceBuilder)
 from pynwb import get_class, load_namespaces, NWBHDF5IO, NWBFile
 
+from to_nwb.data_iterators import copy_h5_dataset
+
 
 project_name = 'simulation_output'
 ns_path = project_name + '.namespace.yaml'
@@ -74,14 +76,16 @@ def build_real_example():
     load_namespaces(ns_path)
     VarTable = get_class('VarTable', project_name)
     input_data = h5py.File('sim_data/cell_vars.h5', 'r')
+    # cell_vars.h5 can be larger than memory, so every dataset is copied
+    # HDF5-to-HDF5 with its own chunking and compression
     vmtable = VarTable(source='source',
                        name='vm_table',
-                       data=np.array(input_data['/v/data']),
-                       gid=np.array(input_data['mapping/gids']),
-                       index_pointer=np.array(input_data['mapping/index_pointer']),
+                       data=copy_h5_dataset(input_data['/v/data']),
+                       gid=copy_h5_dataset(input_data['mapping/gids']),
+                       index_pointer=copy_h5_dataset(input_data['mapping/index_pointer']),
                        cell_var='Membrane potential (mV)',
-                       element_id=np.array(input_data['mapping/element_id']),
-                       element_pos=np.array(input_data['mapping/element_pos']))
+                       element_id=copy_h5_dataset(input_data['mapping/element_id']),
+                       element_pos=copy_h5_dataset(input_data['mapping/element_pos']))
 
     nwbfile = NWBFile(source='source', session_description='session_description',
                       identifier='identifier', session_start_time=datetime.now(),
@@ -95,6 +99,7 @@ def build_real_example():
     io = NWBHDF5IO('mem_potential_toy.nwb', mode='w')
     io.write(nwbfile)
     io.close()
+    input_data.close()
 
 
 if __name__ == '__main__':
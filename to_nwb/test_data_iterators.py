@@ -0,0 +1,97 @@
+from datetime import datetime, timezone
+
+import h5py
+import numpy as np
+import pytest
+from hdmf.backends.hdf5 import H5DataIO
+from pynwb import NWBFile, NWBHDF5IO, TimeSeries
+
+from to_nwb.data_iterators import (ArrayBlockIterator, ColumnBlockIterator,
+                                   ConcatenatedBlockIterator, copy_h5_dataset)
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = str(tmp_path / 'source.h5')
+    with h5py.File(path, 'w') as f:
+        f.create_dataset('data', data=np.arange(1000 * 3, dtype='int16').reshape(1000, 3),
+                         chunks=(100, 3), compression='gzip', compression_opts=4, shuffle=True)
+        f['scalar'] = 5
+    f = h5py.File(path, 'r')
+    yield f
+    f.close()
+
+
+def write_series(tmp_path, data):
+    nwbfile = NWBFile('copy', 'id', datetime(2020, 1, 1, tzinfo=timezone.utc))
+    nwbfile.add_acquisition(TimeSeries(name='series', data=data, unit='n/a', rate=1.))
+    path = str(tmp_path / 'out.nwb')
+    with NWBHDF5IO(path, 'w') as io:
+        io.write(nwbfile)
+    return path
+
+
+def read_series(path):
+    with h5py.File(path, 'r') as f:
+        dset = f['acquisition/series/data']
+        return dset[:], dset.dtype, dset.chunks, dset.compression, dset.compression_opts
+
+
+def collect(iterator, shape):
+    out = np.zeros(shape, dtype=iterator.dtype)
+    for chunk in iterator:
+        out[chunk.selection] = chunk.data
+    return out
+
+
+def test_concatenated_blocks():
+    sources = [np.arange(5.), np.arange(3.) + 5, np.arange(0.), np.arange(4.) + 8]
+    iterator = ConcatenatedBlockIterator(sources, block_size=2, transform=lambda x: x * 2,
+                                         dtype='float32')
+    assert len(iterator) == 12 and iterator.maxshape == (12,)
+    np.testing.assert_array_equal(collect(iterator, 12), np.arange(12.) * 2)
+
+
+def test_array_blocks_follow_source_chunks(source):
+    iterator = ArrayBlockIterator(source['data'])
+    assert iterator.block_size % 100 == 0
+    assert iterator.recommended_chunk_shape() == (100, 3)
+    iterator = ArrayBlockIterator(source['data'], block_size=64, transform=lambda x: x + 1)
+    np.testing.assert_array_equal(collect(iterator, (1000, 3)), source['data'][:] + 1)
+
+
+def test_column_blocks():
+    blocks = [np.ones((4, 2)), np.zeros((4, 1)) + 2, np.zeros((4, 3)) + 3]
+    iterator = ColumnBlockIterator(4, [2, 1, 3], blocks.__getitem__)
+    assert iterator.recommended_data_shape() == (4, 6)
+    np.testing.assert_array_equal(collect(iterator, (4, 6)), np.hstack(blocks))
+
+    with pytest.raises(ValueError):
+        list(ColumnBlockIterator(4, [2], lambda i: np.ones((3, 2))))
+
+
+def test_copy_keeps_storage(source, tmp_path):
+    copied = copy_h5_dataset(source['data'])
+    data, dtype, chunks, compression, opts = read_series(write_series(tmp_path, copied))
+    np.testing.assert_array_equal(data, source['data'][:])
+    assert (dtype, chunks, compression, opts) == (np.dtype('int16'), (100, 3), 'gzip', 4)
+
+
+def test_copy_with_transform(source, tmp_path):
+    copied = copy_h5_dataset(source['data'], transform=lambda x: x / 10., dtype='float32',
+                             block_size=64)
+    assert isinstance(copied, H5DataIO)
+    data, dtype, chunks, compression, opts = read_series(write_series(tmp_path, copied))
+    np.testing.assert_allclose(data, source['data'][:] / 10., rtol=1e-6)
+    assert (dtype, chunks, compression, opts) == (np.dtype('float32'), (100, 3), 'gzip', 4)
+
+
+def test_copy_overrides_settings(source, tmp_path):
+    copied = copy_h5_dataset(source['data'], compression='gzip', compression_opts=9, chunks=(500, 3))
+    data, _, chunks, compression, opts = read_series(write_series(tmp_path, copied))
+    np.testing.assert_array_equal(data, source['data'][:])
+    assert (chunks, compression, opts) == ((500, 3), 'gzip', 9)
+
+
+def test_copy_scalar(source):
+    assert copy_h5_dataset(source['scalar'], transform=lambda x: x * 2) == 10
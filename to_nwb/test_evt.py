@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+from pynwb.epoch import TimeIntervals
+from pynwb.misc import AnnotationSeries
+
+from to_nwb.evt import (clear_evt_cache, detect_layout, events_to_nwb, format_evt, read_evt,
+                        read_evt_layout, read_session_events, write_evt, write_evt_layout)
+
+
+@pytest.fixture
+def session(tmp_path):
+    path = tmp_path / 'session'
+    path.mkdir()
+    clear_evt_cache()
+    yield path
+    clear_evt_cache()
+
+
+def test_write_read_round_trip(tmp_path):
+    evt_file = str(tmp_path / 'a.evt')
+    times = np.array([12.5, 100., 2001.3])
+    write_evt(evt_file, times, np.array(['lick', 'reward', 'lick']))
+
+    read_times, descriptions = read_evt(evt_file)
+    np.testing.assert_allclose(read_times, times)
+    assert list(descriptions) == ['lick', 'reward', 'lick']
+
+    write_evt(evt_file, [3000.], 'tone on', mode='a')
+    assert list(read_evt(evt_file)[1]) == ['lick', 'reward', 'lick', 'tone on']
+
+
+def test_format_matches_neuroscope():
+    assert format_evt([1., 2.25], 'start') == ' 1.0\tstart\n 2.2\tstart\n'
+    assert format_evt([], 'start') == ''
+
+
+def test_empty_file(tmp_path):
+    evt_file = tmp_path / 'empty.evt'
+    evt_file.write_text('')
+    times, descriptions = read_evt(str(evt_file))
+    assert len(times) == 0 and len(descriptions) == 0
+
+
+def test_layout_round_trip(tmp_path):
+    evt_file = str(tmp_path / 'rip.evt')
+    events = {'start': np.array([10., 50.]), 'peak': np.array([15., 55.]), 'end': np.array([20., 60.])}
+    write_evt_layout(evt_file, events, 'ripple')
+
+    read = read_evt_layout(evt_file, 'ripple')
+    for name in ('start', 'peak', 'end'):
+        np.testing.assert_allclose(read[name], events[name])
+
+    with pytest.raises(ValueError):
+        read_evt_layout(evt_file, 'noise')
+
+
+def test_detect_layout():
+    assert detect_layout(['start', 'end'] * 3) == ('start', 'end')
+    assert detect_layout(['start', 'peak', 'end'] * 2) == ('start', 'peak', 'end')
+    assert detect_layout(['start', 'end', 'end', 'start']) is None
+    assert detect_layout(['on', 'off'] * 2) is None
+    assert detect_layout(['on', 'off'] * 2, layouts=[('on', 'off')]) == ('on', 'off')
+
+
+def test_detect_layout_needs_two_groups():
+    assert detect_layout(['start', 'end']) is None
+    assert detect_layout(['start', 'end'], min_groups=1) == ('start', 'end')
+
+
+def test_distinct_events_are_not_intervals():
+    descriptions = np.array(['lick', 'reward', 'tone on', 'airpuff'], dtype=object)
+    assert detect_layout(descriptions) is None
+
+    out = events_to_nwb({'behavior': (np.array([1., 2., 3., 4.]), descriptions)}, kind='intervals')
+    assert len(out) == 1
+    assert isinstance(out[0], AnnotationSeries)
+    np.testing.assert_allclose(out[0].timestamps, [.001, .002, .003, .004])
+
+
+def test_session_events_to_nwb(session):
+    write_evt_layout(str(session / 'session.rip.evt'), np.array([[10., 15., 20.], [50., 55., 60.]]),
+                     'ripple')
+    write_evt(str(session / 'session.beh.evt'), np.array([5., 6.]), np.array(['lick', 'reward']))
+    write_evt_layout(str(session / 'session.opt.evt'), np.array([[1., 2.], [3., 4.]]), ('on', 'off'))
+
+    events = read_session_events(str(session), n_jobs=2)
+    assert sorted(events) == ['beh', 'opt', 'rip']
+
+    out = {obj.name: obj for obj in events_to_nwb(events, kind='both', layouts={'opt': ('on', 'off')})}
+    assert sorted(out) == ['beh', 'opt', 'opt_intervals', 'rip', 'rip_intervals']
+
+    ripples = out['rip_intervals']
+    assert isinstance(ripples, TimeIntervals)
+    np.testing.assert_allclose(ripples['start_time'].data, [.01, .05])
+    np.testing.assert_allclose(ripples['peak_time'].data, [.015, .055])
+    np.testing.assert_allclose(ripples['stop_time'].data, [.02, .06])
+    np.testing.assert_allclose(out['opt_intervals']['stop_time'].data, [.002, .004])
+
+
+def test_session_events_cached(session):
+    evt_file = session / 'session.beh.evt'
+    write_evt(str(evt_file), np.array([5.]), 'lick')
+    first = read_session_events(str(session))['beh']
+    assert read_session_events(str(session))['beh'] is first
+
+    write_evt(str(evt_file), np.array([5., 7.]), 'lick')
+    assert len(read_session_events(str(session))['beh'][0]) == 2
@@ -0,0 +1,72 @@
+import hashlib
+import json
+import os
+
+import pytest
+
+from to_nwb import hashing
+from to_nwb.hashing import clear_hash_cache, file_hash
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    path = tmp_path / 'data.bin'
+    path.write_bytes(os.urandom(3 * 2 ** 20 + 17))
+    clear_hash_cache()
+    yield str(path)
+    clear_hash_cache()
+
+
+def test_default_is_sha1_of_content(data_file):
+    with open(data_file, 'rb') as f:
+        expected = hashlib.sha1(f.read()).hexdigest()
+    assert file_hash(data_file, cache=False) == expected
+
+
+@pytest.mark.parametrize('use_mmap', [False, True])
+def test_blocks_match_whole_file(data_file, use_mmap):
+    with open(data_file, 'rb') as f:
+        expected = hashlib.blake2b(f.read()).hexdigest()
+    assert file_hash(data_file, algorithm='blake2b', use_mmap=use_mmap, block_size=2 ** 16,
+                     cache=False) == expected
+
+
+def test_quick_depends_on_size_and_ends(data_file):
+    quick = file_hash(data_file, quick=True, cache=False)
+    assert quick != file_hash(data_file, cache=False)
+
+    with open(data_file, 'r+b') as f:
+        f.seek(2 ** 20 + 5)
+        f.write(b'middle')
+    assert file_hash(data_file, quick=True, cache=False) == quick
+
+    with open(data_file, 'ab') as f:
+        f.write(b'end')
+    assert file_hash(data_file, quick=True, cache=False) != quick
+
+
+def test_sidecar_written_for_full_hashes_only(data_file):
+    sidecar = data_file + '.hashes.json'
+    file_hash(data_file, quick=True)
+    assert not os.path.exists(sidecar)
+
+    digest = file_hash(data_file)
+    with open(sidecar) as f:
+        assert json.load(f)['hashes'] == {'sha1': digest}
+    assert [name for name in os.listdir(os.path.dirname(data_file))
+            if name.endswith('.tmp')] == []
+
+
+def test_sidecar_reused_until_file_changes(data_file, monkeypatch):
+    digest = file_hash(data_file)
+    clear_hash_cache()
+
+    def fail(*args):
+        raise AssertionError('file was hashed again')
+    monkeypatch.setattr(hashing, '_hash_stream', fail)
+    assert file_hash(data_file) == digest
+
+    monkeypatch.undo()
+    with open(data_file, 'ab') as f:
+        f.write(b'more')
+    assert file_hash(data_file) != digest
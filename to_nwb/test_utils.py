@@ -0,0 +1,56 @@
+from datetime import datetime, timezone
+
+import numpy as np
+from pynwb import NWBFile, NWBHDF5IO
+
+from to_nwb.data_iterators import ConcatenatedBlockIterator
+from to_nwb.utils import RaggedArrayBuilder, build_units_table, natural_key, ragged_index
+
+ROWS = [[1., 2.], [], [3.], [4., 5., 6.]]
+
+
+def test_ragged_index():
+    index = ragged_index([len(row) for row in ROWS])
+    assert index.dtype == np.uint64
+    np.testing.assert_array_equal(index, [2, 2, 3, 6])
+    assert len(ragged_index([])) == 0
+
+
+def test_ragged_array_builder():
+    builder = RaggedArrayBuilder()
+    for row in ROWS:
+        builder.append(row)
+    assert len(builder) == 4
+
+    data, index = builder.to_arrays(dtype=float)
+    np.testing.assert_array_equal(data, np.concatenate(ROWS))
+    np.testing.assert_array_equal(index, ragged_index([len(row) for row in ROWS]))
+    assert [list(row) for row in np.split(data, index[:-1].astype(int))] == ROWS
+
+
+def test_build_units_table_round_trip(tmp_path):
+    index = ragged_index([len(row) for row in ROWS])
+    spike_times = ConcatenatedBlockIterator([np.array([1., 2., 3.]), np.array([4., 5., 6.])],
+                                            block_size=2, transform=lambda x: x / 10.)
+    nwbfile = NWBFile('units', 'id', datetime(2020, 1, 1, tzinfo=timezone.utc))
+    nwbfile.units = build_units_table(
+        spike_times, index, ids=[10, 11, 12, 13],
+        columns=[{'name': 'depth', 'description': 'depth', 'data': [1., 2., 3., 4.]},
+                 {'name': 'amplitudes', 'description': 'amplitude of each spike',
+                  'data': np.arange(6.), 'index': index}])
+    path = str(tmp_path / 'units.nwb')
+    with NWBHDF5IO(path, 'w') as io:
+        io.write(nwbfile)
+
+    with NWBHDF5IO(path, 'r') as io:
+        units = io.read().units
+        np.testing.assert_array_equal(units.id[:], [10, 11, 12, 13])
+        np.testing.assert_array_equal(units['depth'][:], [1., 2., 3., 4.])
+        for i, row in enumerate(ROWS):
+            np.testing.assert_allclose(units['spike_times'][i], np.asarray(row) / 10.)
+        np.testing.assert_array_equal(units['amplitudes'][3], [3., 4., 5.])
+
+
+def test_natural_key():
+    assert sorted(['Trajectory 100', 'Trajectory 20', 'Trajectory 3'], key=natural_key) == \
+        ['Trajectory 3', 'Trajectory 20', 'Trajectory 100']
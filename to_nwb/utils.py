@@ -1,6 +1,8 @@
 import re
 
 import numpy as np
+from hdmf.common import VectorData, VectorIndex, ElementIdentifiers, DynamicTableRegion
+from pynwb.misc import Units
 
 
 def find_discontinuities(tt, factor=10000):
@@ -109,3 +111,104 @@ def check_module(nwbfile, name, description=None):
         if description is None:
             description = name
         return nwbfile.create_processing_module(name, description)
+
+
+def ragged_index(counts):
+    """Convert per-row element counts to the end offsets of a VectorIndex.
+
+    Parameters
+    ----------
+    counts: array-like(dtype=int)
+
+    Returns
+    -------
+    np.ndarray(dtype=uint64)
+
+    """
+    return np.cumsum(counts, dtype=np.uint64)
+
+
+class RaggedArrayBuilder(object):
+    """Build the flat data and end-offset index of a ragged array row by row.
+
+    Equivalent to `create_ragged_array` on the list of all rows. The values
+    of each row are appended to one flat Python list and its end offset to
+    another, so no per-row objects are kept, but both lists grow with the
+    data until `to_arrays` converts them.
+    """
+
+    def __init__(self):
+        self.data = []
+        self.index = []
+
+    def __len__(self):
+        return len(self.index)
+
+    def append(self, row):
+        self.data.extend(row)
+        self.index.append(len(self.data))
+
+    def to_arrays(self, dtype=None):
+        """
+        Returns
+        -------
+        data: np.ndarray
+        index: np.ndarray(dtype=uint64)
+
+        """
+        return np.asarray(self.data, dtype=dtype), np.asarray(self.index, dtype=np.uint64)
+
+
+def build_units_table(spike_times, spike_times_index, ids=None, columns=None,
+                      description='units', name='units'):
+    """Build a Units table column by column instead of one add_unit call per unit.
+
+    Parameters
+    ----------
+    spike_times: array-like | DataChunkIterator | H5DataIO
+        spike times of all units concatenated, in seconds
+    spike_times_index: array-like
+        end offset of each unit in spike_times, see `ragged_index`
+    ids: array-like, optional
+        Default is 0..n_units-1
+    columns: list(dict), optional
+        {name, description, data} for any custom columns. Ragged columns
+        also give 'index', the end offsets of each unit in data. Columns
+        that give 'table' hold row indices into that table, e.g. the
+        'electrodes' column with nwbfile.electrodes.
+    description: str, optional
+    name: str, optional
+        Default is 'units'. Use another name for tables that go in a
+        processing module.
+
+    Returns
+    -------
+    pynwb.misc.Units
+
+    """
+    n_units = len(spike_times_index)
+    if ids is None:
+        ids = np.arange(n_units)
+
+    # each VectorIndex goes before its target, so that hdmf can pair them up
+    # even when the target data is a chunk iterator of unknown length
+    spike_times_col = VectorData(name='spike_times', description='the spike times for each unit',
+                                 data=spike_times)
+    table_columns = [VectorIndex(name='spike_times_index', data=spike_times_index,
+                                 target=spike_times_col),
+                     spike_times_col]
+    for column in columns or ():
+        if column.get('table') is not None:
+            col = DynamicTableRegion(name=column['name'], description=column['description'],
+                                     data=column['data'], table=column['table'])
+        else:
+            col = VectorData(name=column['name'], description=column['description'],
+                             data=column['data'])
+        if column.get('index') is not None:
+            table_columns.append(VectorIndex(name=column['name'] + '_index',
+                                             data=column['index'], target=col))
+        table_columns.append(col)
+
+    return Units(name=name, description=description,
+                 id=ElementIdentifiers(name='id', data=ids),
+                 columns=table_columns)